@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+from agents.config.concurrency import (
+    ADAPTIVE_CONCURRENCY, ADAPTIVE_LIMITS, ADAPTIVE_MIN_CONCURRENCY,
+    LATENCY_SLO, LATENCY_TOLERANCE, BACKOFF_FACTOR, MAX_ERROR_RATE
+)
+
+
+def backend_of(model_type, backend):
+    """Name of the backend a completion request is actually sent to."""
+    if model_type.startswith('vllm/') or backend == 'vLLM':
+        return 'vLLM'
+    return backend
+
+
+def status_code_of(error):
+    """HTTP status code carried by an API error or any exception in its cause chain."""
+    while error is not None:
+        status = getattr(error, 'status_code', None)
+        if status is None:
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if isinstance(status, int):
+            return status
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_overload(error):
+    status = status_code_of(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on in-flight requests to one (backend, model).
+
+    The limit grows by one per limit's worth of healthy completions while p95 latency
+    and the error rate stay healthy. It is multiplied by `backoff_factor` on HTTP
+    429/5xx, at most once per cooldown so one burst of rejections counts once.
+    Threads and event loops can share a limiter. A released slot is handed straight
+    to the oldest waiter.
+    """
+
+    def __init__(self, name, initial=8, min_limit=1, max_limit=64, latency_slo=None,
+                 latency_tolerance=2.0, backoff_factor=0.5, max_error_rate=0.05, sample_size=50):
+        self.name = name
+        self.limit = float(max(min(initial, max_limit), min_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_slo = latency_slo
+        self.latency_tolerance = latency_tolerance
+        self.backoff_factor = backoff_factor
+        self.max_error_rate = max_error_rate
+        self.in_flight = 0
+        self._best_p95 = None
+        self._latencies = deque(maxlen=sample_size)
+        self._errors = deque(maxlen=sample_size)
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    # Slots
+    def acquire(self):
+        with self._lock:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            granted = threading.Event()
+            self._waiters.append(granted.set)
+        granted.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            granted = loop.create_future()
+
+            def grant():
+                if granted.cancelled():
+                    self._release_slot()  # the waiter gave up, pass the slot on
+                else:
+                    granted.set_result(None)
+
+            self._waiters.append(lambda: loop.call_soon_threadsafe(grant))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            # Cancelled after the slot was granted but before the task resumed: hand it back.
+            # A still-pending future is cancelled along with the task and `grant` passes it on.
+            if granted.done() and not granted.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+            grants = self._grant_waiters()
+        for grant in grants:
+            grant()
+
+    def _grant_waiters(self):
+        grants = []
+        while self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            grants.append(self._waiters.popleft())
+        return grants
+
+    # Feedback
+    def record(self, latency=None, overload=False, error=False):
+        """Update the limit with the outcome of one request."""
+        now = time.monotonic()
+        with self._lock:
+            self._errors.append(overload or error)
+            if overload:
+                self._decrease(now, self.backoff_factor)
+            elif not error:
+                self._latencies.append(latency)
+                if len(self._latencies) >= 10:
+                    p95 = _percentile(self._latencies, 0.95)
+                    if self.latency_slo is None:
+                        self._best_p95 = p95 if self._best_p95 is None else min(self._best_p95, p95)
+                    slo = self.latency_slo or self._best_p95 * self.latency_tolerance
+                    if p95 > slo:
+                        self._decrease(now, 0.9)
+                        return
+                if sum(self._errors) / len(self._errors) <= self.max_error_rate:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            grants = self._grant_waiters()
+        for grant in grants:
+            grant()
+
+    def _decrease(self, now, factor):
+        cooldown = _percentile(self._latencies, 0.5) if self._latencies else 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+        logging.info(f"Concurrency limit for {self.name} reduced to {int(self.limit)}")
+
+    def _finish(self, started, error):
+        self.record(time.monotonic() - started, overload=error is not None and is_overload(error),
+                    error=error is not None)
+        self._release_slot()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._finish(started, e)
+            raise
+        except BaseException:
+            self._release_slot()  # cancelled: no latency sample
+            raise
+        self._finish(started, None)
+
+    def saturated(self):
+        """True while a new request would have to queue for a slot."""
+        with self._lock:
+            return bool(self._waiters) or self.in_flight >= int(self.limit)
+
+    def stats(self):
+        return {'limit': int(self.limit), 'in_flight': self.in_flight, 'waiting': len(self._waiters)}
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(backend, model_type):
+    """Process-wide limiter for (backend, model), created from agents.config.concurrency."""
+    key = (backend, model_type)
+    with _limiters_lock:
+        if key not in _limiters:
+            limits = ADAPTIVE_LIMITS.get(backend, ADAPTIVE_LIMITS['OpenRouter'])
+            _limiters[key] = AdaptiveLimiter(
+                f"{backend}/{model_type}", initial=limits['initial'], min_limit=ADAPTIVE_MIN_CONCURRENCY,
+                max_limit=limits['max'], latency_slo=LATENCY_SLO, latency_tolerance=LATENCY_TOLERANCE,
+                backoff_factor=BACKOFF_FACTOR, max_error_rate=MAX_ERROR_RATE
+            )
+        return _limiters[key]
+
+
+@contextmanager
+def request_slot(backend, model_type):
+    """Hold an adaptive in-flight slot for one blocking completion request."""
+    if not ADAPTIVE_CONCURRENCY:
+        yield
+        return
+    with get_limiter(backend, model_type).slot():
+        yield
+
+
+@asynccontextmanager
+async def arequest_slot(backend, model_type):
+    """Async counterpart of `request_slot`."""
+    if not ADAPTIVE_CONCURRENCY:
+        yield
+        return
+    async with get_limiter(backend, model_type).aslot():
+        yield
+
+
+def slots_saturated(backend, model_type):
+    """True while a new request to (backend, model) would queue for an adaptive slot."""
+    return ADAPTIVE_CONCURRENCY and get_limiter(backend, model_type).saturated()
+
+
+def limiter_stats():
+    with _limiters_lock:
+        return {limiter.name: limiter.stats() for limiter in _limiters.values()}
@@ -1 +1,3 @@
-from .agent import AgentEnvironment
\ No newline at end of file
+from .agent import AgentEnvironment, load_instructions
+from .journal import CompletionJournal
+from .sinks import JsonlResultSink, discard_results
@@ -1,12 +1,25 @@
 import pandas as pd
 from tqdm import tqdm
+import asyncio
 import json
 import os
 import shutil
 import subprocess
 import sys
-from agents.utils import change_directory
+import threading
+import time
+import contextvars
+import functools
+from contextlib import contextmanager, nullcontext, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+from agents.utils import append_jsonl, resolve_result_file_path, shard_index
+from agents.llm_batch import BatchPending
+from agents.llm_usage import usage_tags
+from agents.rate_limit import configure_rate_limits
+from .cost import InstructionCostModel
+from .journal import CompletionJournal
+from .scheduler import DagScheduler, StepGraph
 from abc import ABC, abstractmethod
 import ast
 import copy  # 在文件顶部添加这个导入
@@ -42,13 +55,99 @@ class MaxDebugRetriesExceeded(Exception):
     pass
 
 
+class InstructionContext:
+    """单条指令的执行上下文（指令、工作目录以及各步骤输出）"""
+
+    def __init__(self, instruction, workspace):
+        self.instruction = instruction
+        self.workspace = workspace
+        self.data_store = {}
+
+
+def load_instructions(input_file, data_ids=None, data_range=None, shard=None):
+    """读取指令文件，并按 data_ids / data_range / shard 过滤"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        instructions = [json.loads(line) for line in f]
+
+    if data_ids:
+        instructions = [inst for inst in instructions if inst['id'] in data_ids]
+    elif data_range:
+        start, end = data_range
+        instructions = [inst for inst in instructions if start <= inst['id'] <= end]
+
+    if shard:
+        index, count = shard
+        instructions = [inst for inst in instructions if shard_index(inst['id'], count) == index]
+
+    return instructions
+
+
+# 当前线程/协程正在处理的指令上下文，使并发执行的指令互不干扰
+_current_context = contextvars.ContextVar('instruction_context', default=None)
+
+
+def _iter_in_order(executor, fn, jobs, window):
+    """按 jobs 的顺序产出 fn(job) 的结果；在途与已完成待交出的任务合计不超过 window 个"""
+    futures = {}
+    finished = {}
+    next_submit = next_yield = 0
+
+    while next_yield < len(jobs):
+        while next_submit < len(jobs) and len(futures) + len(finished) < window:
+            futures[executor.submit(fn, jobs[next_submit])] = next_submit
+            next_submit += 1
+
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            finished[futures.pop(future)] = future.result()
+
+        while next_yield in finished:
+            yield finished.pop(next_yield)
+            next_yield += 1
+
+
+# 工作进程内的环境，由 _init_process_worker 创建
+_worker_env = None
+_worker_workflow_aux = None
+
+
+def _init_process_worker(workspace, config, agent_specs, workflow_aux, journal_model_type, workers):
+    global _worker_env, _worker_workflow_aux
+    configure_rate_limits(workers)  # 各工作进程平分 RPM/TPM 预算
+    _worker_env = AgentEnvironment(workspace, config)
+    for agent_name, agent_class, kwargs in agent_specs:
+        _worker_env.add_agent(agent_name, agent_class, **kwargs)
+    _worker_env._journal_model_type = journal_model_type
+    _worker_workflow_aux = workflow_aux
+
+
+def _run_process_batch(batch):
+    """在工作进程中处理一批指令，返回与 batch 一一对应的结果"""
+    finished = _worker_env._iter_instructions(batch, _worker_workflow_aux, _worker_env.concurrency)
+    return [results for _, results in finished]
+
+
 class AgentEnvironment:
     def __init__(self, workspace, config):
         self.workspace = workspace
         self.config = config
         self.agents = {}
-        self.data_store = {}
+        self._shared_data_store = {}
         self.instructions = None
+        self.concurrency = config.get('concurrency', 1)
+        self.step_scheduler = config.get('step_scheduler', 'sequential')  # 'sequential' 或 'dag'
+        self.shard = config.get('shard')  # (index, count)，按 id 的稳定哈希划分指令
+        # 两阶段流水线：生成（LLM）与代码执行各自限流，execution_workers 为执行阶段的并发数
+        self.execution_workers = config.get('execution_workers')
+        # 多进程模式：每个工作进程持有自己的智能体实例，按批接收指令
+        self.process_workers = config.get('process_workers')
+        self.process_batch_size = config.get('process_batch_size', 4)
+        self._agent_specs = []
+        # 'file' 按指令文件顺序分派；'cost' 按估计代价从大到小分派以缩短长尾
+        self.dispatch_order = config.get('dispatch_order', 'file')
+        self._generation_slots = None
+        self._async_generation_slots = None
+        self._execution_pool = None
         self.data_folder = config.get('data_folder', './InfiAgent_data/da-dev-tables')
         self.log_file = os.path.join(workspace, 'agent_workflow.log')
         self.output_handlers = {
@@ -56,52 +155,70 @@ class AgentEnvironment:
             'analysis': AnalysisOutputHandler(),
         }
         self.cleared_log_files = set()  # 新增：用于跟踪已清除的日志文件
+        self._file_lock = threading.Lock()
+        journal_file = config.get('journal_file')
+        self.journal = CompletionJournal(journal_file) if journal_file else None
+        self._journal_model_type = ''
+
+    # Per-instruction State
+    @property
+    def current_context(self):
+        return _current_context.get()
+
+    @property
+    def current_instruction(self):
+        context = self.current_context
+        return context.instruction if context else None
+
+    @property
+    def current_workspace(self):
+        context = self.current_context
+        return context.workspace if context else None
+
+    @property
+    def data_store(self):
+        context = self.current_context
+        return context.data_store if context else self._shared_data_store
 
     # Agent Management
     def add_agent(self, agent_name, agent_class, **kwargs):
-        self.agents[agent_name] = agent_class(self.workspace, **kwargs)
+        self.agents[agent_name] = agent_class(self.workspace, journal=self.journal, **kwargs)
+        self._agent_specs.append((agent_name, agent_class, kwargs))  # 工作进程据此重建智能体
 
     # Data Processing Methods
     def process_instruction_file(self, input_file, data_ids=None, data_range=None):
-        with open(input_file, 'r', encoding='utf-8') as f:
-            instructions = [json.loads(line) for line in f]
+        self.instructions = load_instructions(input_file, data_ids, data_range, self.shard)
 
-        if data_ids:
-            instructions = [inst for inst in instructions if inst['id'] in data_ids]
-        elif data_range:
-            start, end = data_range
-            instructions = [inst for inst in instructions if start <= inst['id'] <= end]
+    def copy_data_files(self):
+        return [self._prepare_workspace(instruction) for instruction in self.instructions]
 
-        self.instructions = instructions
+    def _prepare_workspace(self, instruction):
+        """创建指令的独立工作目录并复制所需数据文件"""
+        individual_directory = os.path.join(self.workspace, f'example {instruction["id"]}')
+        os.makedirs(individual_directory, exist_ok=True)
 
-    def copy_data_files(self):
-        workspace_list = []
-        for instruction in self.instructions:
-            d_id = instruction['id']
-            individual_directory = os.path.join(self.workspace, f'example {d_id}')
-            os.makedirs(individual_directory, exist_ok=True)
-            workspace_list.append(individual_directory)
-
-            if file_name := instruction.get('file_name'):
-                src = os.path.join(self.data_folder, file_name)
-                dst = os.path.join(individual_directory, file_name)
-                if os.path.exists(src):
-                    shutil.copy(src, dst)
-                else:
-                    print(f"Warning: File {file_name} not found in data folder.")
+        if file_name := instruction.get('file_name'):
+            src = os.path.join(self.data_folder, file_name)
+            dst = os.path.join(individual_directory, file_name)
+            if os.path.exists(src):
+                shutil.copy(src, dst)
+            else:
+                print(f"Warning: File {file_name} not found in data folder.")
 
-        return workspace_list
+        return individual_directory
 
     # Execution and Logging Methods
     def execute_code(self, file_name, individual_workspace):
-        with change_directory(individual_workspace):
-            if not os.path.exists(file_name):
-                return f"Error: File {file_name} not found in workspace."
-            try:
-                result = subprocess.run([sys.executable, file_name], capture_output=True, text=True)
-                return result.stdout + result.stderr
-            except Exception as e:
-                return f"Error executing {file_name}: {str(e)}"
+        # Run with cwd instead of chdir: the working directory is process-wide
+        # and instructions may execute concurrently.
+        if not os.path.exists(os.path.join(individual_workspace, file_name)):
+            return f"Error: File {file_name} not found in workspace."
+        try:
+            result = subprocess.run([sys.executable, file_name], capture_output=True, text=True,
+                                    cwd=individual_workspace)
+            return result.stdout + result.stderr
+        except Exception as e:
+            return f"Error executing {file_name}: {str(e)}"
 
     def log_action(self, action, agent_name, model_type, code, log, individual_workspace):
         model_type = model_type.replace("Qwen/", "").replace("deepseek/", "").replace("google/", "").replace(":", "_")
@@ -125,10 +242,11 @@ LOG OUTPUT:
         individual_log_file = os.path.join(model_dependent_directory, f'{agent_name}_{model_type.replace("/", "_").replace(":", "_")}_log.txt')
 
         # 如果是该文件的第一次写入，先清除内容
-        if individual_log_file not in self.cleared_log_files:
-            with open(individual_log_file, 'w') as f:
-                pass  # 清空文件
-            self.cleared_log_files.add(individual_log_file)
+        with self._file_lock:
+            if individual_log_file not in self.cleared_log_files:
+                with open(individual_log_file, 'w') as f:
+                    pass  # 清空文件
+                self.cleared_log_files.add(individual_log_file)
 
         # 追加写入新的日志
         with open(individual_log_file, 'a', encoding='utf-8') as f:
@@ -152,16 +270,78 @@ LOG OUTPUT:
         workspace_list = self._handle_input(step)
         self._handle_data_flow(config_args, agent_args)
         
-        step_results = self._execute_agent_method(
-            agent_name, method_name, agent_args,
-            workspace_list, output_type, step.get('input', {})
-        )
+        with self._step_usage_tags(step):
+            step_results = self._execute_agent_method(
+                agent_name, method_name, agent_args,
+                workspace_list, output_type, step.get('input', {})
+            )
         
         if 'output' in step:
             self.data_store[step['output']] = step_results
             
         return step_results, agent_name, method_name
 
+    def _step_usage_tags(self, step):
+        """为步骤内的 LLM 调用打上用量账本标签（智能体、方法、步骤、指令 id）"""
+        instruction = self.current_instruction or {}
+        return usage_tags(agent=step['agent'], method=step['method'], step=step.get('output', step['method']),
+                          instruction_id=instruction.get('id'))
+
+    async def _arun_step_after(self, dependencies, step, step_aux, step_results, index):
+        for dependency in dependencies:
+            await dependency
+        if step.get('type') == 'loop':
+            # Loop steps drive their agents synchronously; keep them off the event loop
+            step_results[index] = await asyncio.to_thread(self._handle_loop_step, step, step_aux)
+        else:
+            config_args = step_aux.get('args')
+            results, agent_name, method_name = await self._aexecute_step(step, config_args)
+            step_results[index] = {f"{agent_name}_{method_name}": results}
+
+    async def _aexecute_step(self, step, config_args):
+        """_execute_step 的异步版本，通过 agent.arun 调用 agent 方法"""
+        agent_args = step.get('args', {})
+
+        agent_name = step['agent']
+        method_name = step['method']
+        output_type = step.get('output_type', 'code')
+        individual_workspace = self.current_workspace
+
+        self._handle_data_flow(config_args, agent_args)
+        self._prepare_instruction_args(agent_args, step.get('input', {}), self.current_instruction, individual_workspace)
+
+        try:
+            async with self._async_generation_stage():
+                with self._step_usage_tags(step):
+                    method_output = await self.agents[agent_name].arun(
+                        method_name, **agent_args, individual_workspace=individual_workspace
+                    )
+        except BatchPending:
+            raise
+        except Exception as e:
+            print(f"错误：{e}")
+            step_results = None
+        else:
+            if output_type == 'code':
+                # Generated code is executed (and possibly debugged) in a subprocess,
+                # on the execution stage's pool when the pipeline is enabled
+                step_results = await asyncio.get_running_loop().run_in_executor(
+                    self._execution_pool, functools.partial(
+                        contextvars.copy_context().run, self._handle_method_output,
+                        method_output, output_type, agent_name, individual_workspace, agent_args
+                    )
+                )
+            else:
+                step_results = self._handle_method_output(
+                    method_output, output_type, agent_name,
+                    individual_workspace, agent_args
+                )
+
+        if 'output' in step:
+            self.data_store[step['output']] = step_results
+
+        return step_results, agent_name, method_name
+
     def _handle_input(self, step):
         """处理步骤的输入数据"""
         if 'input' in step:
@@ -197,10 +377,23 @@ LOG OUTPUT:
         self._prepare_instruction_args(args, input_, instruction, individual_workspace)
         
         try:
-            method_output = method(**args, individual_workspace=individual_workspace)
+            with self._generation_stage():
+                method_output = method(**args, individual_workspace=individual_workspace)
+        except BatchPending:
+            raise  # 批处理模式下等待批量结果，整条指令留到下一轮
         except Exception as e:
             print(f"错误：{e}")
             return None
+        if method_output is None:
+            # 方法报告处理失败（如重试用尽），不产生结果，指令也不会写入断点日志
+            return None
+
+        if output_type == 'code' and self._execution_pool is not None:
+            # Hand the generated code to the execution stage; the generation slot is already free
+            return self._execution_pool.submit(
+                contextvars.copy_context().run, self._handle_method_output,
+                method_output, output_type, agent_name, individual_workspace, args
+            ).result()
 
         return self._handle_method_output(
             method_output, output_type, agent_name, 
@@ -238,7 +431,7 @@ LOG OUTPUT:
 
     def _process_output_result(self, output_type, agent_name, model_type, result, log, file_name, individual_workspace, args):
         """处理输出结果"""
-        full_log = self._handle_execution_and_logging(
+        full_log, execution_output = self._handle_execution_and_logging(
             output_type, agent_name, model_type,
             result, log, file_name, individual_workspace
         )
@@ -246,7 +439,7 @@ LOG OUTPUT:
         if output_type == 'code':
             result = self._handle_code_execution(
                 agent_name, model_type, result, file_name,
-                individual_workspace, args, full_log
+                individual_workspace, args, full_log, execution_output
             )
             
         return {'log': full_log, 'result': result}
@@ -254,6 +447,7 @@ LOG OUTPUT:
     def _handle_execution_and_logging(self, output_type, agent_name, model_type, result, log, file_name, individual_workspace):
         """处理执行和日志记录"""
         full_log = self.log_action("Generate", agent_name, model_type, result, log, individual_workspace)
+        execution_output = None
         
         if output_type == 'code':
             execution_output = self.execute_code(file_name, individual_workspace)
@@ -262,11 +456,13 @@ LOG OUTPUT:
                 result, execution_output, individual_workspace
             )
             
-        return full_log
+        return full_log, execution_output
 
-    def _handle_code_execution(self, agent_name, model_type, result, file_name, individual_workspace, args, full_log):
+    def _handle_code_execution(self, agent_name, model_type, result, file_name, individual_workspace, args, full_log, execution_output=None):
         """处理代码执行"""
-        execution_output = self.execute_code(file_name, individual_workspace)
+        # Reuse the output of the run that was just logged instead of executing the code twice
+        if execution_output is None:
+            execution_output = self.execute_code(file_name, individual_workspace)
         if not self.is_execution_successful(execution_output):
             retry_time = 0
             while not self.is_execution_successful(execution_output) and retry_time < 1:
@@ -324,11 +520,16 @@ LOG OUTPUT:
         })
 
         try:
-            debug_log, debug_code = debug_method(**debug_args)
+            # Debugging runs on the execution stage, but its LLM calls count against the
+            # generation limit like any other generation
+            with self._generation_stage():
+                debug_log, debug_code = debug_method(**debug_args)
             if debug_code:
                 with open(os.path.join(individual_workspace, file_name), 'w') as f:
                     f.write(debug_code)
                 return debug_code
+        except BatchPending:
+            raise
         except Exception as e:
             print(f"Debug failed: {e}")
         
@@ -346,10 +547,8 @@ LOG OUTPUT:
                     return input_step
         return None
 
-    def run_workflow(self, workflow):
-        """执行工作流"""
-        all_results = []
-        
+    def _load_workflow_instructions(self, workflow):
+        """读取工作流的输入指令，返回工作流配置的原始副本"""
         # Find input step recursively
         input_step = self._find_input_step(workflow)
         if not input_step:
@@ -366,45 +565,333 @@ LOG OUTPUT:
             input_step.get('data_range')
         )
 
-        workflow_aux = copy.deepcopy(workflow)
-        
-        # Now process each instruction
-        for instruction in tqdm(self.instructions):
-            try:
-                results = {}
-                # Create individual workspace for this instruction
-                individual_workspace = os.path.join(self.workspace, f'example {instruction["id"]}')
-                os.makedirs(individual_workspace, exist_ok=True)
-                
-                # Copy data file if needed
-                if file_name := instruction.get('file_name'):
-                    src = os.path.join(self.data_folder, file_name)
-                    dst = os.path.join(individual_workspace, file_name)
-                    if os.path.exists(src):
-                        shutil.copy(src, dst)
-                    else:
-                        print(f"Warning: File {file_name} not found in data folder.")
-                
-                # Store current instruction and workspace
-                self.current_instruction = instruction
-                self.current_workspace = individual_workspace
-
-                # Execute each step for this instruction
-                for step, step_aux in zip(workflow, workflow_aux):
-                    if step.get('type') == 'loop':
-                        results.update(self._handle_loop_step(step, step_aux))
-                    else:
-                        config_args = step_aux.get('args')
-                        step_results, agent_name, method_name = self._execute_step(step, config_args)
-                        results[f"{agent_name}_{method_name}"] = step_results
-                
-                all_results.append(results)
-                
-            except MaxDebugRetriesExceeded as e:
-                print(f"Aborting instruction {instruction['id']}: {str(e)}")
-                continue  # Skip to next instruction
-            
-        return all_results
+        if self.journal is not None:
+            self._skip_journaled_instructions(input_step)
+
+        if self.dispatch_order == 'cost':
+            self.instructions = self._cost_model().longest_first(self.instructions)
+
+        return copy.deepcopy(workflow)
+
+    def _cost_model(self):
+        """以本次及 cost_history 中历史运行的日志耗时校准的指令代价估计"""
+        history = self.config.get('cost_history') or []
+        if isinstance(history, str):
+            history = [history]
+        journals = [CompletionJournal(path) for path in history if os.path.exists(path)]
+        if self.journal is not None:
+            journals.append(self.journal)
+        return InstructionCostModel(self.data_folder, journals)
+
+    def _skip_journaled_instructions(self, input_step):
+        """跳过日志中已完成的指令，并清理未完成指令残留的结果行"""
+        step_args = input_step.get('args', {})
+        self._journal_model_type = step_args.get('model_type', '')
+
+        pending = [inst for inst in self.instructions
+                   if not self.journal.is_done(self._journal_model_type, inst['id'])]
+        skipped = len(self.instructions) - len(pending)
+        if skipped:
+            print(f"Resuming from {self.journal.path}: skipping {skipped} completed instructions")
+        self.instructions = pending
+
+        # Lines written for instructions that never reached the journal belong to an
+        # interrupted run; drop them so the rerun does not produce duplicate ids.
+        if self.journal.existed and step_args.get('result_file'):
+            result_path = resolve_result_file_path(step_args['result_file'], step_args.get('eval_folder'))
+            self._drop_result_lines(result_path, {inst['id'] for inst in pending})
+
+    def _drop_result_lines(self, result_path, ids):
+        if not ids or not os.path.exists(result_path):
+            return
+
+        kept, dropped = [], 0
+        with open(result_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record_id = json.loads(line).get('id')
+                except json.JSONDecodeError:
+                    dropped += 1
+                    continue
+                if record_id in ids:
+                    dropped += 1
+                else:
+                    kept.append(line)
+
+        if dropped:
+            tmp_path = result_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(kept)
+            os.replace(tmp_path, result_path)
+            print(f"Removed {dropped} partial result lines from {result_path}")
+
+    def _journal_instruction(self, instruction, results, started):
+        # A failed step returns None; leave the instruction out so a resumed run retries it
+        if self.journal is not None and all(result is not None for result in results.values()):
+            self.journal.record(self._journal_model_type, instruction['id'],
+                                elapsed=round(time.monotonic() - started, 3))
+
+    def run_workflow(self, workflow, concurrency=None, sink=None):
+        """执行工作流
+
+        concurrency > 1 时在有界线程池中并发处理指令，每条指令拥有独立的
+        InstructionContext；返回结果按分派顺序排列：默认即指令文件中的顺序，
+        dispatch_order 为 'cost' 时按估计代价从大到小。
+        step_scheduler 为 'dag' 时，无数据依赖的步骤并行执行，并在指令之间流水线化。
+        传入 sink 时，每条指令完成后立即以 sink(instruction, results) 交出结果且不再保留，
+        此时返回处理完成的指令数，内存占用与数据集大小无关。
+        """
+        if sink is None:
+            return [results for _, results in self.iter_workflow(workflow, concurrency)]
+
+        count = 0
+        for instruction, results in self.iter_workflow(workflow, concurrency):
+            sink(instruction, results)
+            count += 1
+        return count
+
+    def iter_workflow(self, workflow, concurrency=None):
+        """按指令顺序逐条产出 (instruction, results)，被中止的指令不产出
+
+        同时在途和等待按序交出的指令总数有上限，慢指令不会让已完成的结果无限堆积。
+        配置了 process_workers 时指令分批交给工作进程，concurrency 为每个进程内的并发数。
+        """
+        concurrency = concurrency or self.concurrency
+        workflow_aux = self._load_workflow_instructions(workflow)
+
+        if self.process_workers:
+            finished = self._iter_processes(workflow_aux, concurrency)
+        else:
+            finished = self._iter_instructions(self.instructions, workflow_aux, concurrency)
+
+        for instruction, results in tqdm(finished, total=len(self.instructions)):
+            if results is not None:
+                yield instruction, results
+
+    def _iter_instructions(self, instructions, workflow_aux, concurrency):
+        with self._pipeline_stages(concurrency) as workers:
+            if self.step_scheduler == 'dag':
+                yield from DagScheduler(self, workflow_aux, max_workers=workers).iter_results(instructions)
+            elif workers <= 1:
+                for instruction in instructions:
+                    yield instruction, self._run_instruction(instruction, workflow_aux)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    run = functools.partial(self._run_instruction, workflow_aux=workflow_aux)
+                    yield from zip(instructions, _iter_in_order(executor, run, instructions, workers * 4))
+
+    def _iter_processes(self, workflow_aux, concurrency):
+        """在 process_workers 个工作进程中分批处理指令，结果按序流回父进程"""
+        batches = self._instruction_batches()
+        worker_config = dict(self.config, process_workers=None, concurrency=concurrency)
+
+        with ProcessPoolExecutor(max_workers=self.process_workers, initializer=_init_process_worker,
+                                 initargs=(self.workspace, worker_config, self._agent_specs,
+                                           workflow_aux, self._journal_model_type,
+                                           self.process_workers)) as executor:
+            window = self.process_workers * 2
+            for batch, batch_results in zip(batches, _iter_in_order(executor, _run_process_batch, batches, window)):
+                yield from zip(batch, batch_results)
+
+    def _instruction_batches(self):
+        size = self.process_batch_size
+        if self.dispatch_order != 'cost':
+            return [self.instructions[start:start + size] for start in range(0, len(self.instructions), size)]
+
+        # 按代价排序时轮流发牌，避免最重的几条指令落在同一个批次里
+        batches = []
+        group = size * self.process_workers
+        for start in range(0, len(self.instructions), group):
+            chunk = self.instructions[start:start + group]
+            batches.extend(chunk[offset::self.process_workers]
+                           for offset in range(min(self.process_workers, len(chunk))))
+        return batches
+
+    @contextmanager
+    def _pipeline_stages(self, concurrency):
+        """开启两阶段流水线时，生成阶段最多 concurrency 个并发，生成的代码交给独立的执行线程池
+
+        返回处理指令所需的工作线程数：等待执行结果的指令不占用生成名额。
+        """
+        if not self.execution_workers:
+            yield concurrency
+            return
+
+        self._generation_slots = threading.BoundedSemaphore(concurrency)
+        self._async_generation_slots = asyncio.Semaphore(concurrency)
+        self._execution_pool = ThreadPoolExecutor(max_workers=self.execution_workers,
+                                                  thread_name_prefix='code-execution')
+        try:
+            yield concurrency + self.execution_workers
+        finally:
+            self._execution_pool.shutdown()
+            self._generation_slots = None
+            self._async_generation_slots = None
+            self._execution_pool = None
+
+    def _generation_stage(self):
+        return self._generation_slots if self._generation_slots is not None else nullcontext()
+
+    @asynccontextmanager
+    async def _async_generation_stage(self):
+        if self._async_generation_slots is None:
+            yield
+        else:
+            async with self._async_generation_slots:
+                yield
+
+    async def run_workflow_async(self, workflow, concurrency=None, sink=None):
+        """在事件循环上执行工作流
+
+        与 run_workflow 相同，但 LLM 请求通过 GenericAgent.arun 异步发出，
+        最多 concurrency 条指令同时在途；结果按指令文件中的顺序返回或交给 sink。
+        """
+        if sink is None:
+            return [results async for _, results in self.aiter_workflow(workflow, concurrency)]
+
+        count = 0
+        async for instruction, results in self.aiter_workflow(workflow, concurrency):
+            sink(instruction, results)
+            count += 1
+        return count
+
+    async def aiter_workflow(self, workflow, concurrency=None):
+        """iter_workflow 的异步版本"""
+        if self.process_workers:
+            raise ValueError("process_workers is not supported by the async runner, use run_workflow")
+        concurrency = concurrency or self.concurrency
+        workflow_aux = self._load_workflow_instructions(workflow)
+        instructions = self.instructions
+
+        with self._pipeline_stages(concurrency) as workers:
+            workers = max(workers, 1)
+            window = workers * 4
+            tasks = {}
+            finished = {}
+            next_submit = next_yield = 0
+
+            with tqdm(total=len(instructions)) as progress:
+                try:
+                    while next_yield < len(instructions):
+                        while next_submit < len(instructions) and len(tasks) < workers \
+                                and len(tasks) + len(finished) < window:
+                            task = asyncio.create_task(
+                                self._arun_instruction(instructions[next_submit], workflow_aux))
+                            tasks[task] = next_submit
+                            next_submit += 1
+
+                        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            finished[tasks.pop(task)] = task.result()
+                            progress.update(1)
+
+                        while next_yield in finished:
+                            results = finished.pop(next_yield)
+                            if results is not None:
+                                yield instructions[next_yield], results
+                            next_yield += 1
+                finally:
+                    for task in tasks:
+                        task.cancel()
+
+    def create_context(self, instruction):
+        return InstructionContext(instruction, self._prepare_workspace(instruction))
+
+    def _run_instruction(self, instruction, workflow_aux):
+        """在独立上下文中执行单条指令的全部步骤，中止时返回 None"""
+        # Each instruction mutates its own copy of the step args
+        workflow = copy.deepcopy(workflow_aux)
+        context = self.create_context(instruction)
+        token = _current_context.set(context)
+        started = time.monotonic()
+        try:
+            results = {}
+            # Execute each step for this instruction
+            for step, step_aux in zip(workflow, workflow_aux):
+                if step.get('type') == 'loop':
+                    results.update(self._handle_loop_step(step, step_aux))
+                else:
+                    config_args = step_aux.get('args')
+                    step_results, agent_name, method_name = self._execute_step(step, config_args)
+                    results[f"{agent_name}_{method_name}"] = step_results
+            self._journal_instruction(instruction, results, started)
+            return results
+
+        except MaxDebugRetriesExceeded as e:
+            print(f"Aborting instruction {instruction['id']}: {str(e)}")
+            return None  # Skip to next instruction
+        except BatchPending:
+            return None  # 等待批量结果，下一轮重新执行
+        finally:
+            _current_context.reset(token)
+
+    def _run_graph_step(self, run, step_index, step_aux):
+        """在指令上下文中执行 DAG 调度器分派的单个步骤"""
+        step = run.workflow[step_index]
+        token = _current_context.set(run.context)
+        try:
+            if step.get('type') == 'loop':
+                run.step_results[step_index] = self._handle_loop_step(step, step_aux)
+            else:
+                step_results, agent_name, method_name = self._execute_step(step, step_aux.get('args'))
+                run.step_results[step_index] = {f"{agent_name}_{method_name}": step_results}
+        except MaxDebugRetriesExceeded as e:
+            print(f"Aborting instruction {run.instruction['id']}: {str(e)}")
+            run.aborted = True
+        except BatchPending:
+            run.aborted = True
+        finally:
+            _current_context.reset(token)
+
+    def _finish_instruction_run(self, run):
+        if run.aborted:
+            return None
+        results = {}
+        for step_index in sorted(run.step_results):
+            results.update(run.step_results[step_index])
+        self._journal_instruction(run.instruction, results, run.started)
+        return results
+
+    async def _arun_instruction(self, instruction, workflow_aux):
+        """_run_instruction 的异步版本"""
+        workflow = copy.deepcopy(workflow_aux)
+        # Creating the workspace copies the data files; keep that off the event loop
+        context = await asyncio.to_thread(self.create_context, instruction)
+        token = _current_context.set(context)
+        started = time.monotonic()
+        try:
+            step_results = {}
+            if self.step_scheduler == 'dag':
+                # Each step awaits only the steps it depends on
+                graph = StepGraph(workflow_aux)
+                tasks = {}
+                for index in range(len(graph)):
+                    dependencies = [tasks[dep] for dep in sorted(graph.dependencies[index])]
+                    tasks[index] = asyncio.create_task(self._arun_step_after(
+                        dependencies, workflow[index], workflow_aux[index], step_results, index))
+                try:
+                    await asyncio.gather(*tasks.values())
+                except BaseException:
+                    for task in tasks.values():
+                        task.cancel()
+                    raise
+            else:
+                for index, (step, step_aux) in enumerate(zip(workflow, workflow_aux)):
+                    await self._arun_step_after([], step, step_aux, step_results, index)
+
+            results = {}
+            for index in sorted(step_results):
+                results.update(step_results[index])
+            self._journal_instruction(instruction, results, started)
+            return results
+
+        except MaxDebugRetriesExceeded as e:
+            print(f"Aborting instruction {instruction['id']}: {str(e)}")
+            return None
+        except BatchPending:
+            return None
+        finally:
+            _current_context.reset(token)
 
     def _handle_loop_step(self, step, step_aux):
         """处理循环步骤"""
@@ -559,6 +1046,4 @@ LOG OUTPUT:
         output_file = os.path.join(output_dir, file_name)
 
         # 追加写入jsonl文件
-        with open(output_file, 'a', encoding='utf-8') as f:
-            json.dump(instruction_with_code, f, ensure_ascii=False)
-            f.write('\n')
+        append_jsonl(output_file, instruction_with_code, ensure_ascii=False)
@@ -0,0 +1,51 @@
+import json
+import os
+from statistics import median
+
+
+class InstructionCostModel:
+    """
+    Relative cost estimate of an instruction, used to dispatch the longest ones first.
+
+    Without history the estimate is a heuristic: error versions (one LLM round each)
+    times approximate prompt tokens, plus the size of the CSV the agents read. Journaled
+    `elapsed` times of earlier runs replace the estimate for instructions that were seen
+    before, and calibrate the heuristic into seconds for the others.
+    """
+
+    def __init__(self, data_folder=None, journals=()):
+        self.data_folder = data_folder
+        self.history = {}
+        for journal in journals:
+            for entry in journal.entries():
+                if entry.get('error_version') is None and entry.get('elapsed') is not None:
+                    self.history[entry['id']] = entry['elapsed']
+        self._seconds_per_unit = None
+
+    def heuristic(self, instruction):
+        error_versions = len(instruction.get('error_versions') or []) or 1
+        prompt_tokens = len(json.dumps(instruction, ensure_ascii=False)) / 4 / error_versions
+        csv_mb = 0.0
+        file_name = instruction.get('file_name')
+        if self.data_folder and file_name:
+            path = os.path.join(self.data_folder, file_name)
+            if os.path.exists(path):
+                csv_mb = os.path.getsize(path) / 1e6
+        return error_versions * (1 + prompt_tokens / 1000) + csv_mb
+
+    def calibrate(self, instructions):
+        ratios = [self.history[inst['id']] / self.heuristic(inst)
+                  for inst in instructions if inst['id'] in self.history]
+        self._seconds_per_unit = median(ratios) if ratios else 1.0
+
+    def estimate(self, instruction):
+        if instruction['id'] in self.history:
+            return self.history[instruction['id']]
+        if self._seconds_per_unit is None:
+            self._seconds_per_unit = 1.0
+        return self.heuristic(instruction) * self._seconds_per_unit
+
+    def longest_first(self, instructions):
+        """Return the instructions ordered by decreasing estimated cost (stable for ties)."""
+        self.calibrate(instructions)
+        return sorted(instructions, key=self.estimate, reverse=True)
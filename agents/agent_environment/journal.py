@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+
+from agents.utils import append_jsonl
+
+
+class CompletionJournal:
+    """
+    Append-only JSONL journal of completed work, keyed by (model_type, id, error_version).
+
+    `error_version` is the index of an error version inside an instruction, or None for
+    the record that marks the whole instruction as finished. Each record may carry the
+    result of the work so that a resumed run can reuse it instead of paying for it again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.existed = os.path.exists(path)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if self.existed:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 崩溃时写了一半的最后一行
+                    key = self.key(entry['model_type'], entry['id'], entry.get('error_version'))
+                    self._entries[key] = entry
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model_type, item_id, error_version=None):
+        return model_type, item_id, error_version
+
+    def is_done(self, model_type, item_id, error_version=None):
+        return self.key(model_type, item_id, error_version) in self._entries
+
+    def get(self, model_type, item_id, error_version=None):
+        """Return the journaled result for a key, or None if it has none."""
+        entry = self._entries.get(self.key(model_type, item_id, error_version))
+        return entry.get('result') if entry else None
+
+    def get_entry(self, model_type, item_id, error_version=None):
+        return self._entries.get(self.key(model_type, item_id, error_version))
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def record(self, model_type, item_id, error_version=None, result=None, elapsed=None):
+        entry = {
+            'model_type': model_type,
+            'id': item_id,
+            'error_version': error_version,
+            'result': result,
+            'elapsed': elapsed,
+        }
+        with self._lock:
+            append_jsonl(self.path, entry, fsync=True)
+            self._entries[self.key(model_type, item_id, error_version)] = entry
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,167 @@
+import copy
+import heapq
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class StepGraph:
+    """
+    Dependency graph between the top-level steps of a WORKFLOW.
+
+    Edges are inferred from what the steps already declare:
+    - an arg of the form {'from': name} depends on the step whose 'output' is name;
+    - an input {'code': file} depends on the code step that writes that file;
+    - steps that write the same 'output', or run on the same agent instance
+      (agents keep state such as chat_history), keep their workflow order;
+    - loop steps read data_store entries by fixed names, so they act as barriers.
+    """
+
+    def __init__(self, workflow):
+        self.steps = workflow
+        self.dependencies = {index: set() for index in range(len(workflow))}
+
+        producers = {}  # output name -> index of the latest step writing it
+        code_files = {}  # generated code file -> index of the step writing it
+        last_step_of_agent = {}
+        barrier = None
+
+        for index, step in enumerate(workflow):
+            deps = self.dependencies[index]
+
+            if step.get('type') == 'loop':
+                deps.update(range(index))
+                barrier = index
+                for substep in step.get('steps', []):
+                    if 'output' in substep:
+                        producers[substep['output']] = index
+                continue
+
+            if barrier is not None:
+                deps.add(barrier)
+
+            for arg_value in step.get('args', {}).values():
+                if isinstance(arg_value, dict) and 'from' in arg_value:
+                    if arg_value['from'] not in producers:
+                        raise ValueError(f"Step {index} reads '{arg_value['from']}' before any step produces it")
+                    deps.add(producers[arg_value['from']])
+
+            code_input = step.get('input', {}).get('code')
+            if isinstance(code_input, str) and code_input in code_files:
+                deps.add(code_files[code_input])
+
+            if step['agent'] in last_step_of_agent:
+                deps.add(last_step_of_agent[step['agent']])
+            last_step_of_agent[step['agent']] = index
+
+            if 'output' in step:
+                if step['output'] in producers:
+                    deps.add(producers[step['output']])
+                producers[step['output']] = index
+
+            if step.get('output_type', 'code') == 'code':
+                code_files[f"code_{step['agent']}_{step['method']}.py"] = index
+
+        self.dependents = {index: set() for index in range(len(workflow))}
+        for index, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].add(index)
+
+    def roots(self):
+        return [index for index, deps in self.dependencies.items() if not deps]
+
+    def __len__(self):
+        return len(self.steps)
+
+
+class _InstructionRun:
+    """Scheduling state of one instruction inside the DAG scheduler."""
+
+    def __init__(self, instruction, context, workflow, graph):
+        self.instruction = instruction
+        self.context = context
+        self.workflow = workflow
+        self.waiting_on = {index: len(deps) for index, deps in graph.dependencies.items()}
+        self.step_results = {}
+        self.remaining = len(graph)
+        self.aborted = False
+        self.started = time.monotonic()
+
+
+class DagScheduler:
+    """
+    Runs a workflow's steps as soon as their dependencies are met, across instructions.
+
+    A shared pool of `max_workers` threads executes ready steps. Up to `window`
+    instructions are admitted at once and older instructions are served first, so
+    step 2 of instruction k overlaps with step 1 of instruction k+1 instead of waiting
+    for it.
+    """
+
+    def __init__(self, env, workflow_aux, max_workers, window=None):
+        self.env = env
+        self.workflow_aux = workflow_aux
+        self.graph = StepGraph(workflow_aux)
+        self.max_workers = max(max_workers, 1)
+        self.window = window or self.max_workers * 2
+
+    def run(self, instructions):
+        return [results for _, results in self.iter_results(instructions) if results is not None]
+
+    def iter_results(self, instructions):
+        """
+        Yield (instruction, results) in instruction order as instructions finish.
+
+        results is None for an aborted instruction. Instructions that finish ahead of
+        an earlier one count against the admission window until they are yielded, so
+        memory stays bounded however many instructions there are.
+        """
+        pending = deque(enumerate(instructions))
+        runs = {}
+        ready = []  # heap of (instruction index, step index)
+        futures = {}
+        finished = {}
+        next_yield = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or ready or futures:
+                while pending and len(runs) + len(finished) < self.window:
+                    index, instruction = pending.popleft()
+                    runs[index] = _InstructionRun(instruction, self.env.create_context(instruction),
+                                                  copy.deepcopy(self.workflow_aux), self.graph)
+                    for step_index in self.graph.roots():
+                        heapq.heappush(ready, (index, step_index))
+
+                while ready and len(futures) < self.max_workers:
+                    index, step_index = heapq.heappop(ready)
+                    if runs[index].aborted:
+                        continue
+                    future = executor.submit(self.env._run_graph_step, runs[index], step_index,
+                                             self.workflow_aux[step_index])
+                    futures[future] = (index, step_index)
+
+                if not futures:
+                    continue
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, step_index = futures.pop(future)
+                    future.result()
+                    run = runs[index]
+                    run.remaining -= 1
+                    if not run.aborted:
+                        for dependent in self.graph.dependents[step_index]:
+                            run.waiting_on[dependent] -= 1
+                            if run.waiting_on[dependent] == 0:
+                                heapq.heappush(ready, (index, dependent))
+
+                    in_flight = any(i == index for i, _ in futures.values())
+                    if (run.remaining == 0 or run.aborted) and not in_flight:
+                        finished[index] = (run.instruction, self.env._finish_instruction_run(run))
+                        del runs[index]
+                        ready = [entry for entry in ready if entry[0] != index]
+                        heapq.heapify(ready)
+
+                while next_yield in finished:
+                    yield finished.pop(next_yield)
+                    next_yield += 1
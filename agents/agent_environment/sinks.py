@@ -0,0 +1,43 @@
+import json
+import os
+import threading
+
+
+def _strip_logs(value):
+    if isinstance(value, dict):
+        return {key: _strip_logs(item) for key, item in value.items() if key != 'log'}
+    return value
+
+
+class JsonlResultSink:
+    """
+    Sink for `AgentEnvironment.run_workflow` that appends each instruction's results
+    to a JSONL file as soon as the instruction finishes.
+
+    Step logs are already written to each workspace's log file, so they are dropped
+    unless `keep_logs` is set.
+    """
+
+    def __init__(self, path, keep_logs=False):
+        self.path = path
+        self.keep_logs = keep_logs
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, instruction, results):
+        record = {
+            'id': instruction['id'],
+            'results': results if self.keep_logs else _strip_logs(results),
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def discard_results(instruction, results):
+    """Sink for runs whose results are only consumed through the agents' result files."""
+    pass
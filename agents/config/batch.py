@@ -0,0 +1,14 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Offline batch jobs (LLM_MODE=batch, see agents/llm_batch.py): request files are written
+# to and provider output files are read from this directory
+LLM_BATCH_DIR = os.getenv('LLM_BATCH_DIR', 'workspace/llm_batch')
+# Seconds between checks for the output file of a submitted round
+LLM_BATCH_POLL_SECONDS = float(os.getenv('LLM_BATCH_POLL_SECONDS', '30'))
+# Seconds to wait for the output files of a round before giving up (0 waits forever);
+# the default matches the 24h completion window of batch APIs
+LLM_BATCH_TIMEOUT = float(os.getenv('LLM_BATCH_TIMEOUT', '86400'))
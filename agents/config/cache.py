@@ -0,0 +1,14 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# On-disk LLM response cache (see agents/llm_cache.py)
+# off: no cache; readwrite: serve hits and store misses;
+# readonly: serve hits, never write; refresh: always call the API and overwrite entries
+LLM_CACHE_MODE = os.getenv('LLM_CACHE_MODE', 'off').lower()
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', '.llm_cache/responses.sqlite')
+LLM_CACHE_MAX_MB = float(os.getenv('LLM_CACHE_MAX_MB', '2048'))
+# Entries older than this are treated as misses and evicted; unset means they never expire
+LLM_CACHE_TTL_DAYS = float(os.getenv('LLM_CACHE_TTL_DAYS')) if os.getenv('LLM_CACHE_TTL_DAYS') else None
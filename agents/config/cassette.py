@@ -0,0 +1,14 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Record/replay of LLM traffic (see agents/llm_cassette.py)
+# live: call the APIs; record: call the APIs and append every exchange to the cassette;
+# replay: answer from the cassette only, without network access;
+# batch: collect requests into Batch-API JSONL files instead of sending them (agents/llm_batch.py)
+LLM_MODE = os.getenv('LLM_MODE', 'live').lower()
+LLM_CASSETTE = os.getenv('LLM_CASSETTE', 'workspace/llm_cassette.jsonl')
+# In replay mode, sleep for the recorded latency times this factor (0 disables)
+LLM_REPLAY_LATENCY = float(os.getenv('LLM_REPLAY_LATENCY', '0'))
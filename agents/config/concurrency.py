@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Adaptive (AIMD) in-flight limits per (backend, model) in the completion layer
+ADAPTIVE_CONCURRENCY = os.getenv('LLM_ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+
+# Starting and maximum in-flight requests per backend; any model gets its own limiter
+ADAPTIVE_LIMITS = {
+    'OpenRouter': {
+        'initial': int(os.getenv('OPENROUTER_INITIAL_CONCURRENCY', '8')),
+        'max': int(os.getenv('OPENROUTER_MAX_CONCURRENCY', '64')),
+    },
+    'THU': {
+        'initial': int(os.getenv('THU_INITIAL_CONCURRENCY', '8')),
+        'max': int(os.getenv('THU_MAX_CONCURRENCY', '64')),
+    },
+    'vLLM': {
+        'initial': int(os.getenv('VLLM_INITIAL_CONCURRENCY', '32')),
+        'max': int(os.getenv('VLLM_MAX_CONCURRENCY', '512')),
+    },
+}
+ADAPTIVE_MIN_CONCURRENCY = int(os.getenv('LLM_MIN_CONCURRENCY', '1'))
+
+# Latency is healthy while p95 stays below this many seconds; unset means
+# LLM_LATENCY_TOLERANCE x the best p95 observed so far
+LATENCY_SLO = float(os.getenv('LLM_LATENCY_SLO')) if os.getenv('LLM_LATENCY_SLO') else None
+LATENCY_TOLERANCE = float(os.getenv('LLM_LATENCY_TOLERANCE', '2.0'))
+
+# Multiplicative decrease on HTTP 429/5xx, and the error rate above which the limit stops growing
+BACKOFF_FACTOR = float(os.getenv('LLM_BACKOFF_FACTOR', '0.5'))
+MAX_ERROR_RATE = float(os.getenv('LLM_MAX_ERROR_RATE', '0.05'))
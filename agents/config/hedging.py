@@ -0,0 +1,37 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def _alternates(value):
+    """Parse 'OpenRouter=THU,THU=OpenRouter:model' into {backend: (backend, model or None)}."""
+    alternates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        backend, _, target = item.partition('=')
+        alt_backend, _, alt_model = target.strip().partition(':')
+        alternates[backend.strip()] = (alt_backend.strip(), alt_model.strip() or None)
+    return alternates
+
+
+# Hedged requests: a request still running after the hedge delay is duplicated,
+# and whichever copy answers first is used. With --async the losing copy is cancelled;
+# a blocking (threaded) request cannot be interrupted, so there the loser runs to
+# completion in the background, using its rate budget and slot, and is discarded
+LLM_HEDGE = os.getenv('LLM_HEDGE', 'false').lower() == 'true'
+
+# The hedge delay is this percentile of the observed latency of the (backend, model),
+# but never less than LLM_HEDGE_MIN_DELAY seconds
+HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95'))
+HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '2.0'))
+
+# Latency samples needed before requests are hedged at all
+HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+
+# Hedges allowed as a fraction of requests, e.g. 0.1 caps the extra load at 10%
+HEDGE_BUDGET = float(os.getenv('LLM_HEDGE_BUDGET', '0.1'))
+
+# Where the duplicate goes, as BACKEND=ALTERNATE[:MODEL]; unlisted backends are hedged
+# to themselves (a vLLM hedge lands on the least loaded replica)
+HEDGE_ALTERNATES = _alternates(os.getenv('LLM_HEDGE_ALTERNATES', ''))
@@ -0,0 +1,25 @@
+import json
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Usage ledger (see agents/llm_usage.py): one JSONL entry per LLM call, written next to
+# the result file by workflow_generic.py; set to false to turn it off
+LLM_LEDGER = os.getenv('LLM_LEDGER', 'true').lower() == 'true'
+LLM_LEDGER_PATH = os.getenv('LLM_LEDGER_PATH')
+LLM_LEDGER_RUN_ID = os.getenv('LLM_LEDGER_RUN_ID')
+
+
+def _load_prices(path):
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# USD per million tokens by model, e.g. {"openai/gpt-oss-120b": {"prompt": 0.1, "completion": 0.5,
+# "cached": 0.05}}; "cached" defaults to the prompt price. Costs reported by the provider in
+# `usage.cost` (OpenRouter) take precedence, and unpriced calls are counted without a cost.
+MODEL_PRICES = _load_prices(os.getenv('LLM_PRICES_FILE'))
@@ -7,3 +7,14 @@ load_dotenv()
 API_KEY = os.getenv('OPENROUTER_API_KEY', '')
 BASE_URL = 'https://openrouter.ai/api/v1'
 temperature = 0
+
+# Prompt assembly: 'template' fills the prompts as written, 'prefix' moves the paragraphs with
+# item-specific content to the end, so the static instructions form a prefix-cacheable block
+PROMPT_LAYOUT = os.getenv('LLM_PROMPT_LAYOUT', 'template')
+
+# Connection pool shared by all requests to an OpenAI-compatible backend (see agents/llm_clients.py)
+MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '100'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '50'))
+KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '60'))
+HTTP2 = os.getenv('LLM_HTTP2', 'true').lower() == 'true'  # only used when the h2 package is installed
+REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '600'))
@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def _optional_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# Requests and tokens per minute per (backend, model); unset means no limit
+RATE_LIMITS = {
+    'OpenRouter': {'rpm': _optional_int('OPENROUTER_RPM'), 'tpm': _optional_int('OPENROUTER_TPM')},
+    'THU': {'rpm': _optional_int('THU_RPM'), 'tpm': _optional_int('THU_TPM')},
+    'vLLM': {'rpm': _optional_int('VLLM_RPM'), 'tpm': _optional_int('VLLM_TPM')},
+}
+
+# Fraction of the limits this process may use, e.g. 0.5 when two machines share one API key.
+# Worker processes of one run split their share between them automatically.
+RATE_LIMIT_SHARE = float(os.getenv('LLM_RATE_LIMIT_SHARE', '1.0'))
+
+# Seconds of budget that may be spent in one burst
+RATE_LIMIT_BURST_SECONDS = float(os.getenv('LLM_RATE_LIMIT_BURST_SECONDS', '10'))
+
+# Completion tokens reserved per request until the response reports its actual usage
+EXPECTED_COMPLETION_TOKENS = int(os.getenv('LLM_EXPECTED_COMPLETION_TOKENS', '1000'))
+
+# Attempts per request on HTTP 408/409/429/5xx and connection errors, with
+# jittered exponential backoff between them (a server Retry-After takes precedence)
+MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '6'))
+BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1.0'))
+BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '60'))
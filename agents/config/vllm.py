@@ -26,6 +26,10 @@ setup_hf_cache()
 # vLLM Configuration
 VLLM_API_KEY = os.getenv('VLLM_API_KEY', 'EMPTY')  # Usually empty for local vLLM servers
 VLLM_BASE_URL = os.getenv('VLLM_BASE_URL', 'http://localhost:8000/v1')  # Default vLLM server URL
+# Several replicas of the same models: comma-separated base URLs. Requests go to the healthy
+# replica with the fewest outstanding requests and fail over when a replica drops.
+VLLM_BASE_URLS = [url.strip() for url in os.getenv('VLLM_BASE_URLS', VLLM_BASE_URL).split(',') if url.strip()]
+VLLM_HEALTH_CHECK_INTERVAL = float(os.getenv('VLLM_HEALTH_CHECK_INTERVAL', '15'))  # seconds between replica probes
 VLLM_TEMPERATURE = float(os.getenv('VLLM_TEMPERATURE', '0'))
 
 # vLLM Model Configuration
@@ -42,6 +46,10 @@ VLLM_PORT = int(os.getenv('VLLM_PORT', '8000'))
 VLLM_WORKER_USE_RAY = os.getenv('VLLM_WORKER_USE_RAY', 'false').lower() == 'true'
 VLLM_TENSOR_PARALLEL_SIZE = int(os.getenv('VLLM_TENSOR_PARALLEL_SIZE', '1'))
 
+# Client connection pool (one shared client per server and process)
+VLLM_POOL_SIZE = int(os.getenv('VLLM_POOL_SIZE', '256'))  # keep-alive connections to the server
+VLLM_REQUEST_TIMEOUT = float(os.getenv('VLLM_REQUEST_TIMEOUT', '300'))
+
 # Supported model configurations for easy switching
 VLLM_MODEL_CONFIGS = {
     'llama2-7b': {
@@ -5,11 +5,10 @@ import json
 from tenacity import RetryError
 from tqdm import tqdm
 
-from agents.generic_agent import GenericAgent
+from agents.generic_agent import GenericAgent, LLMCall, llm_steps
 from agents.openai_chatComplete import completion_with_backoff
-from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
-from agents.utils import print_filesys_struture
-from agents.utils import change_directory
+from agents.utils import get_error_message, is_run_code_success, run_code
+from agents.utils import append_jsonl, change_directory
 
 
 def parse_output_string(output_str):
@@ -97,39 +96,34 @@ class DataAnalysisAgent(GenericAgent):
         self.data_information = kwargs.get('data_information', None)
 
     def generate(self, user_prompt, model_type, file_name, backend='THU'):
+        return completion_with_backoff(self.build_messages(user_prompt, file_name), model_type, backend=backend)
+        # return completion_with_backoff(messages, model_type)
+
+    def build_messages(self, user_prompt, file_name):
 
-        workspace_structure = print_filesys_struture(self.workspace)
-        
         information = {
-            'workspace_structure': workspace_structure,
             'file_name': file_name,
             'query': user_prompt
         }
 
 
-        messages = []
-        messages.append({"role": "system", "content": fill_in_placeholders(self.prompts['system'], information)})
-        messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['user'], information)})
-
-        self.chat_history = self.chat_history + messages
-        return completion_with_backoff(self.chat_history, model_type, backend=backend)
-        # return completion_with_backoff(messages, model_type)
+        messages = self.fill_prompts('system', 'user', information)
 
-    def generate_rubber_duck(self, user_prompt, model_type, code, backend='THU'):
-        workspace_structure = print_filesys_struture(self.workspace)
+        # Built per call: the agent is shared by concurrent instructions, so prompts must not
+        # depend on what other instructions sent before
+        self.chat_history = messages
+        return messages
 
+    def generate_rubber_duck(self, user_prompt, model_type, code, backend='THU', refresh=False):
         information = {
-            'workspace_structure': workspace_structure,
             'code': code,
             'query': user_prompt,
         }
 
-        messages = []
-        messages.append({"role": "system", "content": fill_in_placeholders(self.prompts['debug_system'], information)})
-        messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['debug_user'], information)})
+        messages = self.fill_prompts('debug_system', 'debug_user', information)
 
         # self.chat_history = self.chat_history + messages
-        return completion_with_backoff(messages, model_type, backend)
+        return completion_with_backoff(messages, model_type, backend, refresh=refresh)
 
     def get_code(self, response):
 
@@ -161,6 +155,7 @@ class DataAnalysisAgent(GenericAgent):
                     return '\n'.join(code_lines)
         return all_code_blocks_combined
 
+    @llm_steps
     def run(self, queries, model_type, file_name, individual_workspace):
         log = []
         code = []
@@ -188,7 +183,7 @@ Correct answer: {query['answers']}. Make sure your analysis results are identica
                 """
 
                 log.append("\nGenerating code...")
-                result = self.generate(prompt, model_type=model_type, file_name=file_name)
+                result = yield LLMCall(self.build_messages(prompt, file_name), model_type, backend='THU')
                 generated_code = self.get_code(result)
                 code.append(generated_code)
                 
@@ -199,7 +194,7 @@ Correct answer: {query['answers']}. Make sure your analysis results are identica
             log.append("Processing single query...")
             log.append(f"Query: {self.query}")
             
-            result = self.generate(self.query, model_type=model_type, file_name=file_name)
+            result = yield LLMCall(self.build_messages(self.query, file_name), model_type, backend='THU')
             generated_code = self.get_code(result)
             code = generated_code
             
@@ -288,6 +283,7 @@ Correct answer: {query['answers']}. Make sure your analysis results are identica
 
         return '\n'.join(log), corrected_code
 
+    @llm_steps
     def weak_direct_analysis(self, queries, model_type, file_name, individual_workspace):
         log = []
         structured_output = {"error_versions": []}
@@ -325,7 +321,7 @@ If the query requires data manipulation from a csv file, process the data from t
         for i in tqdm(range(5)):
             log.append("\nGenerating code...")
             print(f"\nweak llm generating turn No.{i}")
-            result = self.generate(prompt, model_type=model_type, file_name=file_name)
+            result = yield LLMCall(self.build_messages(prompt, file_name), model_type, backend='THU')
             generated_code = self.get_code(result)
 
             log.append(f"Generated code for run No.{i}:")
@@ -343,9 +339,8 @@ If the query requires data manipulation from a csv file, process the data from t
         output_dir = os.path.join(self.workspace, 'sklearn_pandas_errors')
         os.makedirs(output_dir, exist_ok=True)
 
-        with open(os.path.join(output_dir, f'{model_type}_dseval_weak_direct_analysis.jsonl'), 'a') as jsonl_file:
-            jsonl_file.write(json.dumps(queries) + '\n')
-            print("Analysis saved.")
+        append_jsonl(os.path.join(output_dir, f'{model_type}_dseval_weak_direct_analysis.jsonl'), queries)
+        print("Analysis saved.")
 
         # Join the log list into a single string
         log_string = "\n".join(log)
@@ -400,7 +395,8 @@ If the query requires data manipulation from a csv file, process the data from t
                 print(
                     f"\n...............Verifying generated code (Attempt {retries + 1})...............")
 
-                result = self.generate_rubber_duck(prompt_dabench, model_type=model_type, code=modified_code, backend='THU')
+                result = self.generate_rubber_duck(prompt_dabench, model_type=model_type, code=modified_code, backend='THU',
+                                                   refresh=retries > 0)
 
                 # Locate the first curly brace to the last one for extracting the JSON object
                 start_index = result.rfind('{')
@@ -566,8 +562,7 @@ If the query requires data manipulation from a csv file, process the data from t
         output_dir = os.path.join(self.workspace, 'dabench_quantitative_experiment')
         os.makedirs(output_dir, exist_ok=True)
 
-        with open(os.path.join(output_dir, f'{model_type.replace("Qwen/", "")}_dabench_quantitative_experiment_ablation_2.jsonl'), 'a') as jsonl_file:
-            jsonl_file.write(json.dumps(queries) + '\n')
+        append_jsonl(os.path.join(output_dir, f'{model_type.replace("Qwen/", "")}_dabench_quantitative_experiment_ablation_2.jsonl'), queries)
 
         # Join the log list into a single string
         log_string = "\n".join(log)
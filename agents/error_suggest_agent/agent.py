@@ -6,12 +6,11 @@ import shutil
 import pandas as pd
 from tqdm import tqdm
 
-from agents.generic_agent import GenericAgent
+from agents.generic_agent import GenericAgent, LLMCall, llm_steps
 from agents.openai_chatComplete import completion_with_backoff
 from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
-from agents.utils import print_filesys_struture
 from agents.error_inject_agent.prompt import ERROR_TYPE_PROMPT
-from agents.utils import change_directory
+from agents.utils import append_jsonl, change_directory
 
 
 def get_code2(response, file_name):
@@ -94,17 +93,18 @@ class ErrorSuggestAgent(GenericAgent):
         self.data_information = kwargs.get('data_information', None)
 
     def raw_generate(self, user_prompt, model_type):
+        return completion_with_backoff(self.build_raw_messages(user_prompt), model_type)
+
+    def build_raw_messages(self, user_prompt):
         messages = [{"role": "system", "content": ''}, {"role": "user", "content": user_prompt}]
 
-        self.chat_history = self.chat_history + messages
-        return completion_with_backoff(messages, model_type)
+        # Only the latest exchange is kept: the prompts are rebuilt per item
+        self.chat_history = messages
+        return messages
 
     def generate(self, user_prompt, model_type, code, csv_info, concepts):
 
-        workspace_structure = print_filesys_struture(self.workspace)
-        
         information = {
-            'workspace_structure': workspace_structure,
             'code': code,
             'query': user_prompt,
             'csv_info': csv_info,
@@ -112,20 +112,20 @@ class ErrorSuggestAgent(GenericAgent):
         }
 
 
-        messages = []
-        messages.append({"role": "system", "content": fill_in_placeholders(self.prompts['system'], information)})
-        messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['user'], information)})
+        messages = self.fill_prompts('system', 'user', information)
 
 
 
-        self.chat_history = self.chat_history + messages
+        self.chat_history = messages
         return completion_with_backoff(messages, model_type)
 
-    def run(self, queries, model_type, code):
+    def run(self, queries, model_type, code, individual_workspace=None):
         log = []
         suggest_results = []
         file_name = queries['file_name']
-        error_code_directory = os.path.join(self.workspace, 'error_code_dir')
+        # Injected code is written and executed per instruction, so concurrent instructions
+        # never overwrite or run each other's files
+        error_code_directory = os.path.join(individual_workspace or self.workspace, 'error_code_dir')
         os.makedirs(error_code_directory, exist_ok=True)
 
         src = os.path.join(self.workspace, file_name)
@@ -323,8 +323,7 @@ class ErrorSuggestAgent(GenericAgent):
             query.update(result_dict)
 
             # Write the entire dictionary as a single line to a jsonl file
-            with open(os.path.join(error_code_directory, 'hard_library_wrong.jsonl'), 'a') as jsonl_file:
-                jsonl_file.write(json.dumps(query) + '\n')
+            append_jsonl(os.path.join(error_code_directory, 'hard_library_wrong.jsonl'), query)
 
             # Use the extracted variables as needed
             log.append(f"\nInjected Code:\n{injected_code}\n")
@@ -406,8 +405,7 @@ class ErrorSuggestAgent(GenericAgent):
 
             # Save results to JSONL file
             queries.update(result_dict)
-            with open(os.path.join(error_code_directory, 'gpt-4o_dabench_hard_library_errors.jsonl'), 'a') as jsonl_file:
-                jsonl_file.write(json.dumps(queries) + '\n')
+            append_jsonl(os.path.join(error_code_directory, 'gpt-4o_dabench_hard_library_errors.jsonl'), queries)
 
         except json.JSONDecodeError as e:
             raise ValueError(f"Error decoding JSON: {e}")
@@ -509,12 +507,12 @@ class ErrorSuggestAgent(GenericAgent):
 
         # Save the updated queries with execution results
         output_file = os.path.join(error_code_directory, f'{model_type}_matplotbench_monitored_errors_with_use_agg.jsonl')
-        with open(output_file, 'a') as f:
-            f.write(json.dumps(queries) + '\n')
+        append_jsonl(output_file, queries)
 
         log_string = "\n".join(log)
         return log_string, queries
 
+    @llm_steps
     def process_sklearn_pandas_code(self, queries, model_type, data_folder, individual_workspace):
         log = []
         # Step 1: Identify sklearn and pandas code
@@ -628,7 +626,7 @@ The expected output format is given below:
 
         # Call LLM to identify sklearn and pandas code
         print(f"**********Running example {queries['id']}**********")
-        result = self.raw_generate(identify_prompt, model_type=model_type)
+        result = yield LLMCall(self.build_raw_messages(identify_prompt), model_type)
         start_index = result.find('{')
         end_index = result.rfind('}')
         if start_index == -1 or end_index == -1:
@@ -674,7 +672,7 @@ The expected output format is given below:
 ```
 """
             # Call LLM to inject error
-            error_result = self.raw_generate(error_injection_prompt, model_type=model_type)
+            error_result = yield LLMCall(self.build_raw_messages(error_injection_prompt), model_type)
             error_start_index = error_result.find('{')
             error_end_index = error_result.rfind('}')
             if error_start_index == -1 or error_end_index == -1:
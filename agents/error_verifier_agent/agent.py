@@ -6,12 +6,20 @@ import traceback
 
 from tenacity import RetryError
 from tqdm import tqdm
-from agents.generic_agent import GenericAgent
+from agents.generic_agent import GenericAgent, LLMCall, llm_steps
+from agents.llm_batch import BatchPending
 from agents.openai_chatComplete import completion_with_backoff
 from agents.utils import fill_in_placeholders, get_error_message, is_run_code_success, run_code
-from agents.utils import print_filesys_struture
-from agents.utils import change_directory
+from agents.utils import append_jsonl, change_directory, resolve_result_file_path
+from .error_message_scorer import BATCH_JUDGE_KEYS, JUDGE_KEYS, create_error_message_scorer
 from .exact_match_evaluator import create_exact_match_evaluator
+from .schema import SINGLE_BUG_SCHEMA, MULTI_BUG_SCHEMA, ERROR_MESSAGE_JUDGE_SCHEMA, ERROR_MESSAGE_BATCH_JUDGE_SCHEMA
+from .schema import parse_guided_json
+
+# 流式输出中 JSON 必须包含的键，收到完整 JSON 后即可提前结束生成
+DUCK_KEYS = ('cause_line', 'effect_line')
+# 批量评分模式下，断点日志中只差 error_message 评分的检测结果用此键记录待评分的报错对
+PENDING_JUDGE_KEY = 'error_message_pending'
 
 
 def extract_traceback(error_str):
@@ -106,25 +114,56 @@ class ErrorVerifierAgent(GenericAgent):
     def __init__(self, workspace, **kwargs):
         super().__init__(workspace, **kwargs)
         self.exact_match_evaluator = create_exact_match_evaluator()
+        self.error_message_scorer = create_error_message_scorer()
         self.chat_history = []
         self.query = kwargs.get('query', '')
         self.data_information = kwargs.get('data_information', None)
 
     def generate(self, user_prompt, model_type, code, backend='OpenRouter'):
-        workspace_structure = print_filesys_struture(self.workspace)
+        return completion_with_backoff(self.build_messages(user_prompt, code), model_type, backend)
 
+    def build_messages(self, user_prompt, code):
         information = {
-            'workspace_structure': workspace_structure,
             'code': code,
             'query': user_prompt,
         }
 
-        messages = []
-        messages.append({"role": "system", "content": fill_in_placeholders(self.prompts['system'], information)})
-        messages.append({"role": "user", "content": fill_in_placeholders(self.prompts['user'], information)})
-
-        self.chat_history = self.chat_history + messages
-        return completion_with_backoff(messages, model_type, backend)
+        messages = self.fill_prompts('system', 'user', information)
+
+        # Only the latest exchange is kept: the prompts are rebuilt per item
+        self.chat_history = messages
+        return messages
+
+    @staticmethod
+    def _json_stop(stop_at_json, kind, required_keys):
+        """`LLMCall` arguments that stop the stream at the JSON the step parses, if enabled."""
+        if not stop_at_json:
+            return {}
+        return {'stop_at_json': kind, 'required_keys': required_keys}
+
+    @staticmethod
+    def _guided(guided_json, schema):
+        """`LLMCall` arguments that constrain decoding to the JSON schema the step parses, if enabled."""
+        return {'json_schema': schema} if guided_json else {}
+
+    def _score_error_message(self, ground_truth_message, llm_message, tiered_judge, stop_at_json, guided_json,
+                             refresh=False):
+        """Error message verdict from the tiered scorer; yields the judge `LLMCall` only if it is needed."""
+        return self.error_message_scorer.score(
+            ground_truth_message, llm_message, tiered=tiered_judge, refresh=refresh,
+            **self._json_stop(stop_at_json, 'object', JUDGE_KEYS),
+            **self._guided(guided_json, ERROR_MESSAGE_JUDGE_SCHEMA)
+        )
+
+    def _score_error_messages(self, pairs, tiered_judge, stop_at_json, guided_json, refresh=False):
+        """Error message verdicts of several pairs; the ambiguous ones are judged in one batched request."""
+        return self.error_message_scorer.score_batch(
+            pairs, tiered=tiered_judge, refresh=refresh,
+            batch_call={**self._json_stop(stop_at_json, 'list', BATCH_JUDGE_KEYS),
+                        **self._guided(guided_json, ERROR_MESSAGE_BATCH_JUDGE_SCHEMA), 'refresh': refresh},
+            **self._json_stop(stop_at_json, 'object', JUDGE_KEYS),
+            **self._guided(guided_json, ERROR_MESSAGE_JUDGE_SCHEMA)
+        )
 
     def run(self, queries, model_type, code):
         log = []
@@ -363,7 +402,9 @@ class ErrorVerifierAgent(GenericAgent):
         log_string = "\n".join(log)
         return log_string, result_dict
 
-    def rubber_duck_eval(self, queries, model_type, eval_folder, individual_workspace, result_file=None):
+    @llm_steps
+    def rubber_duck_eval(self, queries, model_type, eval_folder, individual_workspace, result_file=None,
+                         stop_at_json=False, guided_json=False, tiered_judge=False, batch_judge=False):
         log = []
         query = queries
 
@@ -386,9 +427,27 @@ class ErrorVerifierAgent(GenericAgent):
 
         MAX_RETRIES = 5
         eval_results = []
+        batch_pending = False  # 批处理模式下有请求排队等待批量结果
+        failed = False  # 有 error version 用尽重试时不返回结果，指令不写入断点日志，--resume 会重新处理
+        batch_judged = []  # 批量评分模式下等待 error_message 评分的 (idx, eval_result, 真实报错, 预测报错)
         print(f"\n**********Verifying ID: {query['id']}**********")
         try:
             for idx, error_version in enumerate(error_versions):
+                # 已在断点日志中完成的 error version 直接复用结果
+                if self.journal is not None and self.journal.is_done(model_type, query['id'], idx):
+                    journaled_result = self.journal.get(model_type, query['id'], idx)
+                    if journaled_result is not None and PENDING_JUDGE_KEY in journaled_result:
+                        # 检测已完成、只差 error_message 评分：不重新检测，加入批量评分
+                        pending = journaled_result[PENDING_JUDGE_KEY]
+                        journaled_result = {key: value for key, value in journaled_result.items()
+                                            if key != PENDING_JUDGE_KEY}
+                        batch_judged.append((idx, journaled_result, pending['ground_truth_error_message'],
+                                             pending['llm_error_message']))
+                    if journaled_result is not None:
+                        eval_results.append(journaled_result)
+                    log.append(f"\n--- Error Version {idx + 1}/{len(error_versions)} restored from journal ---")
+                    continue
+
                 retries = 0  # 重试计数器
                 success = False  # 标记是否成功处理
 
@@ -413,19 +472,28 @@ class ErrorVerifierAgent(GenericAgent):
                             print(
                                 f"\n...............Verifying error version {idx + 1}/{len(error_versions)} (Attempt {retries + 1})...............")
 
-                            result = self.generate(prompt, model_type=model_type, code=modified_code)
-
-                            # Locate the first curly brace to the last one for extracting the JSON object
-                            start_index = result.rfind('{')
-                            end_index = result.rfind('}')
-
-                            if start_index == -1 or end_index == -1:
-                                raise ValueError("No valid JSON found in the LLM response.")
-
-                            # Extract and parse JSON
-                            json_str = result[start_index:end_index + 1]
-                            # cleaned_json_str = clean_json_string(json_str)
-                            llm_output = json.loads(json_str)
+                            # 重试时不复用缓存中解析失败的回答
+                            result = yield LLMCall(self.build_messages(prompt, modified_code), model_type,
+                                                  refresh=retries > 0,
+                                                  **self._json_stop(stop_at_json, 'object', DUCK_KEYS),
+                                                  **self._guided(guided_json, SINGLE_BUG_SCHEMA))
+                            if result is None:
+                                raise ValueError("No response from the LLM (request failed after retries).")
+
+                            # 约束解码的回答本身就是 JSON，否则从回答文本中提取
+                            llm_output = parse_guided_json(result)
+                            if not isinstance(llm_output, dict):
+                                # Locate the first curly brace to the last one for extracting the JSON object
+                                start_index = result.rfind('{')
+                                end_index = result.rfind('}')
+
+                                if start_index == -1 or end_index == -1:
+                                    raise ValueError("No valid JSON found in the LLM response.")
+
+                                # Extract and parse JSON
+                                json_str = result[start_index:end_index + 1]
+                                # cleaned_json_str = clean_json_string(json_str)
+                                llm_output = json.loads(json_str)
 
                             information = {
                                 'ground_truth': ground_truth,
@@ -438,50 +506,29 @@ class ErrorVerifierAgent(GenericAgent):
                             # Get exact match scores for cause_line, effect_line, error_type
                             exact_scores = self.exact_match_evaluator.evaluate_single_bug(llm_output, ground_truth)
                             
-                            # Get LLM evaluation for error_message only
-                            error_message_prompt = f"""You are provided with the following error message analysis:
-
-### Ground Truth Error Message:
-{ground_truth.get('execution_output', '')}
-
-### LLM Output Error Message:
-{llm_output.get('error_message', '')}
-
-### Evaluation Task:
-Evaluate the LLM's error message against the Ground Truth error message.
-
-### Evaluation Criteria:
-- **1.0**: The error message in the LLM Output **exactly matches** the Ground Truth (including all key details).
-- **0.75**: The error message is **mostly correct** but lacks minor details.
-- **0.5**: The error message is **partially correct** but contains vague or incomplete information.
-- **0.25**: The error message is **only loosely related** to the Ground Truth.
-- **0.0**: The error message is **completely irrelevant or incorrect**.
-
-### Output Format:
-```json
-{{
-    "error_message_score": 0.0/0.25/0.5/0.75/1.0,
-    "error_message_eval_reason": "Scoring justification (in English)"
-}}
-```"""
-
-                            messages = []
-                            messages.append({"role": "system", "content": ''})
-                            messages.append({"role": "user", "content": error_message_prompt})
-                            
-                            error_message_completion = completion_with_backoff(messages, 'openai/gpt-oss-120b')
-                            
-                            start_index = error_message_completion.rfind('{')
-                            end_index = error_message_completion.rfind('}')
-                            json_str = error_message_completion[start_index:end_index + 1]
-                            error_message_result = json.loads(json_str)
-                            
-                            # Combine exact match scores with LLM error message score
-                            eval_result = {
-                                **exact_scores,
-                                'error_message_score': error_message_result.get('error_message_score', 0.0),
-                                'error_message_eval_reason': error_message_result.get('error_message_eval_reason', '')
-                            }
+                            if batch_judge:
+                                # error_message 留到所有 error version 检测完后一并评分；
+                                # 检测结果先连同待评分的报错对写入断点日志，--resume 时只需重新评分
+                                eval_result = dict(exact_scores)
+                                pending = {'ground_truth_error_message': ground_truth.get('execution_output', ''),
+                                           'llm_error_message': llm_output.get('error_message', '')}
+                                batch_judged.append((idx, eval_result, pending['ground_truth_error_message'],
+                                                     pending['llm_error_message']))
+                                journal_result = {**eval_result, PENDING_JUDGE_KEY: pending}
+                            else:
+                                # Score error_message locally, or with the LLM judge if ambiguous
+                                error_message_result = yield from self._score_error_message(
+                                    ground_truth.get('execution_output', ''), llm_output.get('error_message', ''),
+                                    tiered_judge, stop_at_json, guided_json, refresh=retries > 0
+                                )
+
+                                # Combine exact match scores with LLM error message score
+                                eval_result = {
+                                    **exact_scores,
+                                    'error_message_score': error_message_result.get('error_message_score', 0.0),
+                                    'error_message_eval_reason': error_message_result.get('error_message_eval_reason', '')
+                                }
+                                journal_result = eval_result
                             eval_results.append(eval_result)
 
                             # Log comparison result
@@ -492,51 +539,96 @@ Evaluate the LLM's error message against the Ground Truth error message.
 
                             # 如果成功处理，设置 success 为 True
                             success = True
+                            if self.journal is not None:
+                                self.journal.record(model_type, query['id'], idx, journal_result)
 
                         else:
                             break  # 如果没有错误信息，跳过该 error_version
 
+                    except BatchPending:
+                        # 其余 error version 的请求照常排队，同一轮批处理一并提交
+                        batch_pending = True
+                        break
+
                     except (ValueError, json.JSONDecodeError, KeyError, TypeError, RetryError) as e:
                         retries += 1
                         log.append(f"Error encountered in Attempt {retries}: {str(e)}")
                         print(f"Error in Attempt {retries}: {str(e)}")
                         # traceback.print_exc()
 
-                # 如果重试次数用尽仍未成功
-                if not success:
+                # 如果重试次数用尽仍未成功（没有报错信息而跳过的 error version 不算失败）
+                if not success and not batch_pending and retries >= MAX_RETRIES:
+                    failed = True
                     log.append(f"Failed to process Error Version {idx + 1} after {MAX_RETRIES} attempts.")
                     print(f"Failed to process Error Version {idx + 1} after {MAX_RETRIES} attempts.")
 
+            if batch_pending:
+                raise BatchPending(f"Query {query['id']} is waiting for batch responses")
+
+            # 所有 error version 的 error_message 用一次批量评分请求完成，已评分的在重试时直接复用
+            if batch_judged:
+                verdicts = None
+                for attempt in range(MAX_RETRIES):
+                    try:
+                        verdicts = yield from self._score_error_messages(
+                            [(gt_message, llm_message) for _, _, gt_message, llm_message in batch_judged],
+                            tiered_judge, stop_at_json, guided_json, refresh=attempt > 0
+                        )
+                        break
+                    except (ValueError, json.JSONDecodeError, KeyError, TypeError, RetryError) as e:
+                        log.append(f"Error in batched error message scoring (Attempt {attempt + 1}): {str(e)}")
+                        print(f"Error in batched error message scoring (Attempt {attempt + 1}): {str(e)}")
+
+                if verdicts is None:
+                    # 检测结果保留在断点日志中，--resume 时只重新评分
+                    failed = True
+                    unscored = {id(eval_result) for _, eval_result, _, _ in batch_judged}
+                    eval_results = [eval_result for eval_result in eval_results if id(eval_result) not in unscored]
+                    log.append(f"Failed to score the error messages after {MAX_RETRIES} attempts.")
+                    print(f"Failed to score the error messages after {MAX_RETRIES} attempts.")
+                else:
+                    for (idx, eval_result, _, _), verdict in zip(batch_judged, verdicts):
+                        eval_result.update(verdict)
+                        log.append(f"Eval Result (Error Version {idx + 1}): {eval_result}")
+                        if self.journal is not None:
+                            self.journal.record(model_type, query['id'], idx, eval_result)
+
+        except BatchPending:
+            batch_pending = True
+            raise
 
         except (ValueError, json.JSONDecodeError, KeyError) as e:
+            failed = True
             print(f"Exception occurred: {str(e)}")
 
         finally:
-            # Save all results to a file
-            if result_file:
-                # Use custom result file path
-                result_file_path = result_file
-                # Convert to absolute path if it's relative, but use eval_folder as base
-                if not os.path.isabs(result_file_path):
-                    result_file_path = os.path.join(eval_folder, result_file_path)
-            else:
-                # Use default naming convention
-                result_file_path = os.path.join(eval_folder, f'eval_{model_type.replace("/", "_").replace(":", "_")}_rubber_duck_case_study_on_bench_v3.jsonl')
-            
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(result_file_path), exist_ok=True)
-            
-            with open(result_file_path, 'a') as jsonl_file:
+            # Save all results to a file, unless the query is rerun in the next batch round or failed:
+            # a failed query returns None, so no partial line is written and --resume retries it
+            if not batch_pending and not failed:
+                if result_file:
+                    # Use custom result file path, relative paths are based on eval_folder
+                    result_file_path = resolve_result_file_path(result_file, eval_folder)
+                else:
+                    # Use default naming convention
+                    result_file_path = os.path.join(eval_folder, f'eval_{model_type.replace("/", "_").replace(":", "_")}_rubber_duck_case_study_on_bench_v3.jsonl')
+
+                # Ensure directory exists
+                os.makedirs(os.path.dirname(result_file_path), exist_ok=True)
+
                 eval_result_dict = {
                     'id': query['id'],
                     'eval_result': eval_results
                 }
-                jsonl_file.write(json.dumps(eval_result_dict) + '\n')
+                append_jsonl(result_file_path, eval_result_dict)
 
+        if failed:
+            return None
         log_string = "\n".join(log)
         return log_string, eval_results
 
-    def multi_rubber_duck_eval(self, queries, model_type, eval_folder, individual_workspace, result_file=None):
+    @llm_steps
+    def multi_rubber_duck_eval(self, queries, model_type, eval_folder, individual_workspace, result_file=None,
+                               stop_at_json=False, guided_json=False, tiered_judge=False, batch_judge=False):
         log = []
         query = queries
 
@@ -550,6 +642,9 @@ Evaluate the LLM's error message against the Ground Truth error message.
 
         MAX_RETRIES = 5
         eval_results = []  # Will store list of lists of single-error eval results
+        batch_pending = False
+        failed = False  # Retries used up: return None so that the instruction is not journaled
+        batch_judged = []  # (eval result, predicted message) of the errors scored together in batch_judge mode
         print(f"\n**********Verifying ID: {query['id']}**********")
         try:
             retries = 0
@@ -579,22 +674,30 @@ Evaluate the LLM's error message against the Ground Truth error message.
                         print(
                             f"\n...............Verifying error {query['id']} (Attempt {retries + 1})...............")
 
-                        result = self.generate(prompt, model_type=model_type, code=modified_code)
+                        # A retry does not reuse a cached answer that failed to parse
+                        result = yield LLMCall(self.build_messages(prompt, modified_code), model_type,
+                                              refresh=retries > 0,
+                                              **self._json_stop(stop_at_json, 'list', DUCK_KEYS),
+                                              **self._guided(guided_json, MULTI_BUG_SCHEMA))
+                        if result is None:
+                            raise ValueError("No response from the LLM (request failed after retries).")
 
                         # start_index = result.rfind('[')  # Expecting JSON list now for multi-bug detection
                         # end_index = result.rfind(']')
 
-                        match = re.search(r"\[\s*\{.*?\}\s*\]", result, re.DOTALL)
+                        llm_output_errors = parse_guided_json(result)
+                        if not isinstance(llm_output_errors, list):
+                            match = re.search(r"\[\s*\{.*?\}\s*\]", result, re.DOTALL)
 
-                        if match:
-                            json_list_str = match.group(0)
-                        else:
-                            json_list_str = None
+                            if match:
+                                json_list_str = match.group(0)
+                            else:
+                                raise ValueError("No valid JSON List found in the LLM response (Error Detection).")
 
-                        # if start_index == -1 or end_index == -1:
-                            # raise ValueError("No valid JSON List found in the LLM response (Error Detection).")
+                            # if start_index == -1 or end_index == -1:
+                                # raise ValueError("No valid JSON List found in the LLM response (Error Detection).")
 
-                        llm_output_errors = json.loads(json_list_str)
+                            llm_output_errors = json.loads(json_list_str)
 
                         # json_list_str = result[start_index:end_index + 1]
                         # cleaned_json_list_str = clean_json_string(json_list_str)
@@ -603,6 +706,7 @@ Evaluate the LLM's error message against the Ground Truth error message.
                         log.append(f"LLM Output (Error Detection): {json.dumps(llm_output_errors, indent=2)}")
 
                         single_error_eval_results = []  # List to store eval results for each detected error
+                        batch_judged = []
                         for llm_error_index, llm_error in enumerate(
                                 llm_output_errors):  # Loop through each detected error
                             information_single_error = {
@@ -616,44 +720,25 @@ Evaluate the LLM's error message against the Ground Truth error message.
                             # Get exact match scores for cause_line, effect_line, error_type
                             exact_scores = self.exact_match_evaluator.evaluate_single_bug(llm_error, ground_truth_info[0] if ground_truth_info else {})
                             
-                            # Get LLM evaluation for error_message only
-                            error_message_prompt = f"""You are provided with the following error message analysis:
-
-### Ground Truth Error Message:
-{ground_truth_info[0].get('error_message', '') if ground_truth_info else ''}
-
-### LLM Output Error Message:
-{llm_error.get('error_message', '')}
-
-### Evaluation Task:
-Evaluate the LLM's error message against the Ground Truth error message.
-
-### Evaluation Criteria:
-- **1.0**: The error message in the LLM Output **exactly matches** the Ground Truth (including all key details).
-- **0.75**: The error message is **mostly correct** but lacks minor details.
-- **0.5**: The error message is **partially correct** but contains vague or incomplete information.
-- **0.25**: The error message is **only loosely related** to the Ground Truth.
-- **0.0**: The error message is **completely irrelevant or incorrect**.
-
-### Output Format:
-```json
-{{
-    "error_message_score": 0.0/0.25/0.5/0.75/1.0,
-    "error_message_eval_reason": "Scoring justification (in English)"
-}}
-```"""
-
-                            messages = []
-                            messages.append({"role": "system", "content": ''})
-                            messages.append({"role": "user", "content": error_message_prompt})
-                            
-                            error_message_completion = completion_with_backoff(messages, 'openai/gpt-oss-120b')
-                            
-                            start_index = error_message_completion.rfind('{')
-                            end_index = error_message_completion.rfind('}')
-                            json_str = error_message_completion[start_index:end_index + 1]
-                            error_message_result = json.loads(json_str)
-                            
+                            if batch_judge:
+                                # Score all detected errors together after the loop
+                                single_error_eval_result = dict(exact_scores)
+                                single_error_eval_results.append(single_error_eval_result)
+                                batch_judged.append((single_error_eval_result, llm_error.get('error_message', '')))
+                                continue
+
+                            # Score error_message locally, or with the LLM judge if ambiguous
+                            try:
+                                error_message_result = yield from self._score_error_message(
+                                    ground_truth_info[0].get('error_message', '') if ground_truth_info else '',
+                                    llm_error.get('error_message', ''), tiered_judge, stop_at_json, guided_json,
+                                    refresh=retries > 0
+                                )
+                            except BatchPending:
+                                # Queue the judge requests of the remaining errors in the same round
+                                batch_pending = True
+                                continue
+
                             # Combine exact match scores with LLM error message score
                             single_error_eval_result = {
                                 **exact_scores,
@@ -665,6 +750,9 @@ Evaluate the LLM's error message against the Ground Truth error message.
                             log.append(
                                 f"  Error {llm_error_index + 1} Eval Result: {json.dumps(single_error_eval_result, indent=2)}")
 
+                        if batch_pending:
+                            raise BatchPending(f"Query {query['id']} is waiting for batch responses")
+
                         eval_results.append(
                             single_error_eval_results)  # Append list of single-error results for this error_version
                         success = True
@@ -677,35 +765,67 @@ Evaluate the LLM's error message against the Ground Truth error message.
                     log.append(f"Error encountered in Attempt {retries}: {str(e)}")
                     print(f"Error in Attempt {retries}: {str(e)}")
 
-            if not success:
+            if not success and retries >= MAX_RETRIES:
+                failed = True
                 log.append(f"Failed to process Error Version {query['id']} after {MAX_RETRIES} attempts.")
                 print(f"Failed to process Error Version {query['id']} after {MAX_RETRIES} attempts.")
 
+            # One judge request for all detected errors of the query, retried on its own so that
+            # a judge failure does not rerun the detection
+            if success and batch_judged:
+                ground_truth_message = ground_truth_info[0].get('error_message', '') if ground_truth_info else ''
+                verdicts = None
+                for attempt in range(MAX_RETRIES):
+                    try:
+                        verdicts = yield from self._score_error_messages(
+                            [(ground_truth_message, llm_message) for _, llm_message in batch_judged],
+                            tiered_judge, stop_at_json, guided_json, refresh=attempt > 0
+                        )
+                        break
+                    except (ValueError, json.JSONDecodeError, KeyError) as e:
+                        log.append(f"Error in batched error message scoring (Attempt {attempt + 1}): {str(e)}")
+                        print(f"Error in batched error message scoring (Attempt {attempt + 1}): {str(e)}")
+
+                if verdicts is None:
+                    failed = True
+                    eval_results = []
+                    log.append(f"Failed to score the error messages after {MAX_RETRIES} attempts.")
+                    print(f"Failed to score the error messages after {MAX_RETRIES} attempts.")
+                else:
+                    for llm_error_index, ((single_error_eval_result, _), verdict) in enumerate(zip(batch_judged, verdicts)):
+                        single_error_eval_result.update(verdict)
+                        log.append(
+                            f"  Error {llm_error_index + 1} Eval Result: {json.dumps(single_error_eval_result, indent=2)}")
+
+        except BatchPending:
+            batch_pending = True
+            raise
 
         except (ValueError, json.JSONDecodeError, KeyError) as e:
+            failed = True
             print(f"Exception occurred: {str(e)}")
 
         finally:
-            # Save all results to a file
-            if result_file:
-                # Use custom result file path
-                result_file_path = result_file
-                # Convert to absolute path if it's relative, but use eval_folder as base
-                if not os.path.isabs(result_file_path):
-                    result_file_path = os.path.join(eval_folder, result_file_path)
-            else:
-                # Use default naming convention
-                result_file_path = os.path.join(eval_folder, f'eval_{model_type.replace("Qwen/", "").replace(":", "_")}_multi_rubber_duck_CoT_on_multi_bench_v2.jsonl')
-            
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(result_file_path), exist_ok=True)
-            
-            with open(result_file_path, 'a') as jsonl_file:
+            # Save all results to a file, unless the query is rerun in the next batch round or failed:
+            # a failed query returns None, so no partial line is written and --resume retries it
+            if not batch_pending and not failed:
+                if result_file:
+                    # Use custom result file path, relative paths are based on eval_folder
+                    result_file_path = resolve_result_file_path(result_file, eval_folder)
+                else:
+                    # Use default naming convention
+                    result_file_path = os.path.join(eval_folder, f'eval_{model_type.replace("Qwen/", "").replace(":", "_")}_multi_rubber_duck_CoT_on_multi_bench_v2.jsonl')
+
+                # Ensure directory exists
+                os.makedirs(os.path.dirname(result_file_path), exist_ok=True)
+
                 eval_result_dict = {
                     'id': query['id'],
                     'eval_result': eval_results  # Now contains list of lists of single-error evaluations
                 }
-                jsonl_file.write(json.dumps(eval_result_dict) + '\n')
+                append_jsonl(result_file_path, eval_result_dict)
 
+        if failed:
+            return None
         log_string = "\n".join(log)
         return log_string, eval_results
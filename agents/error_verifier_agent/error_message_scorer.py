@@ -0,0 +1,237 @@
+"""
+Tiered Error Message Scorer for DSDBench
+Scores clear cases of error messages locally and only asks the LLM judge about the ambiguous ones
+"""
+import json
+import re
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from agents.generic_agent import LLMCall
+from agents.utils import fill_in_placeholders
+from .exact_match_evaluator import create_exact_match_evaluator
+from .prompt import ERROR_MESSAGE_JUDGE_PROMPT, ERROR_MESSAGE_BATCH_JUDGE_PROMPT
+from .schema import parse_guided_json
+
+JUDGE_MODEL = 'openai/gpt-oss-120b'
+# 流式输出中评分 JSON 必须包含的键（批量评分时为列表中每一项）
+JUDGE_KEYS = ('error_message_score',)
+BATCH_JUDGE_KEYS = ('pair_id', 'error_message_score')
+# 计算词重叠时忽略的虚词，否则 "by"、"the" 之类会让毫不相关的报错也有重叠；引号内的值不过滤
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'from', 'into',
+    'as', 'is', 'are', 'was', 'were', 'be', 'been', 'it', 'its', 'this', 'that',
+})
+
+
+class ErrorMessageScorer:
+    """
+    Error message scorer with a local stage in front of the LLM judge.
+
+    The local stage settles the clear cases: identical messages after normalization score
+    1.0, and so do messages of the same exception type whose text contains every token of
+    the ground truth with little else. A different exception type whose text shares
+    (almost) no tokens with the ground truth scores 0.0. Token overlap ignores stopwords
+    outside quotes. Everything in between goes to
+    the judge. Verdicts are memoized by (ground truth message, predicted message).
+    `score_batch` judges all ambiguous pairs of a query in one request.
+    """
+
+    def __init__(self, match_threshold: float = 0.8, mismatch_threshold: float = 0.1, judge_model: str = JUDGE_MODEL):
+        self.match_threshold = match_threshold
+        self.mismatch_threshold = mismatch_threshold
+        self.judge_model = judge_model
+        self.exact_match_evaluator = create_exact_match_evaluator()
+        self._verdicts = {}
+        self._lock = threading.Lock()
+
+    def score(self, ground_truth_message: str, llm_message: str, tiered: bool = True, **judge_call):
+        """
+        Score a predicted error message; a generator for use with `yield from` in `llm_steps` methods.
+
+        Args:
+            ground_truth_message: Ground truth error message (last line of the traceback)
+            llm_message: Error message predicted by the LLM
+            tiered: Settle clear cases locally; False sends every new pair to the judge
+            **judge_call: Extra `LLMCall` arguments of the judge request
+
+        Returns:
+            Dictionary with error_message_score and error_message_eval_reason
+        """
+        key = (ground_truth_message or '', llm_message or '')
+        with self._lock:
+            verdict = self._verdicts.get(key)
+        if verdict is not None:
+            return verdict
+
+        verdict = self.local_verdict(*key) if tiered else None
+        if verdict is None:
+            return (yield from self._judge(key, judge_call))
+        return self._remember(key, verdict)
+
+    def score_batch(self, pairs: List[Tuple[str, str]], tiered: bool = True, batch_call=None, **judge_call):
+        """
+        Score several predicted error messages with at most one batched judge request.
+
+        Pairs that are not settled by the memo or the local stage are judged together. Pairs
+        missing from a malformed batch answer are judged one at a time with `score`.
+
+        Args:
+            pairs: (ground truth message, predicted message) pairs
+            tiered: Settle clear cases locally; False sends every new pair to the judge
+            batch_call: Extra `LLMCall` arguments of the batched judge request
+            **judge_call: Extra `LLMCall` arguments of single-pair judge requests
+
+        Returns:
+            List of verdicts in the order of `pairs`
+        """
+        keys = [(ground_truth_message or '', llm_message or '') for ground_truth_message, llm_message in pairs]
+        verdicts = {}
+        for key in keys:
+            with self._lock:
+                verdict = self._verdicts.get(key)
+            if verdict is None and tiered:
+                verdict = self.local_verdict(*key)
+                if verdict is not None:
+                    self._remember(key, verdict)
+            if verdict is not None:
+                verdicts[key] = verdict
+
+        pending = list(dict.fromkeys(key for key in keys if key not in verdicts))
+        if len(pending) > 1:
+            completion = yield LLMCall(self.batch_judge_messages(pending), self.judge_model,
+                                       purpose='error_message_judge', **(batch_call or {}))
+            for key, verdict in self.parse_batch_verdicts(completion, pending).items():
+                verdicts[key] = self._remember(key, verdict)
+        for key in pending:
+            if key not in verdicts:
+                verdicts[key] = yield from self._judge(key, judge_call)
+        return [verdicts[key] for key in keys]
+
+    def _judge(self, key, judge_call):
+        completion = yield LLMCall(self.judge_messages(*key), self.judge_model, purpose='error_message_judge',
+                                   **judge_call)
+        if completion is None:
+            raise ValueError("No response from the error message judge.")
+        return self._remember(key, self.parse_verdict(completion))
+
+    def _remember(self, key, verdict):
+        with self._lock:
+            self._verdicts[key] = verdict
+        return verdict
+
+    def local_verdict(self, ground_truth_message: str, llm_message: str) -> Optional[Dict[str, Any]]:
+        """Verdict of the local stage, or None if the case is ambiguous and needs the judge."""
+        ground_truth, llm = self._normalize(ground_truth_message), self._normalize(llm_message)
+        if not ground_truth:
+            return None
+        if not llm:
+            return self._verdict(0.0, "No error message was predicted.")
+        if ground_truth == llm:
+            return self._verdict(1.0, "The error messages are identical.")
+
+        gt_type, gt_tokens = self._split(ground_truth_message)
+        llm_type, llm_tokens = self._split(llm_message)
+        union = gt_tokens | llm_tokens
+        overlap = len(gt_tokens & llm_tokens) / len(union) if union else 1.0
+
+        same_type = gt_type.lower() == llm_type.lower()
+        if gt_type and same_type and gt_tokens <= llm_tokens and overlap >= self.match_threshold:
+            return self._verdict(1.0, f"Same exception type ({gt_type}) and the message contains every detail "
+                                      f"of the ground truth (token overlap {overlap:.2f}).")
+        if gt_type and llm_type and not same_type and overlap <= self.mismatch_threshold:
+            return self._verdict(0.0, f"Different exception type ({llm_type} instead of {gt_type}) and an "
+                                      f"unrelated message (token overlap {overlap:.2f}).")
+        return None
+
+    def judge_messages(self, ground_truth_message: str, llm_message: str):
+        prompt = fill_in_placeholders(ERROR_MESSAGE_JUDGE_PROMPT, {
+            'ground_truth_error_message': ground_truth_message,
+            'llm_error_message': llm_message,
+        })
+        return [{"role": "system", "content": ''}, {"role": "user", "content": prompt}]
+
+    def batch_judge_messages(self, pending: List[Tuple[str, str]]):
+        error_message_pairs = [
+            {'pair_id': pair_id, 'ground_truth_error_message': ground_truth_message, 'llm_error_message': llm_message}
+            for pair_id, (ground_truth_message, llm_message) in enumerate(pending, 1)
+        ]
+        prompt = fill_in_placeholders(ERROR_MESSAGE_BATCH_JUDGE_PROMPT, {
+            'error_message_pairs': json.dumps(error_message_pairs, indent=2, ensure_ascii=False),
+        })
+        return [{"role": "system", "content": ''}, {"role": "user", "content": prompt}]
+
+    @staticmethod
+    def parse_batch_verdicts(completion: Optional[str], pending: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+        """Verdicts of the well-formed entries of a batched judge completion, by pair; empty if it is malformed."""
+        if completion is None:
+            return {}
+        result = parse_guided_json(completion)
+        if not isinstance(result, list):
+            match = re.search(r"\[\s*\{.*\}\s*\]", completion, re.DOTALL)
+            try:
+                result = json.loads(match.group(0)) if match else []
+            except json.JSONDecodeError:
+                return {}
+        verdicts = {}
+        for entry in result if isinstance(result, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            pair_id, score = entry.get('pair_id'), entry.get('error_message_score')
+            if not isinstance(pair_id, int) or not 1 <= pair_id <= len(pending) \
+                    or not isinstance(score, (int, float)) or isinstance(score, bool):
+                continue
+            verdicts[pending[pair_id - 1]] = {
+                'error_message_score': score,
+                'error_message_eval_reason': entry.get('error_message_eval_reason', '')
+            }
+        return verdicts
+
+    @staticmethod
+    def parse_verdict(completion: str) -> Dict[str, Any]:
+        """Score and reason from a judge completion; raises ValueError/JSONDecodeError if malformed."""
+        result = parse_guided_json(completion)
+        if not isinstance(result, dict):
+            start_index = completion.rfind('{')
+            end_index = completion.rfind('}')
+            json_str = completion[start_index:end_index + 1]
+            result = json.loads(json_str)
+        return {
+            'error_message_score': result.get('error_message_score', 0.0),
+            'error_message_eval_reason': result.get('error_message_eval_reason', '')
+        }
+
+    @staticmethod
+    def _verdict(score: float, reason: str) -> Dict[str, Any]:
+        return {'error_message_score': score, 'error_message_eval_reason': f"Local match: {reason}"}
+
+    @staticmethod
+    def _normalize(message: str) -> str:
+        """Lowercase, collapse whitespace and drop a trailing period"""
+        if not message:
+            return ""
+        return re.sub(r'\s+', ' ', str(message)).strip().rstrip('.').lower()
+
+    def _split(self, message: str):
+        """Exception type (without module path, empty if there is none) and the tokens of the text"""
+        message = re.sub(r'\s+', ' ', str(message or '')).strip()
+        error_type = self.exact_match_evaluator._extract_error_type(message)
+        if error_type != message and re.fullmatch(r'[\w.]+', error_type):
+            text = message.split(':', 1)[1]
+            error_type = error_type.rsplit('.', 1)[-1]
+        else:
+            text, error_type = message, ''
+        return error_type, self._tokens(text.lower())
+
+    @staticmethod
+    def _tokens(text: str) -> Set[str]:
+        """Word tokens; stopwords count only inside quotes, where they are values such as column names"""
+        quoted = re.findall(r"'([^']*)'|\"([^\"]*)\"", text)
+        tokens = {token for value in quoted for token in re.findall(r'[a-z0-9_]+', ''.join(value))}
+        unquoted = re.sub(r"'[^']*'|\"[^\"]*\"", ' ', text)
+        return tokens | {token for token in re.findall(r'[a-z0-9_]+', unquoted) if token not in STOPWORDS}
+
+
+def create_error_message_scorer(**kwargs) -> ErrorMessageScorer:
+    """Factory function to create a tiered error message scorer"""
+    return ErrorMessageScorer(**kwargs)
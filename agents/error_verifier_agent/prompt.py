@@ -634,4 +634,60 @@ Your step-by-step reasoning process for error 2 here
     ... (and so on for all identified errors)
 ]```
 There will be more than one error in the code. Output your CoT reasoning first, followed by only ONE json block in your response.
-'''
\ No newline at end of file
+'''
+
+ERROR_MESSAGE_JUDGE_PROMPT = '''You are provided with the following error message analysis:
+
+### Ground Truth Error Message:
+{{ground_truth_error_message}}
+
+### LLM Output Error Message:
+{{llm_error_message}}
+
+### Evaluation Task:
+Evaluate the LLM's error message against the Ground Truth error message.
+
+### Evaluation Criteria:
+- **1.0**: The error message in the LLM Output **exactly matches** the Ground Truth (including all key details).
+- **0.75**: The error message is **mostly correct** but lacks minor details.
+- **0.5**: The error message is **partially correct** but contains vague or incomplete information.
+- **0.25**: The error message is **only loosely related** to the Ground Truth.
+- **0.0**: The error message is **completely irrelevant or incorrect**.
+
+### Output Format:
+```json
+{
+    "error_message_score": 0.0/0.25/0.5/0.75/1.0,
+    "error_message_eval_reason": "Scoring justification (in English)"
+}
+```'''
+
+
+ERROR_MESSAGE_BATCH_JUDGE_PROMPT = '''You are provided with the following pairs of error messages, each with a Ground Truth error message and an LLM Output error message:
+
+```json
+{{error_message_pairs}}
+```
+
+### Evaluation Task:
+For every pair, evaluate the LLM's error message against the Ground Truth error message of the same pair. Score each pair on its own.
+
+### Evaluation Criteria:
+- **1.0**: The error message in the LLM Output **exactly matches** the Ground Truth (including all key details).
+- **0.75**: The error message is **mostly correct** but lacks minor details.
+- **0.5**: The error message is **partially correct** but contains vague or incomplete information.
+- **0.25**: The error message is **only loosely related** to the Ground Truth.
+- **0.0**: The error message is **completely irrelevant or incorrect**.
+
+### Output Format:
+Output one entry per pair, in the order of the pairs:
+```json
+[
+    {
+        "pair_id": 1,
+        "error_message_score": 0.0/0.25/0.5/0.75/1.0,
+        "error_message_eval_reason": "Scoring justification (in English)"
+    },
+    ... (and so on for all pairs)
+]
+```'''
@@ -0,0 +1,66 @@
+# JSON schemas of the rubber-duck answers, for schema-constrained (guided) decoding.
+# They mirror the output formats of the prompts in prompt.py and the fields read by agent.py.
+import json
+
+SINGLE_BUG_SCHEMA = {
+    'title': 'single_bug',
+    'type': 'object',
+    'properties': {
+        'cause_line': {'type': 'string'},
+        'effect_line': {'type': 'string'},
+        'error_message': {'type': 'string'},
+    },
+    'required': ['cause_line', 'effect_line', 'error_message'],
+    'additionalProperties': False,
+}
+
+MULTI_BUG_SCHEMA = {
+    'title': 'multi_bug',
+    'type': 'array',
+    'items': {**SINGLE_BUG_SCHEMA, 'title': 'bug'},
+    'minItems': 1,
+}
+
+ERROR_MESSAGE_JUDGE_SCHEMA = {
+    'title': 'error_message_judge',
+    'type': 'object',
+    'properties': {
+        'error_message_score': {'type': 'number', 'enum': [0.0, 0.25, 0.5, 0.75, 1.0]},
+        'error_message_eval_reason': {'type': 'string'},
+    },
+    'required': ['error_message_score', 'error_message_eval_reason'],
+    'additionalProperties': False,
+}
+
+ERROR_MESSAGE_BATCH_JUDGE_SCHEMA = {
+    'title': 'error_message_batch_judge',
+    'type': 'array',
+    'items': {
+        'title': 'error_message_pair',
+        'type': 'object',
+        'properties': {
+            'pair_id': {'type': 'integer'},
+            **ERROR_MESSAGE_JUDGE_SCHEMA['properties'],
+        },
+        'required': ['pair_id', 'error_message_score', 'error_message_eval_reason'],
+        'additionalProperties': False,
+    },
+    'minItems': 1,
+}
+
+
+def parse_guided_json(text):
+    """
+    Parse an answer produced under one of the schemas above, i.e. bare JSON.
+
+    OpenAI structured outputs need an object at the top level, so a list schema comes
+    back wrapped as {"items": [...]} and is unwrapped here. Returns None for free-form
+    answers (CoT text around the JSON), which the callers parse as before.
+    """
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, dict) and list(value) == ['items'] and isinstance(value['items'], list):
+        return value['items']
+    return value
@@ -1 +1 @@
-from .generic_agent import GenericAgent
+from .generic_agent import GenericAgent, LLMCall, llm_steps
@@ -1,13 +1,129 @@
+import asyncio
+import functools
 from abc import ABC, abstractmethod
 
+from agents.config.openai import PROMPT_LAYOUT
+from agents.llm_usage import DEFAULT_PURPOSE, usage_tags
+from agents.openai_chatComplete import completion_with_backoff, acompletion_with_backoff
+from agents.utils import fill_in_placeholders, fill_in_placeholders_prefix_first, prompt_placeholders
+from agents.utils import print_filesys_struture
+
+
+class LLMCall:
+    """
+    A completion request yielded by an agent method decorated with `llm_steps`.
+
+    `stop_at_json` ('object' or 'list') streams the completion and stops it once a complete
+    JSON value with `required_keys` has arrived (see agents/json_stream.py). `json_schema`
+    constrains decoding to a JSON schema. `purpose` tags the call in the usage ledger
+    (see agents/llm_usage.py). `refresh` marks a retry after the previous answer was
+    rejected: the response cache is bypassed and its entry replaced.
+    """
+
+    def __init__(self, messages, model_type, backend='OpenRouter', stop_at_json=None, required_keys=(),
+                 purpose=DEFAULT_PURPOSE, json_schema=None, refresh=False):
+        self.messages = messages
+        self.model_type = model_type
+        self.backend = backend
+        self.stop_at_json = stop_at_json
+        self.required_keys = required_keys
+        self.purpose = purpose
+        self.json_schema = json_schema
+        self.refresh = refresh
+
+
+def llm_steps(func):
+    """
+    Turn a generator method that yields `LLMCall` requests into a regular agent method.
+
+    The generator receives each completion as the value of its `yield` expression and
+    returns the method's result. Calling the decorated method drives it with the blocking
+    `completion_with_backoff`; `GenericAgent.arun` drives the same generator on the event
+    loop with `acompletion_with_backoff`.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self.drive(func(self, *args, **kwargs))
+
+    wrapper.steps = func
+    return wrapper
+
+
 class GenericAgent(ABC):
     def __init__(self, workspace, **kwargs):
         self.workspace = workspace
         self.prompts = kwargs.get('prompts', {})
+        self.journal = kwargs.get('journal')
+        self.prompt_layout = kwargs.get('prompt_layout', PROMPT_LAYOUT)
 
     @abstractmethod
     def run(self, *args, **kwargs):
         pass
 
+    async def arun(self, method_name='run', **kwargs):
+        """
+        Async counterpart of calling agent method `method_name`.
+
+        Methods written with `llm_steps` are driven natively on the event loop; any other
+        method runs in a worker thread so it does not block the loop.
+        """
+        method = getattr(self, method_name)
+        steps = getattr(method, 'steps', None)
+        if steps is not None:
+            return await self.adrive(steps(self, **kwargs))
+        return await asyncio.to_thread(method, **kwargs)
+
+    def drive(self, steps):
+        """Run an `llm_steps` generator to completion with blocking completions."""
+        try:
+            call = next(steps)
+            while True:
+                try:
+                    with usage_tags(purpose=call.purpose):
+                        response = completion_with_backoff(call.messages, call.model_type, call.backend,
+                                                           call.stop_at_json, call.required_keys, call.json_schema,
+                                                           refresh=call.refresh)
+                except Exception as e:
+                    call = steps.throw(e)
+                else:
+                    call = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def adrive(self, steps):
+        """Run an `llm_steps` generator to completion, awaiting each completion."""
+        try:
+            call = next(steps)
+            while True:
+                try:
+                    with usage_tags(purpose=call.purpose):
+                        response = await acompletion_with_backoff(call.messages, call.model_type, call.backend,
+                                                                  call.stop_at_json, call.required_keys, call.json_schema,
+                                                                  refresh=call.refresh)
+                except Exception as e:
+                    call = steps.throw(e)
+                else:
+                    call = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+
     def get_prompt(self, prompt_type):
-        return self.prompts.get(prompt_type, '')
\ No newline at end of file
+        return self.prompts.get(prompt_type, '')
+
+    def fill_prompts(self, system_type, user_type, information):
+        """
+        System and user messages built from prompts `system_type` and `user_type`.
+
+        With the 'prefix' prompt layout, paragraphs with item-specific content are moved to
+        the end of the user message (see `fill_in_placeholders_prefix_first`). The workspace
+        structure is only listed if one of the prompts uses it.
+        """
+        system_prompt, user_prompt = self.prompts[system_type], self.prompts[user_type]
+        if 'workspace_structure' in prompt_placeholders(system_prompt, user_prompt):
+            information = {**information, 'workspace_structure': print_filesys_struture(self.workspace)}
+        if self.prompt_layout == 'prefix':
+            system_content, user_content = fill_in_placeholders_prefix_first(system_prompt, user_prompt, information)
+        else:
+            system_content = fill_in_placeholders(system_prompt, information)
+            user_content = fill_in_placeholders(user_prompt, information)
+        return [{"role": "system", "content": system_content}, {"role": "user", "content": user_content}]
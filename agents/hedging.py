@@ -0,0 +1,230 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+
+from agents.adaptive_concurrency import _percentile
+from agents.config.hedging import (
+    LLM_HEDGE, HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES, HEDGE_BUDGET, HEDGE_ALTERNATES
+)
+
+
+class HedgePolicy:
+    """
+    When to hedge requests to one (backend, model).
+
+    The hedge delay is a percentile of the in-flight latencies of successful requests, so
+    only the slowest requests get a duplicate. Hedges are capped at `budget` times the requests
+    seen, which bounds the extra load even while the provider is uniformly slow.
+    """
+
+    def __init__(self, name, percentile=0.95, min_delay=2.0, min_samples=20, budget=0.1, sample_size=200):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def start(self):
+        """Count a request; returns its hedge delay, or None while there are too few samples."""
+        with self._lock:
+            self.requests += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            return max(self.min_delay, _percentile(self._latencies, self.percentile))
+
+    def try_hedge(self):
+        """Take one hedge from the budget; False if it is used up."""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self):
+        with self._lock:
+            delay = _percentile(self._latencies, self.percentile) if self._latencies else None
+            return {'requests': self.requests, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins,
+                    'delay': round(max(self.min_delay, delay), 2) if delay is not None else None}
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def _policy_key(backend, model_type):
+    # Same key as agents/rate_limit.py, which accounts vLLM requests as 'vllm/<model>'
+    if backend == 'vLLM' and not model_type.startswith('vllm/'):
+        return backend, f'vllm/{model_type}'
+    return backend, model_type
+
+
+def get_hedge_policy(backend, model_type):
+    """Process-wide hedge policy for (backend, model), created from agents.config.hedging."""
+    key = _policy_key(backend, model_type)
+    with _policies_lock:
+        if key not in _policies:
+            _policies[key] = HedgePolicy(
+                f"{backend}/{model_type}", percentile=HEDGE_PERCENTILE, min_delay=HEDGE_MIN_DELAY,
+                min_samples=HEDGE_MIN_SAMPLES, budget=HEDGE_BUDGET
+            )
+        return _policies[key]
+
+
+def alternate_of(backend, model_type):
+    """(backend, model) a hedge of a request to (backend, model) is sent to."""
+    alt_backend, alt_model = HEDGE_ALTERNATES.get(backend, (backend, None))
+    return alt_backend, alt_model or model_type
+
+
+def record_latency(backend, model_type, latency):
+    """Record the in-flight time of a successful request (called by agents/rate_limit.py)."""
+    if LLM_HEDGE:
+        get_hedge_policy(backend, model_type).record(latency)
+
+
+def _throttling(backend, model_type, alt_backend, alt_model):
+    """True while either copy would wait for rate budget or a concurrency slot instead of being sent."""
+    from agents.rate_limit import is_throttling  # rate_limit reports latencies to this module
+    return any(is_throttling(*_policy_key(*key)) for key in {(backend, model_type), (alt_backend, alt_model)})
+
+
+def _spawn(fn, *args):
+    """Run fn on a new thread with the caller's context variables; returns its Future."""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='llm-hedge', daemon=True).start()
+    return future
+
+
+def _first_answer(finished, primary, policy):
+    """The first finished request that succeeded, or None."""
+    for future in finished:
+        if future.exception() is None and future.result() is not None:
+            if future is not primary:
+                policy.won()
+            return future
+    return None
+
+
+def hedged(backend, model_type, send):
+    """
+    Send a request and, if it is still running after the hedge delay, a duplicate.
+
+    No duplicate is sent while the request's or the duplicate's limiter is throttling:
+    it would only queue behind the requests already waiting.
+
+    A blocking request cannot be interrupted, so the losing copy runs to completion in
+    the background and its answer is discarded. `ahedged` cancels it instead.
+
+    Args:
+        backend: Backend the request goes to ('OpenRouter', 'THU', 'vLLM')
+        model_type: Model type/name
+        send: Callable (backend, model_type) -> answer, None if the request failed
+
+    Returns:
+        (answer, model): the first answer that is not None, or None if every copy failed,
+        and the model that gave it, which differs from `model_type` when a hedge to an
+        alternate model won
+    """
+    if not LLM_HEDGE:
+        return send(backend, model_type), model_type
+    policy = get_hedge_policy(backend, model_type)
+    delay = policy.start()
+    if delay is None:
+        return send(backend, model_type), model_type
+
+    primary = _spawn(send, backend, model_type)
+    try:
+        return primary.result(timeout=delay), model_type
+    except FutureTimeout:
+        pass
+    alt_backend, alt_model = alternate_of(backend, model_type)
+    if _throttling(backend, model_type, alt_backend, alt_model) or not policy.try_hedge():
+        return primary.result(), model_type
+
+    logging.info(f"Hedging request to {policy.name} after {delay:.1f}s with {alt_backend}/{alt_model}")
+    hedge = _spawn(send, alt_backend, alt_model)
+    models = {primary: model_type, hedge: alt_model}
+    pending = {primary, hedge}
+    errors = []
+    while pending:
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = _first_answer(finished, primary, policy)
+        if winner is not None:
+            return winner.result(), models[winner]
+        errors.extend(future.exception() for future in finished if future.exception() is not None)
+    if errors:
+        raise errors[0]
+    return None, model_type
+
+
+async def ahedged(backend, model_type, send):
+    """Async counterpart of `hedged`; `send` returns an awaitable and the losing copy is cancelled."""
+    if not LLM_HEDGE:
+        return await send(backend, model_type), model_type
+    policy = get_hedge_policy(backend, model_type)
+    delay = policy.start()
+    if delay is None:
+        return await send(backend, model_type), model_type
+
+    primary = asyncio.ensure_future(send(backend, model_type))
+    pending = {primary}
+    try:
+        finished, pending = await asyncio.wait(pending, timeout=delay)
+        if finished:
+            return primary.result(), model_type
+        alt_backend, alt_model = alternate_of(backend, model_type)
+        if _throttling(backend, model_type, alt_backend, alt_model) or not policy.try_hedge():
+            return await primary, model_type
+
+        logging.info(f"Hedging request to {policy.name} after {delay:.1f}s with {alt_backend}/{alt_model}")
+        hedge = asyncio.ensure_future(send(alt_backend, alt_model))
+        models = {primary: model_type, hedge: alt_model}
+        pending.add(hedge)
+        errors = []
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = _first_answer(finished, primary, policy)
+            if winner is not None:
+                return winner.result(), models[winner]
+            errors.extend(task.exception() for task in finished if task.exception() is not None)
+        if errors:
+            raise errors[0]
+        return None, model_type
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def hedge_stats():
+    with _policies_lock:
+        return {policy.name: policy.stats() for policy in _policies.values() if policy.requests}
+
+
+def log_hedge_stats():
+    if LLM_HEDGE:
+        logging.info(f"LLM hedging: {hedge_stats()}")
+        print(f"LLM hedging: {hedge_stats()}")
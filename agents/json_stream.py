@@ -0,0 +1,161 @@
+import json
+
+JSON_KINDS = ('object', 'list')
+
+
+class JsonStreamDetector:
+    """
+    Incremental detector of the first complete top-level JSON object or list in streamed text.
+
+    Text is scanned once as it arrives. Outside a candidate value only the opening bracket
+    matters, so prose and quotes before the JSON are ignored. Inside a candidate, strings
+    and escapes are tracked so that brackets in string values do not count. A balanced
+    candidate is accepted if it parses and has `required_keys` (in every item of a list).
+    Otherwise scanning goes on after it. A code fence resets the scan, so an unbalanced
+    brace in a code block cannot swallow the JSON that follows it.
+
+    A list may also arrive wrapped as {"items": [...]}, the form structured outputs use for
+    list schemas (see `response_format_of`). The wrapper is then accepted as a whole, so the
+    text ends with its closing brace and stays valid JSON; `value` is the unwrapped list.
+    """
+
+    def __init__(self, kind='object', required_keys=()):
+        if kind not in JSON_KINDS:
+            raise ValueError(f"Invalid JSON kind '{kind}', expected one of {JSON_KINDS}")
+        self.kind = kind
+        # A list is also looked for inside an {"items": [...]} wrapper
+        self.openers = '{' if kind == 'object' else '[{'
+        self.required_keys = set(required_keys)
+        self.text = ''
+        self.value = None
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self):
+        return self.value is not None
+
+    def feed(self, chunk):
+        """Add streamed text; returns True once a complete JSON value has been received."""
+        self.text += chunk
+        text = self.text
+        while self.value is None and self._pos < len(text):
+            char = text[self._pos]
+            if char == '`' and not self._in_string:
+                if self._pos + 3 > len(text):
+                    break  # wait for the rest of a possible fence
+                if text.startswith('```', self._pos):
+                    self._depth = 0
+                    self._pos += 3
+                    continue
+            if self._depth == 0:
+                if char in self.openers:
+                    self._start = self._pos
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0 and not self._accept(text[self._start:self._pos + 1]) \
+                        and self.kind == 'list' and text[self._start] == '{':
+                    # Not an {"items": [...]} wrapper: look for the list inside the object instead
+                    self._pos = self._start
+            self._pos += 1
+        return self.value is not None
+
+    def _accept(self, candidate):
+        """Take a balanced candidate as the value if it qualifies; returns True if it did."""
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        if self.kind == 'object':
+            if isinstance(value, dict) and self.required_keys <= value.keys():
+                self.value = value
+        else:
+            if isinstance(value, dict) and list(value) == ['items']:
+                value = value['items']
+            if isinstance(value, list) and value and all(
+                    isinstance(item, dict) and self.required_keys <= item.keys() for item in value):
+                self.value = value
+        return self.value is not None
+
+
+def make_detector(stop_at_json=None, required_keys=()):
+    """Fresh detector for one attempt of a request, or None if the request is not streamed."""
+    return JsonStreamDetector(stop_at_json, required_keys) if stop_at_json else None
+
+
+class StreamedCompletion:
+    """Text of a streamed completion, possibly cut short once its JSON was complete."""
+
+    def __init__(self, content, usage=None, stopped_early=False):
+        self.content = content
+        self.usage = usage
+        self.stopped_early = stopped_early
+
+
+def _chunk_delta(chunk):
+    choices = getattr(chunk, 'choices', None)
+    return choices[0].delta.content if choices else None
+
+
+def collect_stream(stream, detector):
+    """
+    Read an `openai` chat completion stream until it ends or `detector` sees complete JSON.
+
+    The stream is closed in either case; closing it early aborts the generation.
+    """
+    parts, usage = [], None
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            delta = _chunk_delta(chunk)
+            if delta:
+                parts.append(delta)
+                if detector.feed(delta):
+                    return StreamedCompletion(''.join(parts), usage, stopped_early=True)
+    finally:
+        stream.close()
+    return StreamedCompletion(''.join(parts), usage)
+
+
+async def acollect_stream(stream, detector):
+    """Async counterpart of `collect_stream` for `openai.AsyncOpenAI` streams."""
+    parts, usage = [], None
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            delta = _chunk_delta(chunk)
+            if delta:
+                parts.append(delta)
+                if detector.feed(delta):
+                    return StreamedCompletion(''.join(parts), usage, stopped_early=True)
+    finally:
+        await stream.close()
+    return StreamedCompletion(''.join(parts), usage)
+
+
+def parse_sse_line(line):
+    """
+    Parse one line of an OpenAI-style server-sent event stream.
+
+    Returns:
+        The decoded `data:` payload, None for other lines, or the string '[DONE]'
+    """
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    return data if data == '[DONE]' else json.loads(data)
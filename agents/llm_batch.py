@@ -0,0 +1,204 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from agents.config.batch import LLM_BATCH_DIR, LLM_BATCH_POLL_SECONDS, LLM_BATCH_TIMEOUT
+from agents.config.cassette import LLM_MODE
+from agents.utils import append_jsonl
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+
+class BatchPending(Exception):
+    """Raised instead of a completion whose request was queued for the next batch round."""
+
+
+def output_path_of(input_path):
+    """Provider output file expected for a batch input file."""
+    return input_path[:-len('_input.jsonl')] + '_output.jsonl'
+
+
+class BatchJob:
+    """
+    Offline batch rounds in the OpenAI Batch API JSONL format.
+
+    Requests are answered from the provider output files (`*_output.jsonl`) found in
+    `directory`. Any other request is queued instead of being sent, and `BatchPending`
+    is raised so the instruction stops where it needs the answer. `close_round` writes
+    the queued requests to one input file per (backend, model). Once the provider has
+    processed them, the next round gets further, until no request is left. Each request's
+    `custom_id` is its hash from agents/llm_cache.py, so identical prompts are sent once.
+    Requests the provider failed are answered with None, the same as a failed API call.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending_path = os.path.join(directory, 'pending.jsonl')
+        self.answers = {}
+        self.answered = 0
+        self.queued = 0
+        self._queued_keys = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        for path in sorted(glob.glob(os.path.join(directory, '*_output.jsonl'))):
+            self.ingest(path)
+
+    def ingest(self, path):
+        """Load the responses of a provider output file; returns how many were read."""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                response = entry.get('response') or {}
+                answer = None
+                if response.get('status_code') == 200 and not entry.get('error'):
+                    try:
+                        answer = response['body']['choices'][0]['message']['content']
+                    except (KeyError, IndexError, TypeError):
+                        pass
+                if answer is None:
+                    logging.error(f"Batch request {entry.get('custom_id')} failed: "
+                                  f"{entry.get('error') or response.get('body')}")
+                self.answers[entry['custom_id']] = answer
+                count += 1
+        return count
+
+    def answer(self, key, backend, model_type, messages, params):
+        """
+        Return the batch response to a request, or queue the request.
+
+        Raises:
+            BatchPending: If the request has no response yet
+        """
+        if key in self.answers:
+            with self._lock:
+                self.answered += 1
+            return self.answers[key]
+
+        with self._lock:
+            new = key not in self._queued_keys
+            if new:
+                self._queued_keys.add(key)
+                self.queued += 1
+        if new:
+            body = {'model': params.get('model', model_type), 'messages': messages}
+            body.update({k: v for k, v in params.items() if k not in ('model', 'stream')})
+            # Worker processes append to the same file; close_round runs in the parent
+            append_jsonl(self.pending_path, {
+                'backend': backend,
+                'model': model_type,
+                'request': {'custom_id': key, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': body},
+            }, ensure_ascii=False)
+        raise BatchPending(f"Request {key[:12]} to {model_type} is queued for the next batch round")
+
+    def close_round(self):
+        """
+        Write the queued requests to Batch API input files, one per (backend, model).
+
+        Returns:
+            List of (input file path, number of requests); empty if nothing is queued
+        """
+        groups = {}
+        if os.path.exists(self.pending_path):
+            with open(self.pending_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    request = entry['request']
+                    if request['custom_id'] not in self.answers:
+                        groups.setdefault((entry['backend'], entry['model']), {})[request['custom_id']] = request
+
+        rounds = [int(m.group(1)) for path in glob.glob(os.path.join(self.directory, 'round_*_input.jsonl'))
+                  if (m := re.match(r'round_(\d+)_', os.path.basename(path)))]
+        round_index = max(rounds, default=0) + 1
+
+        files = []
+        for (backend, model_type), requests in sorted(groups.items()):
+            name = re.sub(r'[^A-Za-z0-9._-]+', '_', f"{backend}_{model_type}")
+            path = os.path.join(self.directory, f"round_{round_index:03d}_{name}_input.jsonl")
+            with open(path, 'w', encoding='utf-8') as f:
+                for request in requests.values():
+                    f.write(json.dumps(request, ensure_ascii=False) + '\n')
+            files.append((path, len(requests)))
+
+        if os.path.exists(self.pending_path):
+            os.remove(self.pending_path)
+        with self._lock:
+            self._queued_keys.clear()
+        return files
+
+    def wait_for_outputs(self, input_paths, poll_seconds=LLM_BATCH_POLL_SECONDS, timeout=LLM_BATCH_TIMEOUT):
+        """
+        Block until the provider has written the output file of every input file, then ingest them.
+
+        Args:
+            input_paths: Input files of the round
+            poll_seconds: Seconds between checks for the output files
+            timeout: Seconds to wait at most; 0 or None waits forever
+
+        Returns:
+            Output files still missing when the timeout expired, empty once all are ingested
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        waiting = [output_path_of(path) for path in input_paths]
+        while waiting:
+            waiting = [path for path in waiting if not os.path.exists(path)]
+            if waiting:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return waiting
+                sleep = poll_seconds if deadline is None else min(poll_seconds, max(deadline - time.monotonic(), 0))
+                time.sleep(sleep)
+        for path in input_paths:
+            self.ingest(output_path_of(path))
+        return []
+
+    def stats(self):
+        with self._lock:
+            return {'responses': len(self.answers), 'answered': self.answered, 'queued': self.queued}
+
+
+_batch = None
+_configured = False
+_batch_lock = threading.RLock()
+
+
+def configure_batch(mode=None, directory=None):
+    """
+    Set up the process-wide batch job, e.g. from command line options.
+
+    Unset arguments fall back to agents.config.cassette and agents.config.batch. The
+    batch directory is exported to the environment so that worker processes use it too.
+    """
+    global _batch, _configured
+    mode = mode or LLM_MODE
+    directory = directory or LLM_BATCH_DIR
+    with _batch_lock:
+        _batch = BatchJob(directory) if mode == 'batch' else None
+        _configured = True
+    os.environ['LLM_BATCH_DIR'] = directory
+    return _batch
+
+
+def get_batch():
+    """Process-wide batch job, or None unless LLM_MODE is 'batch'."""
+    if not _configured:
+        with _batch_lock:
+            if not _configured:
+                configure_batch()
+    return _batch
+
+
+def log_batch_stats():
+    if _batch is not None:
+        logging.info(f"LLM batch: {_batch.stats()}")
+        print(f"LLM batch ({_batch.directory}): {_batch.stats()}")
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from agents.config.cache import LLM_CACHE_MODE, LLM_CACHE_PATH, LLM_CACHE_MAX_MB, LLM_CACHE_TTL_DAYS
+
+CACHE_MODES = ('off', 'readwrite', 'readonly', 'refresh')
+
+
+class LLMCache:
+    """
+    Persistent content-addressed cache of LLM responses in SQLite.
+
+    Entries are keyed by a SHA-256 over backend, model, messages and sampling params.
+    Only deterministic requests (temperature 0) are cached. The least recently used
+    entries are evicted once the cache exceeds `max_bytes`, and entries older than
+    `ttl_seconds` count as misses. The database can be shared by threads and worker
+    processes.
+    """
+
+    def __init__(self, path, mode='readwrite', max_bytes=None, ttl_seconds=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, backend TEXT, model TEXT, response TEXT, '
+                'size INTEGER, created REAL, accessed REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def key(backend, model_type, messages, params):
+        payload = json.dumps([backend, model_type, messages, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for a key, or None on a miss or in refresh mode."""
+        if self.mode == 'refresh':
+            return None
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+            if self.mode != 'readonly':
+                with conn:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        if self.mode != 'readonly':
+            with conn:
+                conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def put(self, key, backend, model_type, response):
+        if self.mode == 'readonly' or response is None:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, backend, model, response, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, backend, model_type, response, len(response.encode('utf-8')), now, now)
+            )
+        with self._lock:
+            self.writes += 1
+            self._writes_since_check += 1
+            check = self._writes_since_check >= 100
+            if check:
+                self._writes_since_check = 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under 90% of max_bytes."""
+        conn = self._connection()
+        evicted = 0
+        with conn:
+            if self.ttl_seconds is not None:
+                evicted += conn.execute('DELETE FROM responses WHERE created < ?',
+                                        (time.time() - self.ttl_seconds,)).rowcount
+            if self.max_bytes is not None:
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                target = self.max_bytes * 0.9
+                if total > self.max_bytes:
+                    for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+                        if total <= target:
+                            break
+                        conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                        total -= size
+                        evicted += 1
+        with self._lock:
+            self.evictions += evicted
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'mode': self.mode,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+            }
+
+
+_cache = None
+_configured = False
+_cache_lock = threading.RLock()
+
+
+def configure_cache(mode=None, path=None, max_mb=None, ttl_days=None):
+    """
+    Set up the process-wide cache, e.g. from command line options.
+
+    Unset arguments fall back to agents.config.cache. The chosen settings are exported
+    to the environment so that spawned worker processes use the same cache.
+    """
+    global _cache, _configured
+    mode = mode or LLM_CACHE_MODE
+    path = path or LLM_CACHE_PATH
+    max_mb = max_mb if max_mb is not None else LLM_CACHE_MAX_MB
+    ttl_days = ttl_days if ttl_days is not None else LLM_CACHE_TTL_DAYS
+    with _cache_lock:
+        _cache = None if mode == 'off' else LLMCache(
+            path, mode,
+            max_bytes=max_mb * 1e6 if max_mb else None,
+            ttl_seconds=ttl_days * 86400 if ttl_days else None
+        )
+        _configured = True
+    os.environ.update({'LLM_CACHE_MODE': mode, 'LLM_CACHE_PATH': path, 'LLM_CACHE_MAX_MB': str(max_mb or 0)})
+    if ttl_days:
+        os.environ['LLM_CACHE_TTL_DAYS'] = str(ttl_days)
+    return _cache
+
+
+def get_cache():
+    """Process-wide cache, or None when caching is off."""
+    if not _configured:
+        with _cache_lock:
+            if not _configured:
+                configure_cache()
+    return _cache
+
+
+def log_cache_stats():
+    if _cache is not None:
+        logging.info(f"LLM cache: {_cache.stats()}")
+        print(f"LLM cache ({_cache.path}): {_cache.stats()}")
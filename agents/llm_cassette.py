@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from agents.config.cassette import LLM_MODE, LLM_CASSETTE, LLM_REPLAY_LATENCY
+from agents.utils import append_jsonl
+
+LLM_MODES = ('live', 'record', 'replay', 'batch')
+
+
+class Cassette:
+    """
+    JSONL recording of LLM exchanges for offline runs.
+
+    In record mode every answered request is appended with its key, messages, params,
+    response and latency; failed calls (no response) are not recorded. In replay mode responses are served by request key in the order they
+    were recorded. The last response of a key is repeated once its recordings are used
+    up. A request that was never recorded is logged and answered with None, the same
+    as a failed API call, so nothing reaches the network.
+    """
+
+    def __init__(self, path, mode, latency_scale=0.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Invalid cassette mode '{mode}', expected 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+        self._responses = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        if mode == 'replay':
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Cassette {path} does not exist, record it first with --llm-mode record")
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line of an interrupted recording
+                    if entry.get('response') is None:
+                        continue  # failed call in a cassette recorded before they were skipped
+                    self._responses[entry['key']].append((entry['response'], entry.get('latency') or 0.0))
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def record(self, key, backend, model_type, messages, params, response, latency):
+        if response is None:
+            return
+        append_jsonl(self.path, {
+            'key': key,
+            'backend': backend,
+            'model': model_type,
+            'params': params,
+            'messages': messages,
+            'response': response,
+            'latency': round(latency, 4),
+        }, ensure_ascii=False)
+        with self._lock:
+            self.recorded += 1
+
+    def _next(self, key):
+        with self._lock:
+            recordings = self._responses.get(key)
+            if not recordings:
+                self.missing += 1
+                logging.error(f"No recorded response in {self.path} for request {key}")
+                return None, 0.0
+            self.replayed += 1
+            return recordings.popleft() if len(recordings) > 1 else recordings[0]
+
+    def replay(self, key):
+        response, latency = self._next(key)
+        if self.latency_scale and latency:
+            time.sleep(latency * self.latency_scale)
+        return response
+
+    async def areplay(self, key):
+        response, latency = self._next(key)
+        if self.latency_scale and latency:
+            await asyncio.sleep(latency * self.latency_scale)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'mode': self.mode, 'recorded': self.recorded,
+                    'replayed': self.replayed, 'missing': self.missing}
+
+
+_cassette = None
+_configured = False
+_cassette_lock = threading.RLock()
+
+
+def configure_cassette(mode=None, path=None, latency_scale=None):
+    """
+    Set up the process-wide cassette, e.g. from command line options.
+
+    Unset arguments fall back to agents.config.cassette. The chosen settings are
+    exported to the environment so that worker processes use the same cassette.
+    """
+    global _cassette, _configured
+    mode = mode or LLM_MODE
+    path = path or LLM_CASSETTE
+    latency_scale = latency_scale if latency_scale is not None else LLM_REPLAY_LATENCY
+    if mode not in LLM_MODES:
+        raise ValueError(f"Invalid LLM mode '{mode}', expected one of {LLM_MODES}")
+    with _cassette_lock:
+        _cassette = Cassette(path, mode, latency_scale) if mode in ('record', 'replay') else None
+        _configured = True
+    os.environ.update({'LLM_MODE': mode, 'LLM_CASSETTE': path, 'LLM_REPLAY_LATENCY': str(latency_scale)})
+    return _cassette
+
+
+def get_cassette():
+    """Process-wide cassette, or None in live and batch mode."""
+    if not _configured:
+        with _cassette_lock:
+            if not _configured:
+                configure_cassette()
+    return _cassette
+
+
+def log_cassette_stats():
+    if _cassette is not None:
+        logging.info(f"LLM cassette: {_cassette.stats()}")
+        print(f"LLM cassette ({_cassette.path}): {_cassette.stats()}")
@@ -0,0 +1,97 @@
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+
+import httpx
+import openai
+from agents.config.openai import (
+    API_KEY, BASE_URL, MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS, KEEPALIVE_EXPIRY, HTTP2, REQUEST_TIMEOUT
+)
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {key: AsyncOpenAI}
+_lock = threading.Lock()
+
+
+def backend_credentials(backend):
+    """
+    API key and base URL of an OpenAI-compatible backend.
+
+    Raises:
+        ImportError: If the THU configuration is missing
+    """
+    if backend == 'THU':
+        from agents.config.openai import THU_API_KEY, THU_BASE_URL
+        return THU_API_KEY, THU_BASE_URL
+    return API_KEY, BASE_URL
+
+
+def _http_options():
+    return {
+        'limits': httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        'timeout': httpx.Timeout(REQUEST_TIMEOUT, connect=10.0),
+        'http2': HTTP2 and importlib.util.find_spec('h2') is not None,
+    }
+
+
+def get_client(backend='OpenRouter'):
+    """
+    Process-wide `openai.OpenAI` client for a backend, reused across calls and threads.
+
+    Clients are keyed by backend, base URL and process id, so connections kept alive by
+    a parent process are never shared with forked workers.
+
+    Args:
+        backend: Backend type ('OpenRouter', 'THU')
+
+    Returns:
+        openai.OpenAI client with a pooled, keep-alive HTTP transport
+    """
+    api_key, base_url = backend_credentials(backend)
+    key = (backend, base_url, os.getpid())
+    with _lock:
+        if key not in _clients:
+            _clients[key] = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,  # retries are paced by agents/rate_limit.py
+                http_client=httpx.Client(**_http_options()),
+            )
+        return _clients[key]
+
+
+def get_async_client(backend='OpenRouter'):
+    """
+    `openai.AsyncOpenAI` counterpart of `get_client`, shared within the running event loop.
+
+    httpx async connections are bound to the loop that opened them, so each loop gets
+    its own client, which is dropped together with the loop.
+    """
+    api_key, base_url = backend_credentials(backend)
+    loop = asyncio.get_running_loop()
+    key = (backend, base_url)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=httpx.AsyncClient(**_http_options()),
+            )
+        return clients[key]
+
+
+def close_clients():
+    """Close the pooled sync clients of this process (e.g. at the end of a run)."""
+    with _lock:
+        keys = [key for key in _clients if key[2] == os.getpid()]
+        clients = [_clients.pop(key) for key in keys]
+    for client in clients:
+        client.close()
@@ -0,0 +1,251 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from agents.config.ledger import LLM_LEDGER, LLM_LEDGER_PATH, LLM_LEDGER_RUN_ID, MODEL_PRICES
+from agents.utils import append_jsonl
+
+DEFAULT_PURPOSE = 'generation'
+
+# Tags of the LLM calls made in the current thread/task: agent, method, step, instruction id, purpose
+_usage_tags = contextvars.ContextVar('llm_usage_tags', default={})
+
+
+@contextmanager
+def usage_tags(**tags):
+    """Tag the LLM calls made inside the block (nested blocks add to the outer tags)."""
+    token = _usage_tags.set({**_usage_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _usage_tags.reset(token)
+
+
+def _field(value, name):
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def prompt_tokens_of(usage):
+    return _field(usage, 'prompt_tokens')
+
+
+def cached_tokens_of(usage):
+    """
+    Prompt tokens served from the provider's prompt cache or vLLM's prefix cache.
+
+    OpenAI-compatible servers report them as `usage.prompt_tokens_details.cached_tokens`
+    (vLLM only with --enable-prompt-tokens-details); None if the usage does not say.
+    """
+    return _field(_field(usage, 'prompt_tokens_details'), 'cached_tokens')
+
+
+def estimate_cost(model_type, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Cost in USD from agents.config.ledger.MODEL_PRICES, or None if the model has no price."""
+    prices = MODEL_PRICES.get(model_type) or MODEL_PRICES.get(model_type.replace('vllm/', '', 1))
+    if prices is None or prompt_tokens is None:
+        return None
+    cached_tokens = cached_tokens or 0
+    return ((prompt_tokens - cached_tokens) * prices['prompt']
+            + cached_tokens * prices.get('cached', prices['prompt'])
+            + (completion_tokens or 0) * prices['completion']) / 1e6
+
+
+class PromptCacheStats:
+    """Prompt tokens and the share of them that hit the prefix cache, per (backend, model)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.reported = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage):
+        prompt_tokens = prompt_tokens_of(usage)
+        if prompt_tokens is None:
+            return
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        cached_tokens = cached_tokens_of(usage)
+        if cached_tokens is not None:
+            self.reported += 1
+            self.cached_tokens += cached_tokens
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'hit_rate': round(self.cached_tokens / self.prompt_tokens, 3) if self.reported else None,
+        }
+
+
+class UsageLedger:
+    """
+    Append-only JSONL ledger of LLM calls.
+
+    Each entry carries the tokens, latency and cost of one call together with the tags
+    set by `usage_tags`. Worker processes append to the same file, and `rollup` sums the
+    entries of a run afterwards.
+    """
+
+    def __init__(self, path, run_id):
+        self.path = path
+        self.run_id = run_id
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, backend, model_type, usage=None, latency=None, source='api'):
+        prompt_tokens = prompt_tokens_of(usage)
+        completion_tokens = _field(usage, 'completion_tokens')
+        cached_tokens = cached_tokens_of(usage)
+        cost = _field(usage, 'cost')
+        if cost is None and source == 'api':
+            cost = estimate_cost(model_type, prompt_tokens, completion_tokens, cached_tokens)
+        tags = _usage_tags.get()
+        append_jsonl(self.path, {
+            'time': round(time.time(), 3),
+            'run_id': self.run_id,
+            'agent': tags.get('agent'),
+            'method': tags.get('method'),
+            'step': tags.get('step'),
+            'instruction_id': tags.get('instruction_id'),
+            'purpose': tags.get('purpose', DEFAULT_PURPOSE),
+            'backend': backend,
+            'model': model_type,
+            'source': source,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'latency': round(latency, 3) if latency is not None else None,
+            'cost': cost if source == 'api' else 0.0,
+        }, ensure_ascii=False)
+
+    def entries(self, run_id=None):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if run_id is None or entry.get('run_id') == run_id:
+                    yield entry
+
+    @staticmethod
+    def _summarize(entries, group_by):
+        groups = {}
+        for entry in entries:
+            for key in ('total', '|'.join(str(entry.get(field)) for field in group_by)):
+                group = groups.setdefault(key, {
+                    'calls': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                    'cached_tokens': 0, 'latency': 0.0, 'cost': 0.0, 'unpriced_calls': 0,
+                })
+                if entry['source'] == 'api':
+                    group['calls'] += 1
+                else:
+                    group['cache_hits'] += 1
+                for field in ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'latency', 'cost'):
+                    group[field] += entry.get(field) or 0
+                if entry.get('cost') is None:
+                    group['unpriced_calls'] += 1
+        for group in groups.values():
+            group['latency'] = round(group['latency'], 3)
+            group['cost'] = round(group['cost'], 6)
+        total = groups.pop('total', None)
+        return total, groups
+
+    def rollup(self, run_id=None):
+        """Totals of a run (or of the whole ledger), broken down by model/purpose and by step."""
+        entries = list(self.entries(run_id))
+        total, by_model = self._summarize(entries, ('backend', 'model', 'purpose'))
+        _, by_step = self._summarize(entries, ('agent', 'method', 'step'))
+        return {'total': total, 'by_model_purpose': by_model, 'by_agent_method_step': by_step}
+
+    def write_rollup(self, path):
+        """Write the rollup of the current run, and of all runs in the ledger, to a JSON file."""
+        summary = {'run_id': self.run_id, 'ledger': self.path,
+                   'run': self.rollup(self.run_id), 'all_runs': self.rollup()['total']}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+_ledger = None
+_configured = False
+_ledger_lock = threading.RLock()
+
+
+def configure_ledger(path=None, run_id=None):
+    """
+    Set up the process-wide usage ledger, e.g. next to the result file of a run.
+
+    A new run id is generated unless given. Path and run id are exported to the
+    environment so that worker processes write to the same ledger under the same run.
+    """
+    global _ledger, _configured
+    path = path or LLM_LEDGER_PATH
+    run_id = run_id or LLM_LEDGER_RUN_ID or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    with _ledger_lock:
+        _ledger = UsageLedger(path, run_id) if LLM_LEDGER and path else None
+        _configured = True
+    if _ledger is not None:
+        os.environ['LLM_LEDGER_PATH'] = path
+        os.environ['LLM_LEDGER_RUN_ID'] = run_id
+    return _ledger
+
+
+def get_ledger():
+    """Process-wide usage ledger, or None if no ledger path is configured."""
+    if not _configured:
+        with _ledger_lock:
+            if not _configured:
+                configure_ledger()
+    return _ledger
+
+
+def record_usage(backend, model_type, response, latency=None):
+    """Account the `usage` of a completion response to (backend, model) and the ledger."""
+    usage = getattr(response, 'usage', None)
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.record(backend, model_type, usage, latency)
+    if usage is None:
+        return
+    key = (backend, model_type)
+    with _stats_lock:
+        if key not in _stats:
+            _stats[key] = PromptCacheStats(f"{backend}/{model_type}")
+        _stats[key].record(usage)
+
+
+def record_cache_hit(backend, model_type, source='cache'):
+    """Ledger entry for a call answered without a request (response cache or cassette replay)."""
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.record(backend, model_type, source=source)
+
+
+def prompt_cache_stats():
+    with _stats_lock:
+        return {entry.name: entry.stats() for entry in _stats.values() if entry.requests}
+
+
+def log_prompt_cache_stats():
+    stats = prompt_cache_stats()
+    if stats:
+        logging.info(f"LLM prompt cache: {stats}")
+        print(f"LLM prompt cache: {stats}")
@@ -1,10 +1,22 @@
+import asyncio
 import logging
 import pdb
+import time
 import traceback
 
 import openai
 from agents.config.openai import API_KEY, BASE_URL, temperature
-from agents.vllm_client import vllm_completion_with_backoff, check_vllm_server_health
+from agents.adaptive_concurrency import backend_of
+from agents.hedging import hedged, ahedged
+from agents.json_stream import make_detector, collect_stream, acollect_stream
+from agents.llm_batch import get_batch
+from agents.llm_cache import LLMCache, get_cache
+from agents.llm_cassette import get_cassette
+from agents.llm_clients import get_client, get_async_client
+from agents.llm_usage import record_cache_hit
+from agents.rate_limit import send_with_retries, asend_with_retries
+from agents.vllm_client import vllm_completion_with_backoff, vllm_acompletion_with_backoff, check_vllm_server_health
+from agents.vllm_client import get_vllm_client
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -17,48 +29,253 @@ def print_chat_message(messages):
         logging.info(f"{message['role']}: {message['content']}")
 
 
-# @retry(wait=wait_random_exponential(min=0.1, max=20), stop=(stop_after_delay(30) | stop_after_attempt(100)))
-def completion_with_backoff(messages, model_type, backend='OpenRouter'):
+def response_format_of(json_schema):
+    """
+    OpenAI `response_format` that constrains the answer to `json_schema`.
+
+    Structured outputs need an object at the top level, so a list schema is wrapped in an
+    object with a single `items` property; the list stays the only JSON list in the answer.
+    """
+    if json_schema.get('type') == 'array':
+        json_schema = {
+            'type': 'object',
+            'properties': {'items': json_schema},
+            'required': ['items'],
+            'additionalProperties': False,
+        }
+    return {
+        'type': 'json_schema',
+        'json_schema': {'name': json_schema.get('title', 'answer'), 'strict': True, 'schema': json_schema},
+    }
+
+
+def _describe_request(messages, model_type, backend, json_schema=None):
+    """Backend, normalized model name and sampling params that identify a request."""
+    backend = backend_of(model_type, backend)
+    if backend == 'vLLM':
+        model_type = model_type if model_type.startswith('vllm/') else f'vllm/{model_type}'
+        request_data = get_vllm_client()._prepare_request_data(model_type, messages, guided_json=json_schema)
+        params = {k: v for k, v in request_data.items() if k != 'messages'}
+    else:
+        params = {'temperature': temperature}
+        if json_schema is not None:
+            params['response_format'] = response_format_of(json_schema)
+    return backend, model_type, params
+
+
+def _request_key(backend_name, model_name, messages, params, stop_at_json=None, required_keys=()):
+    """
+    Cache, cassette and batch key of a request.
+
+    An early-stopped stream ends at the first complete JSON value, so its text is keyed
+    apart from the full answer. The stop parameters are part of the key only, not of the
+    request body.
+    """
+    if stop_at_json:
+        params = {**params, 'stop_at_json': stop_at_json, 'required_keys': list(required_keys)}
+    return LLMCache.key(backend_name, model_name, messages, params)
+
+
+def _lookup(messages, model_type, backend, json_schema=None, stop_at_json=None, required_keys=(), refresh=False):
+    """
+    Resolve a request against the cassette and the response cache.
+
+    With `refresh` the cached response is not used; the caller rejected it, so the request
+    is sent again and its answer replaces the entry in `_store`.
+
+    Returns:
+        (request, answer): `answer` is the replayed or cached response, or None if the
+        request has to be sent; `request` is passed on to `_store`.
+    """
+    backend_name, model_name, params = _describe_request(messages, model_type, backend, json_schema)
+    key = _request_key(backend_name, model_name, messages, params, stop_at_json, required_keys)
+    cassette = get_cassette()
+    # Sampled responses are not reproducible, so only greedy decoding is cached
+    cache = get_cache() if params.get('temperature') == 0 else None
+    request = (key, backend_name, model_name, params, cassette, cache, time.monotonic())
+    return request, cache.get(key) if cache is not None and not refresh else None
+
+
+def _answer_from_batch(batch, request, messages):
+    key, backend_name, model_name, params = request[:4]
+    return batch.answer(key, backend_name, model_name, messages, params)
+
+
+def _store(request, messages, answer, from_cache):
+    key, backend_name, model_name, params, cassette, cache, started = request
+    if cache is not None and not from_cache:
+        cache.put(key, backend_name, model_name, answer)
+    if from_cache:
+        record_cache_hit(backend_name, model_name)
+    if cassette is not None:
+        cassette.record(key, backend_name, model_name, messages, params, answer, time.monotonic() - started)
+
+
+def completion_with_backoff(messages, model_type, backend='OpenRouter', stop_at_json=None, required_keys=(),
+                            json_schema=None, refresh=False):
     """
     Unified completion function supporting multiple backends.
     
+    Responses of deterministic requests are served from and stored in the on-disk
+    LLM cache when it is enabled (see agents/llm_cache.py). In record/replay mode
+    (see agents/llm_cassette.py) exchanges are recorded to or answered from a cassette.
+    In batch mode (see agents/llm_batch.py) requests without a batch response are
+    queued and raise `BatchPending` instead of being sent.
+    Requests stay within the per-model RPM/TPM limits and are retried with backoff on
+    rate limiting and server errors (see agents/rate_limit.py).
+    With `stop_at_json`, the completion is streamed and cancelled as soon as a complete
+    top-level JSON value has been received (see agents/json_stream.py).
+    With `json_schema`, decoding is constrained to the schema: `guided_json` on vLLM,
+    `response_format` on OpenAI-compatible backends.
+    With LLM_HEDGE enabled, a request that is slower than usual is duplicated, possibly to
+    an alternate backend, and the first answer wins (see agents/hedging.py). An answer of
+    an alternate model is returned but neither cached nor recorded under this model.
+    
     Args:
         messages: List of message dictionaries
         model_type: Model type/name
         backend: Backend type ('OpenRouter', 'THU', 'vLLM')
+        stop_at_json: 'object' or 'list' to stop at the first complete JSON value of that kind
+        required_keys: Keys the JSON object (or every item of the list) must have to count
+        json_schema: JSON schema the answer must follow, or None for free-form text
+        refresh: Bypass the response cache and replace its entry, for retries of a rejected answer
     
     Returns:
         Response content string or None if failed
     """
-    
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        backend_name, model_name, params = _describe_request(messages, model_type, backend, json_schema)
+        answer = cassette.replay(_request_key(backend_name, model_name, messages, params, stop_at_json, required_keys))
+        if answer is not None:
+            record_cache_hit(backend_name, model_name, source='replay')
+        return answer
+
+    request, answer = _lookup(messages, model_type, backend, json_schema, stop_at_json, required_keys, refresh)
+    from_cache = answer is not None
+    if not from_cache:
+        batch = get_batch()
+        if batch is not None:
+            answer = _answer_from_batch(batch, request, messages)
+        else:
+            answer, answered_by = hedged(backend_of(model_type, backend), model_type, lambda backend_name, model_name:
+                                         _completion(messages, model_name, backend_name, stop_at_json,
+                                                     required_keys, json_schema))
+            if answered_by != model_type:
+                return answer  # an alternate model answered: not cached or recorded as this model
+    _store(request, messages, answer, from_cache)
+    return answer
+
+
+def _completion(messages, model_type, backend, stop_at_json=None, required_keys=(), json_schema=None):
     # Check if model_type indicates vLLM usage
     if model_type.startswith('vllm/') or backend == 'vLLM':
-        return vllm_completion_with_backoff(messages, model_type)
+        return vllm_completion_with_backoff(messages, model_type, stop_at_json=stop_at_json,
+                                            required_keys=required_keys, guided_json=json_schema)
     
-    # Handle THU backend
-    if backend == 'THU':
-        try:
-            from agents.config.openai import THU_API_KEY, THU_BASE_URL
-            client = openai.OpenAI(
-                api_key=THU_API_KEY,
-                base_url=THU_BASE_URL,
-            )
-        except ImportError:
-            logging.error("THU API configuration not found. Please check your config.")
-            return None
-    else:
-        # Default OpenRouter backend
-        client = openai.OpenAI(
-            api_key=API_KEY,
-            base_url=BASE_URL,
-        )
+    # Pooled keep-alive client for OpenRouter (default) or THU
+    try:
+        client = get_client(backend)
+    except ImportError:
+        logging.error("THU API configuration not found. Please check your config.")
+        return None
+
+    request_args = {'model': model_type, 'messages': messages, 'temperature': temperature}
+    if json_schema is not None:
+        request_args['response_format'] = response_format_of(json_schema)
+
+    def send():
+        detector = make_detector(stop_at_json, required_keys)
+        if detector is None:
+            return client.chat.completions.create(**request_args)
+        return collect_stream(client.chat.completions.create(
+            **request_args, stream=True, stream_options={'include_usage': True}
+        ), detector)
+
+    try:
+        response = send_with_retries(backend, model_type, messages, send)
+        if stop_at_json:
+            return response.content
+        result = response.choices[0].message
+        answer = result.content
+        return answer
+    except Exception as e:
+        logging.error(f"API call failed: {e}")
+        return None
+
+
+async def acompletion_with_backoff(messages, model_type, backend='OpenRouter', stop_at_json=None, required_keys=(),
+                                   json_schema=None, refresh=False):
+    """
+    Async counterpart of `completion_with_backoff`.
+
+    Uses a pooled `openai.AsyncOpenAI`, so many requests can be in flight on one event loop.
+
+    Args:
+        messages: List of message dictionaries
+        model_type: Model type/name
+        backend: Backend type ('OpenRouter', 'THU', 'vLLM')
+        stop_at_json: 'object' or 'list' to stop at the first complete JSON value of that kind
+        required_keys: Keys the JSON object (or every item of the list) must have to count
+        json_schema: JSON schema the answer must follow, or None for free-form text
+        refresh: Bypass the response cache and replace its entry, for retries of a rejected answer
+
+    Returns:
+        Response content string or None if failed
+    """
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        backend_name, model_name, params = _describe_request(messages, model_type, backend, json_schema)
+        answer = await cassette.areplay(_request_key(backend_name, model_name, messages, params,
+                                                      stop_at_json, required_keys))
+        if answer is not None:
+            record_cache_hit(backend_name, model_name, source='replay')
+        return answer
+
+    request, answer = _lookup(messages, model_type, backend, json_schema, stop_at_json, required_keys, refresh)
+    from_cache = answer is not None
+    if not from_cache:
+        batch = get_batch()
+        if batch is not None:
+            answer = _answer_from_batch(batch, request, messages)
+        else:
+            answer, answered_by = await ahedged(backend_of(model_type, backend), model_type,
+                                                lambda backend_name, model_name:
+                                                _acompletion(messages, model_name, backend_name, stop_at_json,
+                                                             required_keys, json_schema))
+            if answered_by != model_type:
+                return answer  # an alternate model answered: not cached or recorded as this model
+    _store(request, messages, answer, from_cache)
+    return answer
+
+
+async def _acompletion(messages, model_type, backend, stop_at_json=None, required_keys=(), json_schema=None):
+    if model_type.startswith('vllm/') or backend == 'vLLM':
+        return await vllm_acompletion_with_backoff(messages, model_type, stop_at_json=stop_at_json,
+                                                   required_keys=required_keys, guided_json=json_schema)
+
+    try:
+        client = get_async_client(backend)
+    except ImportError:
+        logging.error("THU API configuration not found. Please check your config.")
+        return None
+
+    request_args = {'model': model_type, 'messages': messages, 'temperature': temperature}
+    if json_schema is not None:
+        request_args['response_format'] = response_format_of(json_schema)
+
+    async def send():
+        detector = make_detector(stop_at_json, required_keys)
+        if detector is None:
+            return await client.chat.completions.create(**request_args)
+        return await acollect_stream(await client.chat.completions.create(
+            **request_args, stream=True, stream_options={'include_usage': True}
+        ), detector)
 
     try:
-        response = client.chat.completions.create(
-            model=model_type,
-            messages=messages,
-            temperature=temperature,
-        )
+        response = await asend_with_retries(backend, model_type, messages, send)
+        if stop_at_json:
+            return response.content
         result = response.choices[0].message
         answer = result.content
         return answer
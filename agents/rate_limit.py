@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+
+from agents.adaptive_concurrency import status_code_of, request_slot, arequest_slot, slots_saturated
+from agents.hedging import record_latency
+from agents.llm_usage import record_usage
+from agents.config.rate_limit import (
+    RATE_LIMITS, RATE_LIMIT_SHARE, RATE_LIMIT_BURST_SECONDS, EXPECTED_COMPLETION_TOKENS,
+    MAX_ATTEMPTS, BACKOFF_BASE, BACKOFF_MAX
+)
+
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class TokenBucket:
+    """
+    Reservation-based token bucket refilled at `per_minute` / 60 per second.
+
+    `reserve` always succeeds and returns how long the caller has to wait before it may
+    spend its reservation. The level can go negative, so callers are served in the order
+    they reserved, and a request larger than the burst still gets through eventually.
+    """
+
+    def __init__(self, per_minute, burst_seconds=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def short(self, amount, now):
+        """True if spending `amount` now would have to wait."""
+        self._refill(now)
+        return self.level < amount
+
+    def adjust(self, amount):
+        """Take (or give back, if negative) tokens after the fact."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget of one (backend, model).
+
+    Threads and event loops of a process share one limiter. A server `Retry-After`
+    pauses every caller of the limiter, not just the request that received it.
+    """
+
+    def __init__(self, name, rpm=None, tpm=None, burst_seconds=10.0):
+        self.name = name
+        self.requests = TokenBucket(rpm, burst_seconds) if rpm else None
+        self.tokens = TokenBucket(tpm, burst_seconds) if tpm else None
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        now = time.monotonic()
+        with self._lock:
+            delay = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+            if delay > 0:
+                self.waited += delay
+                self.throttled += 1
+        return delay
+
+    def acquire(self, tokens=0):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens=0):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def settle(self, reserved, used):
+        """Correct the token budget once the response reports the tokens actually used."""
+        if self.tokens is not None and used is not None:
+            with self._lock:
+                self.tokens.adjust(used - reserved)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logging.info(f"Requests to {self.name} paused for {seconds:.1f}s (Retry-After)")
+
+    def throttling(self):
+        """True while a new request would have to wait: paused, or out of request or token budget."""
+        now = time.monotonic()
+        with self._lock:
+            return (self.paused_until > now
+                    or self.requests is not None and self.requests.short(1, now)
+                    or self.tokens is not None and self.tokens.short(0, now))
+
+    def stats(self):
+        with self._lock:
+            return {'throttled': self.throttled, 'waited': round(self.waited, 2)}
+
+
+def retry_after_of(error):
+    """Seconds to wait from a `Retry-After`/`Retry-After-Ms` header in an error's cause chain."""
+    while error is not None:
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers is not None:
+            if headers.get('retry-after-ms'):
+                try:
+                    return float(headers['retry-after-ms']) / 1000
+                except ValueError:
+                    pass
+            value = headers.get('retry-after')
+            if value:
+                try:
+                    return max(0.0, float(value))
+                except ValueError:
+                    try:
+                        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+                    except (TypeError, ValueError):
+                        pass
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_retryable(error):
+    """HTTP 408/409/429/5xx, or a connection failure or timeout anywhere in the cause chain."""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    while error is not None:
+        if isinstance(error, (httpx.TransportError, requests.ConnectionError, requests.Timeout)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; a server `Retry-After` is honored, plus some jitter."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def estimate_tokens(messages, completion_tokens=EXPECTED_COMPLETION_TOKENS):
+    """Rough token count of a request: about four characters per prompt token."""
+    return len(json.dumps(messages, ensure_ascii=False)) // 4 + completion_tokens
+
+
+def usage_tokens(response):
+    usage = getattr(response, 'usage', None)
+    if isinstance(usage, dict):
+        return usage.get('total_tokens')
+    return getattr(usage, 'total_tokens', None)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_worker_share = 1.0
+
+
+def configure_rate_limits(workers=1):
+    """Split this machine's share of the limits between `workers` processes (call in each worker)."""
+    global _worker_share
+    with _limiters_lock:
+        _worker_share = 1.0 / max(workers, 1)
+        _limiters.clear()
+
+
+def get_rate_limiter(backend, model_type):
+    """Process-wide rate limiter for (backend, model), created from agents.config.rate_limit."""
+    key = (backend, model_type)
+    with _limiters_lock:
+        if key not in _limiters:
+            limits = RATE_LIMITS.get(backend, RATE_LIMITS['OpenRouter'])
+            share = RATE_LIMIT_SHARE * _worker_share
+            _limiters[key] = RateLimiter(
+                f"{backend}/{model_type}",
+                rpm=limits['rpm'] * share if limits['rpm'] else None,
+                tpm=limits['tpm'] * share if limits['tpm'] else None,
+                burst_seconds=RATE_LIMIT_BURST_SECONDS,
+            )
+        return _limiters[key]
+
+
+def is_throttling(backend, model_type):
+    """True while a new request to (backend, model) would wait for rate budget or a concurrency slot."""
+    return get_rate_limiter(backend, model_type).throttling() or slots_saturated(backend, model_type)
+
+
+def _retry(limiter, error, attempt):
+    """Delay before the next attempt, or None if the error is final."""
+    if attempt + 1 >= MAX_ATTEMPTS or not is_retryable(error):
+        return None
+    retry_after = retry_after_of(error)
+    if retry_after is not None:
+        limiter.pause(retry_after)
+    delay = backoff_delay(attempt, retry_after)
+    logging.warning(f"Request to {limiter.name} failed ({error}), retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1}/{MAX_ATTEMPTS})")
+    return delay
+
+
+def send_with_retries(backend, model_type, messages, send):
+    """
+    Send a completion request within the rate limits and retry it on transient failures.
+
+    Each attempt waits for request and token budget, then holds an adaptive concurrency
+    slot (see agents/adaptive_concurrency.py) while it is in flight. A failed attempt gives
+    its token reservation back, so retries of a request do not drain the token budget
+    (each attempt still takes one from the request budget). The `usage` and latency
+    of the response are accounted in agents/llm_usage.py, and the latency also feeds the
+    hedge delay (agents/hedging.py). Latency is the in-flight time of the successful
+    attempt, without rate limit waits, slot queueing or backoff.
+
+    Args:
+        backend: Backend the request goes to ('OpenRouter', 'THU', 'vLLM')
+        model_type: Model type/name
+        messages: Messages of the request, used to estimate its tokens
+        send: Callable that performs the request and returns the response object
+
+    Returns:
+        The response of the first successful attempt
+
+    Raises:
+        Exception: The last error, once it is not retryable or the attempts are used up
+    """
+    limiter = get_rate_limiter(backend, model_type)
+    reserved = estimate_tokens(messages)
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.acquire(reserved)
+        try:
+            with request_slot(backend, model_type):
+                started = time.monotonic()
+                response = send()
+                latency = time.monotonic() - started
+        except Exception as e:
+            limiter.settle(reserved, 0)  # the failed attempt used no tokens
+            delay = _retry(limiter, e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        limiter.settle(reserved, usage_tokens(response))
+        record_usage(backend, model_type, response, latency)
+        record_latency(backend, model_type, latency)
+        return response
+
+
+async def asend_with_retries(backend, model_type, messages, send):
+    """Async counterpart of `send_with_retries`; `send` returns an awaitable."""
+    limiter = get_rate_limiter(backend, model_type)
+    reserved = estimate_tokens(messages)
+    for attempt in range(MAX_ATTEMPTS):
+        await limiter.aacquire(reserved)
+        try:
+            async with arequest_slot(backend, model_type):
+                started = time.monotonic()
+                response = await send()
+                latency = time.monotonic() - started
+        except Exception as e:
+            limiter.settle(reserved, 0)  # the failed attempt used no tokens
+            delay = _retry(limiter, e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        limiter.settle(reserved, usage_tokens(response))
+        record_usage(backend, model_type, response, latency)
+        record_latency(backend, model_type, latency)
+        return response
+
+
+def rate_limit_stats():
+    with _limiters_lock:
+        return {limiter.name: limiter.stats() for limiter in _limiters.values()}
@@ -1,13 +1,21 @@
 from collections import defaultdict
 from copy import deepcopy
 import fnmatch
+import hashlib
+import json
 import logging
 import re
 from typing import Dict
 
 import os
+import subprocess
 from contextlib import contextmanager
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 
 @contextmanager
 def change_directory(directory):
@@ -43,6 +51,36 @@ def fill_in_placeholders(prompt_messages,placeholders: dict):
             filled_messages = filled_messages.replace("{{" + str(key) + "}}", str(value))
     return filled_messages
 
+PLACEHOLDER_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+
+def prompt_placeholders(*templates):
+    """Names of the {{placeholders}} used in the prompt templates."""
+    return {name for template in templates for name in PLACEHOLDER_PATTERN.findall(template or '')}
+
+
+def fill_in_placeholders_prefix_first(system_prompt, user_prompt, placeholders: dict):
+    """
+    Fill a system/user prompt pair so that all static text forms one leading block.
+
+    The templates are split into paragraphs at blank lines. Paragraphs without placeholders
+    keep their order and stay where they are; paragraphs with placeholders are filled and
+    moved, in order, to the end of the user prompt. The system prompt and the start of the
+    user prompt are then byte-identical across items, so vLLM automatic prefix caching and
+    provider prompt caching can reuse them.
+
+    Returns:
+        (system, user): The filled system and user prompts
+    """
+    static, dynamic = {'system': [], 'user': []}, []
+    for role, template in (('system', system_prompt), ('user', user_prompt)):
+        for paragraph in re.split(r'\n(?:[ \t]*\n)+', template.strip('\n')):
+            if PLACEHOLDER_PATTERN.search(paragraph):
+                dynamic.append(fill_in_placeholders(paragraph, placeholders))
+            elif paragraph.strip():
+                static[role].append(paragraph)
+    return '\n\n'.join(static['system']) + '\n', '\n\n'.join(static['user'] + dynamic) + '\n'
+
 def _check_ignorement(path:str,ignored_list)->bool:
     for pattern in ignored_list:
         if fnmatch.fnmatch(path,pattern):
@@ -92,14 +130,59 @@ def get_code(response):
     return all_code_blocks_combined
 
 
+def shard_index(item_id, shard_count):
+    """Stable shard assignment of an instruction id (same on every machine and Python run)."""
+    digest = hashlib.sha1(str(item_id).encode('utf-8')).hexdigest()
+    return int(digest, 16) % shard_count
+
+
+def parse_shard(shard):
+    """Parse an 'i/n' shard spec into (i, n) with 0 <= i < n."""
+    try:
+        index, count = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected the form i/n (e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{shard}', index must satisfy 0 <= i < n")
+    return index, count
+
+
+def resolve_result_file_path(result_file, eval_folder):
+    """Relative result files are placed under the step's eval_folder."""
+    if not os.path.isabs(result_file) and eval_folder:
+        return os.path.join(eval_folder, result_file)
+    return result_file
+
+
+def append_jsonl(path, record, fsync=False, **dumps_kwargs):
+    """
+    Append one JSON record as a line, safely across threads and worker processes.
+
+    The line is written with a single O_APPEND write while holding an exclusive
+    flock, so concurrent writers never interleave partial lines.
+    """
+    data = (json.dumps(record, **dumps_kwargs) + '\n').encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def run_code(workspace, code_file, log_file=None)->str:
     if log_file is None:
         log_file = code_file + '.log'
 
-    with change_directory(workspace):
-        os.system(f'python "{code_file}" > "{log_file}" 2>&1')
-        with open(log_file,'r') as f:
-            log = f.read()
+    # cwd instead of change_directory so concurrent instructions don't race on os.chdir
+    subprocess.run(f'python "{code_file}" > "{log_file}" 2>&1', shell=True, cwd=workspace)
+    with open(os.path.join(workspace, log_file),'r') as f:
+        log = f.read()
 
     return log
 
@@ -1,13 +1,24 @@
+import asyncio
 import logging
+import os
+import re
+import threading
+import time
 import traceback
+import weakref
+import httpx
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any, Optional
 from agents.config.vllm import (
     VLLM_API_KEY, VLLM_BASE_URL, VLLM_TEMPERATURE,
     VLLM_MAX_TOKENS, VLLM_TOP_P, VLLM_FREQUENCY_PENALTY, VLLM_PRESENCE_PENALTY,
-    VLLM_MODEL_CONFIGS
+    VLLM_MODEL_CONFIGS, VLLM_POOL_SIZE, VLLM_REQUEST_TIMEOUT, VLLM_BASE_URLS, VLLM_HEALTH_CHECK_INTERVAL
 )
+from agents.adaptive_concurrency import status_code_of
+from agents.json_stream import JsonStreamDetector, make_detector, parse_sse_line
+from agents.rate_limit import send_with_retries, asend_with_retries
 
 
 def print_chat_message(messages):
@@ -16,31 +27,141 @@ def print_chat_message(messages):
         logging.info(f"{message['role']}: {message['content']}")
 
 
+class VLLMEndpoint:
+    """One vLLM replica and what the client knows about it."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.healthy = True  # until a request or a probe says otherwise
+        self.models = None  # served model ids, unknown until probed
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models or model.replace('vllm/', '') in self.models
+
+    def stats(self) -> Dict[str, Any]:
+        return {'healthy': self.healthy, 'outstanding': self.outstanding,
+                'requests': self.requests, 'failures': self.failures}
+
+
 class VLLMClient:
     """vLLM client wrapper that mimics OpenAI API format."""
     
     def __init__(self, 
                  api_key: str = VLLM_API_KEY,
                  base_url: str = VLLM_BASE_URL,
-                 model_config: Optional[Dict[str, Any]] = None):
+                 model_config: Optional[Dict[str, Any]] = None,
+                 pool_size: int = VLLM_POOL_SIZE,
+                 endpoints: Optional[List[str]] = None,
+                 health_check_interval: float = VLLM_HEALTH_CHECK_INTERVAL):
         """
         Initialize vLLM client.
         
+        With several endpoints, each request goes to the healthy replica serving its model
+        with the fewest outstanding requests. A replica that fails with a connection error
+        or HTTP 5xx is taken out of rotation and the request fails over to another one.
+        Replicas are probed every `health_check_interval` seconds for health and models.
+        
         Args:
             api_key: API key (usually empty for local vLLM servers)
             base_url: Base URL of the vLLM server
             model_config: Model configuration dictionary
+            pool_size: Maximum number of keep-alive connections per server
+            endpoints: Base URLs of several replicas (overrides base_url)
+            health_check_interval: Seconds between health probes of the replicas
         """
         self.api_key = api_key
-        self.base_url = base_url.rstrip('/')
+        self.endpoints = [VLLMEndpoint(url) for url in (endpoints or [base_url])]
+        self.base_url = self.endpoints[0].base_url
+        self.health_check_interval = health_check_interval
         self.model_config = model_config or {}
-        
-        # Set up session for connection pooling
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.pool_size = pool_size
+        self.headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {api_key}'
-        })
+        }
+        
+        # Set up session for connection pooling; retries are handled by the callers
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # httpx async clients are bound to the event loop that opened their connections
+        self._async_clients = weakref.WeakKeyDictionary()
+
+        self._balancer_lock = threading.Lock()
+        self._last_probe = 0.0
+        self._probing = False
+
+    # Replica selection
+    def probe_endpoints(self):
+        """Refresh the health and served models of every replica (blocking)."""
+        for endpoint in self.endpoints:
+            healthy = check_vllm_server_health(endpoint.base_url)
+            models = get_available_models(endpoint.base_url) if healthy else []
+            with self._balancer_lock:
+                if healthy != endpoint.healthy:
+                    logging.warning(f"vLLM replica {endpoint.base_url} is {'up' if healthy else 'down'}")
+                endpoint.healthy = healthy
+                if models:
+                    endpoint.models = set(models)
+        self._last_probe = time.monotonic()
+
+    def _probe_in_background(self):
+        try:
+            self.probe_endpoints()
+        finally:
+            self._probing = False
+
+    def _maybe_probe(self):
+        if len(self.endpoints) == 1:
+            return
+        now = time.monotonic()
+        with self._balancer_lock:
+            if self._probing or now - self._last_probe < self.health_check_interval:
+                return
+            self._probing = True
+            self._last_probe = now
+        threading.Thread(target=self._probe_in_background, daemon=True).start()
+
+    def _acquire_endpoint(self, model: str, tried: List[VLLMEndpoint]) -> VLLMEndpoint:
+        """Least outstanding requests among healthy replicas serving the model, not yet tried."""
+        self._maybe_probe()
+        with self._balancer_lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+            candidates = [endpoint for endpoint in candidates if endpoint.healthy] or candidates
+            candidates = [endpoint for endpoint in candidates if endpoint.serves(model)] or candidates
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release_endpoint(self, endpoint: VLLMEndpoint, error: Optional[Exception] = None) -> bool:
+        """
+        Return a replica after a request; on error, decide whether to fail over.
+
+        Returns:
+            True if the request should be retried on another replica
+        """
+        status = status_code_of(error) if error is not None else None
+        replica_failed = error is not None and (status is None or status >= 500)
+        with self._balancer_lock:
+            endpoint.outstanding -= 1
+            if replica_failed:
+                endpoint.failures += 1
+                if endpoint.healthy and len(self.endpoints) > 1:
+                    endpoint.healthy = False
+                    logging.warning(f"vLLM replica {endpoint.base_url} failed ({error}), "
+                                    f"taken out of rotation until it passes a health check")
+        return (replica_failed or status == 429) and len(self.endpoints) > 1
+
+    def endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._balancer_lock:
+            return {endpoint.base_url: endpoint.stats() for endpoint in self.endpoints}
     
     def _prepare_request_data(self, model: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
         """Prepare request data for vLLM API call."""
@@ -66,81 +187,260 @@ class VLLMClient:
                                          self.model_config.get('presence_penalty', VLLM_PRESENCE_PENALTY)),
             'stream': kwargs.get('stream', False),
         }
+        if kwargs.get('guided_json') is not None:
+            # Constrain decoding to the JSON schema (vLLM structured outputs)
+            request_data['guided_json'] = kwargs['guided_json']
+        if request_data['stream']:
+            # Usage (incl. cached prompt tokens) arrives in a final chunk
+            request_data['stream_options'] = {'include_usage': True}
         
         # Remove None values
         request_data = {k: v for k, v in request_data.items() if v is not None}
         
         return request_data
     
-    def chat_completions_create(self, model: str, messages: List[Dict], **kwargs):
+    def chat_completions_create(self, model: str, messages: List[Dict],
+                                stream_until: Optional[JsonStreamDetector] = None, **kwargs):
         """
         Create chat completion using vLLM server.
         
         Args:
             model: Model name
             messages: List of message dictionaries
+            stream_until: Stream the completion and stop it as soon as this detector
+                has seen a complete JSON value
             **kwargs: Additional parameters
             
         Returns:
             Response object similar to OpenAI API
         """
+        if stream_until is not None:
+            kwargs['stream'] = True
         request_data = self._prepare_request_data(model, messages, **kwargs)
+        tried = []
         
+        while True:
+            endpoint = self._acquire_endpoint(request_data['model'], tried)
+            tried.append(endpoint)
+            try:
+                # Make request to vLLM server
+                response = self.session.post(
+                    f"{endpoint.base_url}/chat/completions",
+                    json=request_data,
+                    timeout=kwargs.get('timeout', VLLM_REQUEST_TIMEOUT),
+                    stream=stream_until is not None
+                )
+                response.raise_for_status()
+                
+                # Parse response
+                if stream_until is not None:
+                    result = self._read_stream(response, stream_until)
+                else:
+                    result = VLLMResponse(response.json())
+                
+            except requests.exceptions.RequestException as e:
+                if self._release_endpoint(endpoint, e) and len(tried) < len(self.endpoints):
+                    continue  # fail over to the next replica
+                logging.error(f"vLLM API request failed: {e}")
+                raise Exception(f"vLLM API request failed: {e}") from e
+            except (KeyError, IndexError) as e:
+                self._release_endpoint(endpoint)
+                logging.error(f"vLLM API response parsing failed: {e}")
+                raise Exception(f"vLLM API response parsing failed: {e}") from e
+            except Exception as e:
+                self._release_endpoint(endpoint)
+                logging.error(f"Unexpected error in vLLM client: {e}")
+                logging.error(traceback.format_exc())
+                raise
+            
+            self._release_endpoint(endpoint)
+            return result
+
+    @staticmethod
+    def _stream_delta(data: Dict[str, Any]) -> Optional[str]:
+        choices = data.get('choices') or []
+        return choices[0].get('delta', {}).get('content') if choices else None
+
+    @staticmethod
+    def _streamed_response(parts: List[str], usage, stopped_early: bool) -> 'VLLMResponse':
+        return VLLMResponse({
+            'choices': [{'message': {'role': 'assistant', 'content': ''.join(parts)},
+                         'finish_reason': 'json_complete' if stopped_early else 'stop'}],
+            'usage': usage,
+        })
+
+    def _read_stream(self, response: requests.Response, detector: JsonStreamDetector) -> 'VLLMResponse':
+        """Collect a server-sent event stream; closing it early makes vLLM abort the generation."""
+        parts, usage, stopped_early = [], None, False
         try:
-            # Make request to vLLM server
-            response = self.session.post(
-                f"{self.base_url}/chat/completions",
-                json=request_data,
-                timeout=kwargs.get('timeout', 300)  # Default 5 minutes timeout
+            for line in response.iter_lines(decode_unicode=True):
+                data = parse_sse_line(line)
+                if data == '[DONE]':
+                    break
+                if data is None:
+                    continue
+                usage = data.get('usage') or usage
+                delta = self._stream_delta(data)
+                if delta:
+                    parts.append(delta)
+                    if detector.feed(delta):
+                        stopped_early = True
+                        break
+        finally:
+            response.close()
+        return self._streamed_response(parts, usage, stopped_early)
+
+    async def _aread_stream(self, response: httpx.Response, detector: JsonStreamDetector) -> 'VLLMResponse':
+        parts, usage, stopped_early = [], None, False
+        async for line in response.aiter_lines():
+            data = parse_sse_line(line)
+            if data == '[DONE]':
+                break
+            if data is None:
+                continue
+            usage = data.get('usage') or usage
+            delta = self._stream_delta(data)
+            if delta:
+                parts.append(delta)
+                if detector.feed(delta):
+                    stopped_early = True
+                    break
+        return self._streamed_response(parts, usage, stopped_early)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(VLLM_REQUEST_TIMEOUT, connect=10.0),
             )
-            response.raise_for_status()
-            
-            # Parse response
-            response_data = response.json()
+            self._async_clients[loop] = client
+        return client
+
+    async def achat_completions_create(self, model: str, messages: List[Dict],
+                                       stream_until: Optional[JsonStreamDetector] = None, **kwargs):
+        """
+        Async counterpart of `chat_completions_create` on a pooled `httpx.AsyncClient`.
+        
+        Args:
+            model: Model name
+            messages: List of message dictionaries
+            stream_until: Stream the completion and stop it once this detector has seen
+                a complete JSON value
+            **kwargs: Additional parameters
             
-            # Create a response object that mimics OpenAI's format
-            class VLLMResponse:
-                def __init__(self, data):
-                    self.data = data
-                    self.choices = [self.Choice(data['choices'][0])]
+        Returns:
+            Response object similar to OpenAI API
+        """
+        if stream_until is not None:
+            kwargs['stream'] = True
+        request_data = self._prepare_request_data(model, messages, **kwargs)
+        tried = []
+        
+        while True:
+            endpoint = self._acquire_endpoint(request_data['model'], tried)
+            tried.append(endpoint)
+            try:
+                if stream_until is not None:
+                    async with self._async_client().stream(
+                        'POST', f"{endpoint.base_url}/chat/completions",
+                        json=request_data,
+                        timeout=kwargs.get('timeout', VLLM_REQUEST_TIMEOUT)
+                    ) as response:
+                        response.raise_for_status()
+                        result = await self._aread_stream(response, stream_until)
+                else:
+                    response = await self._async_client().post(
+                        f"{endpoint.base_url}/chat/completions",
+                        json=request_data,
+                        timeout=kwargs.get('timeout', VLLM_REQUEST_TIMEOUT)
+                    )
+                    response.raise_for_status()
+                    result = VLLMResponse(response.json())
                 
-                class Choice:
-                    def __init__(self, choice_data):
-                        self.message = self.Message(choice_data['message'])
-                        self.finish_reason = choice_data.get('finish_reason', 'stop')
-                        self.index = choice_data.get('index', 0)
-                    
-                    class Message:
-                        def __init__(self, message_data):
-                            self.content = message_data['content']
-                            self.role = message_data['role']
+            except httpx.HTTPError as e:
+                if self._release_endpoint(endpoint, e) and len(tried) < len(self.endpoints):
+                    continue
+                logging.error(f"vLLM API request failed: {e}")
+                raise Exception(f"vLLM API request failed: {e}") from e
+            except (KeyError, IndexError) as e:
+                self._release_endpoint(endpoint)
+                logging.error(f"vLLM API response parsing failed: {e}")
+                raise Exception(f"vLLM API response parsing failed: {e}") from e
+            except BaseException:
+                self._release_endpoint(endpoint)  # cancelled
+                raise
             
-            return VLLMResponse(response_data)
-            
-        except requests.exceptions.RequestException as e:
-            logging.error(f"vLLM API request failed: {e}")
-            raise Exception(f"vLLM API request failed: {e}")
-        except (KeyError, IndexError) as e:
-            logging.error(f"vLLM API response parsing failed: {e}")
-            raise Exception(f"vLLM API response parsing failed: {e}")
-        except Exception as e:
-            logging.error(f"Unexpected error in vLLM client: {e}")
-            logging.error(traceback.format_exc())
-            raise
+            self._release_endpoint(endpoint)
+            return result
+
+
+class VLLMResponse:
+    """Response object that mimics OpenAI's chat completion format."""
+
+    def __init__(self, data):
+        self.data = data
+        self.choices = [self.Choice(data['choices'][0])]
+        self.usage = data.get('usage')
+
+    class Choice:
+        def __init__(self, choice_data):
+            self.message = self.Message(choice_data['message'])
+            self.finish_reason = choice_data.get('finish_reason', 'stop')
+            self.index = choice_data.get('index', 0)
+
+        class Message:
+            def __init__(self, message_data):
+                self.content = message_data['content']
+                self.role = message_data['role']
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_vllm_client(base_url: Optional[str] = None) -> VLLMClient:
+    """
+    Shared `VLLMClient` for a server, reused by all calls in this process.
+    
+    Args:
+        base_url: Base URL of the vLLM server (default: the VLLM_BASE_URLS replicas)
+        
+    Returns:
+        VLLMClient whose connection pools persist across requests
+    """
+    endpoints = [base_url] if base_url else VLLM_BASE_URLS
+    key = (tuple(endpoints), os.getpid())  # forked workers must not reuse the parent's sockets
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = VLLMClient(endpoints=endpoints)
+        return _clients[key]
 
 
 def vllm_completion_with_backoff(messages: List[Dict], 
                                 model_type: str, 
                                 max_retries: int = 3,
+                                stop_at_json: Optional[str] = None,
+                                required_keys=(),
                                 **kwargs):
     """
     vLLM completion function with retry logic.
     
+    Transient HTTP failures are retried with jittered backoff within the vLLM rate
+    limits (agents/rate_limit.py); `max_retries` bounds retries of empty answers.
+    
     Args:
         messages: List of message dictionaries
         model_type: Model type (should start with 'vllm/' for vLLM models)
-        max_retries: Maximum number of retry attempts
-        **kwargs: Additional parameters for the API call
+        max_retries: Maximum number of attempts on empty answers
+        stop_at_json: 'object' or 'list' to stream the completion and stop it as soon as
+            a complete JSON value of that kind (with `required_keys`) has been received
+        required_keys: Keys the JSON object, or each item of the list, must have
+        **kwargs: Additional parameters for the API call, e.g. `guided_json` (a JSON schema
+            that constrains decoding)
         
     Returns:
         Response content string or None if failed
@@ -149,38 +449,88 @@ def vllm_completion_with_backoff(messages: List[Dict],
     if not model_type.startswith('vllm/'):
         model_type = f'vllm/{model_type}'
     
-    client = VLLMClient()
+    client = get_vllm_client()
     
+    # Rate limiting and HTTP errors are retried with backoff by send_with_retries;
+    # this loop only retries empty answers
     for attempt in range(max_retries):
         try:
-            response = client.chat_completions_create(
+            response = send_with_retries('vLLM', model_type, messages, lambda: client.chat_completions_create(
                 model=model_type,
                 messages=messages,
+                stream_until=make_detector(stop_at_json, required_keys),
                 **kwargs
-            )
-            
-            result = response.choices[0].message
-            answer = result.content
-            
-            if answer:  # If answer is not empty, return it
-                return answer
-            
-            # If answer is empty and not the last attempt, continue to next loop
-            if attempt < max_retries - 1:
-                logging.warning("Empty response received from vLLM. Retrying...")
-                continue
-                
+            ))
         except Exception as e:
-            logging.error(f"vLLM completion attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
-                continue
-            else:
-                return None
+            logging.error(f"vLLM completion failed: {e}")
+            return None
+        
+        result = response.choices[0].message
+        answer = result.content
+        
+        if answer:  # If answer is not empty, return it
+            return answer
+        
+        # If answer is empty and not the last attempt, continue to next loop
+        if attempt < max_retries - 1:
+            logging.warning("Empty response received from vLLM. Retrying...")
     
     # If all attempts failed, return None
     return None
 
 
+async def vllm_acompletion_with_backoff(messages: List[Dict],
+                                       model_type: str,
+                                       max_retries: int = 3,
+                                       stop_at_json: Optional[str] = None,
+                                       required_keys=(),
+                                       **kwargs):
+    """
+    Async counterpart of `vllm_completion_with_backoff`.
+
+    Requests go through the shared client's `httpx.AsyncClient`, so a single event loop
+    can keep as many requests in flight as the vLLM server accepts.
+
+    Args:
+        messages: List of message dictionaries
+        model_type: Model type (should start with 'vllm/' for vLLM models)
+        max_retries: Maximum number of attempts on empty answers
+        stop_at_json: 'object' or 'list' to stream the completion and stop it as soon as
+            a complete JSON value of that kind (with `required_keys`) has been received
+        required_keys: Keys the JSON object, or each item of the list, must have
+        **kwargs: Additional parameters for the API call, e.g. `guided_json` (a JSON schema
+            that constrains decoding)
+
+    Returns:
+        Response content string or None if failed
+    """
+    if not model_type.startswith('vllm/'):
+        model_type = f'vllm/{model_type}'
+
+    client = get_vllm_client()
+
+    for attempt in range(max_retries):
+        try:
+            response = await asend_with_retries('vLLM', model_type, messages, lambda: client.achat_completions_create(
+                model=model_type,
+                messages=messages,
+                stream_until=make_detector(stop_at_json, required_keys),
+                **kwargs
+            ))
+        except Exception as e:
+            logging.error(f"vLLM completion failed: {e}")
+            return None
+
+        answer = response.choices[0].message.content
+        if answer:
+            return answer
+
+        if attempt < max_retries - 1:
+            logging.warning("Empty response received from vLLM. Retrying...")
+
+    return None
+
+
 def vllm_completion_with_log(messages: List[Dict], 
                            model_type: str, 
                            enable_log: bool = False,
@@ -211,6 +561,11 @@ def vllm_completion_with_log(messages: List[Dict],
     return response
 
 
+def _server_root(base_url: str) -> str:
+    """Server URL without the /v1 API prefix (/health is served at the root)."""
+    return re.sub(r'/v1$', '', base_url.rstrip('/'))
+
+
 def check_vllm_server_health(base_url: str = VLLM_BASE_URL) -> bool:
     """
     Check if vLLM server is running and healthy.
@@ -222,7 +577,7 @@ def check_vllm_server_health(base_url: str = VLLM_BASE_URL) -> bool:
         True if server is healthy, False otherwise
     """
     try:
-        response = requests.get(f"{base_url.rstrip('/')}/health", timeout=10)
+        response = requests.get(f"{_server_root(base_url)}/health", timeout=10)
         return response.status_code == 200
     except requests.exceptions.RequestException:
         return False
@@ -239,7 +594,7 @@ def get_available_models(base_url: str = VLLM_BASE_URL) -> List[str]:
         List of available model names
     """
     try:
-        response = requests.get(f"{base_url.rstrip('/')}/v1/models", timeout=10)
+        response = requests.get(f"{_server_root(base_url)}/v1/models", timeout=10)
         if response.status_code == 200:
             data = response.json()
             return [model['id'] for model in data.get('data', [])]
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Local Batch Provider for DSDBench-Open
+This script plays the role of a Batch API provider for workflows run with
+--llm-mode batch. It answers every *_input.jsonl request file in the batch directory
+that has no *_output.jsonl yet, and writes the output file in the Batch API format.
+
+Requests are sent to any OpenAI-compatible endpoint (--base-url, e.g. a vLLM server or
+mock_llm_server.py), or answered offline with templated rubber-duck JSON (--templated).
+"""
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from mock_llm_server import templated_response
+
+
+def output_path_of(input_path):
+    return input_path[:-len('_input.jsonl')] + '_output.jsonl'
+
+
+def templated_responder(seed=None):
+    """Responder answering offline with templated rubber-duck JSON."""
+    rng = random.Random(seed)
+
+    def respond(body):
+        content = templated_response(body.get('messages', []), rng)
+        return 200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+        }
+
+    return respond
+
+
+def http_responder(base_url, api_key=None, timeout=600):
+    """Responder forwarding each request body to an OpenAI-compatible endpoint."""
+    session = requests.Session()
+    session.headers['Content-Type'] = 'application/json'
+    if api_key:
+        session.headers['Authorization'] = f"Bearer {api_key}"
+
+    def respond(body):
+        response = session.post(f"{base_url.rstrip('/')}/chat/completions", json=body, timeout=timeout)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {'error': {'message': response.text}}
+
+    return respond
+
+
+def process_batch_file(input_path, respond, workers=8):
+    """
+    Answer one batch input file and write its output file.
+
+    The output is written to a temporary file first, so a polling workflow never
+    reads a half-written output.
+
+    Returns:
+        int: Number of requests answered
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        batch_requests = [json.loads(line) for line in f if line.strip()]
+
+    def answer(request):
+        entry = {'id': f"batch_req_{uuid.uuid4().hex}", 'custom_id': request['custom_id'], 'error': None}
+        try:
+            status_code, body = respond(request['body'])
+            entry['response'] = {'status_code': status_code, 'request_id': uuid.uuid4().hex, 'body': body}
+        except requests.RequestException as e:
+            entry['response'] = None
+            entry['error'] = {'code': 'request_failed', 'message': str(e)}
+        return entry
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = list(executor.map(answer, batch_requests))
+
+    output_path = output_path_of(input_path)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, output_path)
+    return len(entries)
+
+
+def process_pending_files(batch_dir, respond, workers=8):
+    """Answer all input files of batch_dir that have no output file yet."""
+    processed = 0
+    for input_path in sorted(glob.glob(os.path.join(batch_dir, '*_input.jsonl'))):
+        if not os.path.exists(output_path_of(input_path)):
+            count = process_batch_file(input_path, respond, workers)
+            print(f"Completed {count} requests: {output_path_of(input_path)}")
+            processed += 1
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DSDBench-Open: Local stand-in for a Batch API provider')
+    parser.add_argument('--batch-dir', type=str, default='workspace/llm_batch',
+                      help='Directory the workflow writes batch input files to (default: workspace/llm_batch)')
+    parser.add_argument('--base-url', type=str, default=None,
+                      help='OpenAI-compatible endpoint that answers the requests, e.g. http://localhost:8000/v1')
+    parser.add_argument('--api-key', type=str, default=None,
+                      help='API key for --base-url')
+    parser.add_argument('--templated', action='store_true',
+                      help='Answer offline with templated rubber-duck JSON instead of calling --base-url')
+    parser.add_argument('--workers', type=int, default=8,
+                      help='Requests answered in parallel (default: 8)')
+    parser.add_argument('--watch', action='store_true',
+                      help='Keep polling the batch directory for new input files')
+    parser.add_argument('--poll', type=float, default=2.0,
+                      help='Seconds between polls in --watch mode (default: 2)')
+    parser.add_argument('--seed', type=int, default=None,
+                      help='Random seed for templated answers')
+    args = parser.parse_args()
+
+    if args.templated:
+        respond = templated_responder(args.seed)
+    elif args.base_url:
+        respond = http_responder(args.base_url, args.api_key)
+    else:
+        print("Error: pass --base-url or --templated")
+        sys.exit(1)
+
+    os.makedirs(args.batch_dir, exist_ok=True)
+    print(f"Serving batch files in {args.batch_dir}")
+    try:
+        while True:
+            process_pending_files(args.batch_dir, respond, args.workers)
+            if not args.watch:
+                break
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
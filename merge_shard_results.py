@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Shard Result Merger for DSDBench-Open
+This script combines the result files written by `workflow_generic.py --shard i/n`
+into the single result file expected by compute_single_eval_results.py and
+compute_multi_eval_results.py.
+"""
+import os
+import sys
+import json
+import argparse
+
+from agents.agent_environment import load_instructions
+from workflow_generic import load_config
+
+
+def expected_ids_from_config(config_path):
+    """
+    Collect the instruction ids a full (unsharded) run of a config would produce.
+
+    Args:
+        config_path (str): Path to the configuration file
+
+    Returns:
+        set: Instruction ids selected by the config's input step
+    """
+    _, workflow = load_config(config_path)
+    input_step = next((step for step in workflow if 'input' in step), None)
+    if input_step is None:
+        raise ValueError(f"No input step found in {config_path}")
+
+    instructions = load_instructions(
+        input_step['input']['data'],
+        input_step.get('data_ids'),
+        input_step.get('data_range')
+    )
+    return {inst['id'] for inst in instructions}
+
+
+def merge_shard_results(shard_files, output_file, expected_ids=None, allow_missing=False):
+    """
+    Merge shard result files into one JSONL file sorted by id.
+
+    Args:
+        shard_files (list): Result JSONL files written by the shards
+        output_file (str): Path of the merged result file
+        expected_ids (set): Ids that must be present, or None to skip the check
+        allow_missing (bool): Only warn instead of failing when expected ids are missing
+
+    Returns:
+        int: Number of merged records
+    """
+    records = {}
+    sources = {}
+    duplicates = []
+
+    for shard_file in shard_files:
+        with open(shard_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record_id = record['id']
+                if record_id in records:
+                    duplicates.append(f"id {record_id}: {sources[record_id]} and {shard_file}:{line_number}")
+                    continue
+                records[record_id] = record
+                sources[record_id] = f"{shard_file}:{line_number}"
+
+    if duplicates:
+        raise ValueError("Duplicate ids across shard results:\n  " + "\n  ".join(duplicates))
+
+    if expected_ids is not None:
+        missing = sorted(expected_ids - records.keys())
+        unexpected = sorted(records.keys() - expected_ids)
+        if unexpected:
+            print(f"Warning: {len(unexpected)} ids are not part of the configured run: {unexpected}")
+        if missing:
+            message = f"{len(missing)} expected ids are missing from the shard results: {missing}"
+            if not allow_missing:
+                raise ValueError(message)
+            print(f"Warning: {message}")
+
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for record_id in sorted(records):
+            f.write(json.dumps(records[record_id]) + '\n')
+
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DSDBench-Open: Merge sharded evaluation results')
+    parser.add_argument('shard_files', nargs='+',
+                      help='Result files written by the individual shards')
+    parser.add_argument('--output', type=str, required=True,
+                      help='Path of the merged result file')
+    parser.add_argument('--config', type=str, default=None,
+                      help='Configuration used for the shards; enables the missing-id check')
+    parser.add_argument('--allow-missing', action='store_true',
+                      help='Warn instead of failing when ids expected by the config are missing')
+    args = parser.parse_args()
+
+    expected_ids = expected_ids_from_config(args.config) if args.config else None
+
+    try:
+        count = merge_shard_results(args.shard_files, args.output, expected_ids, args.allow_missing)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Merged {count} results from {len(args.shard_files)} shard files into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+"""
+Mock OpenAI/vLLM Server for DSDBench-Open
+This script serves an OpenAI-compatible chat completions API that answers with scripted
+or templated rubber-duck JSON. Latency distributions, HTTP 429/5xx injection, a capacity
+limit, slow streaming, an emulated prefix cache and guided JSON make it a reproducible load target for measuring harness
+throughput and tuning retry/concurrency settings without a GPU or API key.
+
+Point the harness at it with e.g. VLLM_BASE_URL=http://localhost:8000/v1
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Characters per block of the emulated prefix cache (about 16 tokens, vLLM's default block size)
+PREFIX_BLOCK_CHARS = 64
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampling function returning seconds.
+
+    Args:
+        spec (str): 'fixed:S', 'uniform:LOW,HIGH', 'lognormal:MEDIAN,SIGMA' or 'exp:MEAN'
+
+    Returns:
+        callable: Function taking a random.Random and returning a latency in seconds
+    """
+    kind, _, values = spec.partition(':')
+    try:
+        params = [float(value) for value in values.split(',')] if values else []
+        if kind == 'fixed':
+            (seconds,) = params
+            return lambda rng: seconds
+        if kind == 'uniform':
+            low, high = params
+            return lambda rng: rng.uniform(low, high)
+        if kind == 'lognormal':
+            median, sigma = params
+            return lambda rng: median * rng.lognormvariate(0, sigma)
+        if kind == 'exp':
+            (mean,) = params
+            return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec '{spec}', expected fixed:S, uniform:LOW,HIGH, "
+                     f"lognormal:MEDIAN,SIGMA or exp:MEAN")
+
+
+def load_scripted_responses(path):
+    """
+    Load scripted responses: one JSON object per line with 'content' and an optional
+    'match' substring. The first entry whose 'match' occurs in the request wins.
+    """
+    responses = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                responses.append(json.loads(line))
+    return responses
+
+
+def _code_lines(messages):
+    """Candidate code lines of the code under analysis in a prompt."""
+    text = str(messages[-1].get('content', '')) if messages else ''
+    # The prompts put the code after a "Code:" heading, followed by two blank lines or a heading
+    section = re.search(r"Code:[ \t]*\n(.*?)(?:\n[ \t]*\n[ \t]*\n|\n#{2,} |\Z)", text, re.DOTALL)
+    blocks = re.findall(r"```python\n(.*?)```", text, re.DOTALL)
+    source = section.group(1) if section else (blocks[-1] if blocks else text)
+    return [line.strip() for line in source.splitlines()
+            if line.strip() and not line.strip().startswith(('#', '```'))]
+
+
+def templated_response(messages, rng):
+    """
+    Build a response in the format the rubber-duck prompts ask for.
+
+    The judge prompt gets an error_message_score (the batched judge prompt one per pair),
+    multi-bug prompts (which ask for a JSON list) get a list of error dicts, and everything
+    else gets a single error dict whose lines are taken from the code in the prompt.
+    """
+    prompt = '\n'.join(str(message.get('content', '')) for message in messages)
+
+    pair_ids = re.findall(r'"pair_id": (\d+)', prompt)
+    if pair_ids:
+        return '```json\n' + json.dumps([{
+            'pair_id': int(pair_id),
+            'error_message_score': rng.choice([0.0, 0.25, 0.5, 0.75, 1.0]),
+            'error_message_eval_reason': 'Mock evaluation.',
+        } for pair_id in dict.fromkeys(pair_ids)], indent=4) + '\n```'
+
+    if 'error_message_score' in prompt:
+        score = rng.choice([0.0, 0.25, 0.5, 0.75, 1.0])
+        return '```json\n' + json.dumps({
+            'error_message_score': score,
+            'error_message_eval_reason': 'Mock evaluation.',
+        }, indent=4) + '\n```'
+
+    lines = _code_lines(messages) or ['pass']
+    error_types = ['ValueError', 'KeyError', 'TypeError', 'AttributeError', 'IndexError']
+
+    def error_dict():
+        cause_line = rng.choice(lines)
+        effect_line = rng.choice(lines[lines.index(cause_line):])
+        error_type = rng.choice(error_types)
+        return {
+            'cause_line': cause_line,
+            'effect_line': effect_line,
+            'error_type': error_type,
+            'error_message': f"{error_type}: mock error raised by the injected bug",
+        }
+
+    if re.search(r'"?error_list"?|JSON list|list of (?:error|dict)', prompt, re.IGNORECASE) \
+            or re.search(r'```json\s*\[', prompt):
+        content = [error_dict() for _ in range(rng.randint(2, 3))]
+    else:
+        content = error_dict()
+    return '```json\n' + json.dumps(content, indent=4) + '\n```'
+
+
+def request_schema(request):
+    """JSON schema a request constrains its output to (vLLM guided_json or OpenAI response_format)."""
+    if request.get('guided_json'):
+        return request['guided_json']
+    response_format = request.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        return response_format.get('json_schema', {}).get('schema')
+    return None
+
+
+def guided_response(content, schema):
+    """
+    Emulate constrained decoding: the bare JSON of a templated response, cut down to the
+    schema's properties and wrapped in {"items": [...]} if the schema wraps a list.
+    """
+    match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+    try:
+        value = json.loads(match.group(1) if match else content)
+    except ValueError:
+        return content
+
+    def restrict(item, item_schema):
+        properties = item_schema.get('properties')
+        if isinstance(item, dict) and properties:
+            return {key: item.get(key, '') for key in properties}
+        return item
+
+    if schema.get('type') == 'array':
+        value = [restrict(item, schema.get('items', {})) for item in value] if isinstance(value, list) else value
+    elif isinstance(value, list) and 'items' in schema.get('properties', {}):
+        value = {'items': [restrict(item, schema['properties']['items'].get('items', {})) for item in value]}
+    else:
+        value = restrict(value, schema)
+    return json.dumps(value, ensure_ascii=False)
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency='fixed:0', rate_429=0.0, rate_5xx=0.0, retry_after=1.0,
+                 max_concurrency=None, stream_chunk_chars=16, stream_chunk_delay=0.0,
+                 responses=None, models=('mock-model',), seed=None):
+        super().__init__(address, MockLLMHandler)
+        self.sample_latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        self.responses = responses or []
+        self.models = list(models)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counters = {'requests': 0, 'ok': 0, '429': 0, '5xx': 0, 'streamed': 0}
+        self.prefix_blocks = set()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def draw(self, fn):
+        """Use the shared random generator under the lock, so seeded runs are reproducible."""
+        with self.lock:
+            return fn(self.rng)
+
+    def cached_tokens(self, messages):
+        """
+        Emulate automatic prefix caching: the prompt is hashed in blocks of PREFIX_BLOCK_CHARS,
+        each hash chained to the previous one, and the leading blocks seen before are cached.
+        """
+        prompt = ''.join(f"<|{message.get('role')}|>{message.get('content', '')}" for message in messages)
+        hashes, previous = [], None
+        for start in range(0, len(prompt) - PREFIX_BLOCK_CHARS + 1, PREFIX_BLOCK_CHARS):
+            previous = hash((previous, prompt[start:start + PREFIX_BLOCK_CHARS]))
+            hashes.append(previous)
+        with self.lock:
+            cached = 0
+            while cached < len(hashes) and hashes[cached] in self.prefix_blocks:
+                cached += 1
+            if len(self.prefix_blocks) > 1_000_000:
+                self.prefix_blocks.clear()
+            self.prefix_blocks.update(hashes)
+        return cached * PREFIX_BLOCK_CHARS // 4
+
+    def content_for(self, messages):
+        prompt = json.dumps(messages, ensure_ascii=False)
+        for response in self.responses:
+            if response.get('match', '') in prompt:
+                return response['content']
+        return self.draw(lambda rng: templated_response(messages, rng))
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {'error': {'message': message, 'type': 'mock_error', 'code': status}}, headers)
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path.endswith('/health'):
+            self._send_json(200, {'status': 'ok'})
+        elif path.endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': model, 'object': 'model', 'owned_by': 'mock'} for model in self.server.models]})
+        elif path.endswith('/stats'):
+            with self.server.lock:
+                self._send_json(200, dict(self.server.counters, in_flight=self.server.in_flight))
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_error(400, 'Request body is not valid JSON')
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_error(404, f"Unknown path {self.path}")
+            return
+
+        server.count('requests')
+        with server.lock:
+            over_capacity = server.max_concurrency is not None and server.in_flight >= server.max_concurrency
+            if not over_capacity:
+                server.in_flight += 1
+        retry_headers = {'Retry-After': f"{server.retry_after:g}"}
+        if over_capacity:
+            server.count('429')
+            self._send_error(429, 'Server is at capacity', retry_headers)
+            return
+
+        try:
+            fault = server.draw(lambda rng: rng.random())
+            if fault < server.rate_429:
+                server.count('429')
+                self._send_error(429, 'Rate limit exceeded (injected)', retry_headers)
+                return
+            if fault < server.rate_429 + server.rate_5xx:
+                server.count('5xx')
+                status = server.draw(lambda rng: rng.choice([500, 502, 503]))
+                self._send_error(status, 'Server error (injected)', retry_headers if status == 503 else None)
+                return
+
+            messages = request.get('messages', [])
+            content = server.content_for(messages)
+            schema = request_schema(request)
+            if schema:
+                content = guided_response(content, schema)
+            time.sleep(server.draw(server.sample_latency))
+
+            usage = {
+                'prompt_tokens': len(json.dumps(messages)) // 4,
+                'completion_tokens': len(content) // 4,
+                'prompt_tokens_details': {'cached_tokens': server.cached_tokens(messages)},
+            }
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            model = request.get('model', server.models[0])
+
+            if request.get('stream'):
+                server.count('streamed')
+                self._stream(model, content, usage)
+            else:
+                self._send_json(200, {
+                    'id': f"chatcmpl-{uuid.uuid4().hex}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': 'stop'}],
+                    'usage': usage,
+                })
+            server.count('ok')
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _stream(self, model, content, usage):
+        """Send the completion as server-sent events, one chunk every stream_chunk_delay seconds."""
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def event(delta, finish_reason=None, **extra):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            chunk.update(extra)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            event({'role': 'assistant', 'content': ''})
+            size = max(server.stream_chunk_chars, 1)
+            for start in range(0, len(content), size):
+                if server.stream_chunk_delay:
+                    time.sleep(server.stream_chunk_delay)
+                event({'content': content[start:start + size]})
+            event({}, 'stop', usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the stream
+
+
+def start_mock_server(host='127.0.0.1', port=0, **options):
+    """
+    Start a mock server on a background thread.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free one
+        **options: MockLLMServer options (latency, rate_429, rate_5xx, ...)
+
+    Returns:
+        MockLLMServer: The running server; its base URL is http://host:server.server_port/v1
+    """
+    server = MockLLMServer((host, port), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DSDBench-Open: Mock OpenAI/vLLM server for load testing')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                      help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000,
+                      help='Port to bind (default: 8000, the vLLM default)')
+    parser.add_argument('--latency', type=str, default='fixed:0',
+                      help='Latency distribution: fixed:S, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or exp:MEAN')
+    parser.add_argument('--rate-429', type=float, default=0.0,
+                      help='Fraction of requests rejected with HTTP 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0,
+                      help='Fraction of requests failed with HTTP 500/502/503')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                      help='Retry-After seconds sent with 429 and 503 responses')
+    parser.add_argument('--max-concurrency', type=int, default=None,
+                      help='Reject requests with 429 while this many are already in flight')
+    parser.add_argument('--stream-chunk-chars', type=int, default=16,
+                      help='Characters per chunk for streamed responses')
+    parser.add_argument('--stream-chunk-delay', type=float, default=0.0,
+                      help='Seconds between streamed chunks (slow-streaming mode)')
+    parser.add_argument('--responses', type=str, default=None,
+                      help='JSONL of scripted responses ({"match": ..., "content": ...}); '
+                           'unmatched requests get templated rubber-duck JSON')
+    parser.add_argument('--models', type=str, nargs='+', default=['mock-model'],
+                      help='Model ids listed by /v1/models')
+    parser.add_argument('--seed', type=int, default=None,
+                      help='Random seed for reproducible latencies, faults and templated answers')
+    args = parser.parse_args()
+
+    try:
+        responses = load_scripted_responses(args.responses) if args.responses else None
+        server = MockLLMServer(
+            (args.host, args.port), latency=args.latency, rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+            retry_after=args.retry_after, max_concurrency=args.max_concurrency,
+            stream_chunk_chars=args.stream_chunk_chars, stream_chunk_delay=args.stream_chunk_delay,
+            responses=responses, models=args.models, seed=args.seed
+        )
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Mock LLM server listening on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Request counters: {server.counters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -88,6 +88,18 @@ def main():
     parser = argparse.ArgumentParser(description='DSDBench-Open: Multi Bug Evaluation')
     parser.add_argument('--result-file', type=str, default=default_filename,
                       help=f'Path to save the evaluation results (default: {default_filename})')
+    parser.add_argument('--llm-mode', type=str, default=None, choices=['live', 'record', 'replay', 'batch'],
+                      help='Record LLM exchanges to a cassette, replay them offline, or send them as batch jobs')
+    parser.add_argument('--cassette', type=str, default=None,
+                      help='Cassette file for --llm-mode record/replay')
+    parser.add_argument('--replay-latency', type=float, default=None,
+                      help='In replay mode, wait the recorded latency times this factor')
+    parser.add_argument('--batch-dir', type=str, default=None,
+                      help='Batch input/output directory for --llm-mode batch')
+    parser.add_argument('--batch-timeout', type=float, default=None,
+                      help='Seconds to wait for the output files of a batch round before giving up')
+    parser.add_argument('--tiered-judge', action='store_true',
+                      help='Score clear-cut error messages locally and only send ambiguous ones to the LLM judge')
     args = parser.parse_args()
     
     # Print the result file being used
@@ -96,6 +108,21 @@ def main():
     # Run the workflow with multi-bug evaluation config
     print("Running workflow with multi-bug evaluation configuration...")
     workflow_cmd = ["python", "workflow_generic.py", "--config", "config/multi_bug_eval_agent_config.py", "--result-file", args.result_file]
+    if args.llm_mode:
+        workflow_cmd += ["--llm-mode", args.llm_mode]
+    if args.cassette:
+        workflow_cmd += ["--cassette", args.cassette]
+    if args.replay_latency is not None:
+        workflow_cmd += ["--replay-latency", str(args.replay_latency)]
+    if args.batch_dir:
+        workflow_cmd += ["--batch-dir", args.batch_dir]
+    if args.tiered_judge:
+        workflow_cmd.append("--tiered-judge")
+    if args.llm_mode == 'batch':
+        # Results are computed right after the workflow, so wait for every batch round
+        workflow_cmd.append("--batch-wait")
+        if args.batch_timeout is not None:
+            workflow_cmd += ["--batch-timeout", str(args.batch_timeout)]
     workflow_process = subprocess.run(workflow_cmd, check=True)
     if workflow_process.returncode != 0:
         print("Error: Workflow execution failed.")
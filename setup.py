@@ -16,6 +16,7 @@ setup(
         "snoop>=0.4.0",
         "tenacity>=8.0.0",
         "openai>=1.0.0",
+        "httpx>=0.23.0",
         "tqdm>=4.62.0",
         "jsonlines>=2.0.0",
         "argparse>=1.4.0",
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Tests for the tiered error message scorer
+Pins which predicted error messages are settled locally (1.0 / 0.0) and which go to the LLM judge.
+"""
+import sys
+import os
+import json
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.error_verifier_agent.error_message_scorer import ErrorMessageScorer
+
+
+def local_score(ground_truth_message, llm_message):
+    verdict = ErrorMessageScorer().local_verdict(ground_truth_message, llm_message)
+    return None if verdict is None else verdict['error_message_score']
+
+
+def drive(steps, answer=None):
+    """Run a scorer generator, answering every judge request with `answer`; returns (result, requests)."""
+    requests = []
+    try:
+        call = next(steps)
+        while True:
+            requests.append(call)
+            call = steps.send(answer)
+    except StopIteration as stop:
+        return stop.value, requests
+
+
+def test_identical_messages_match():
+    assert local_score("KeyError: 'c1'", "KeyError: 'c1'") == 1.0
+    assert local_score("ValueError: Invalid  value.", "valueerror: invalid value") == 1.0
+
+
+def test_quoting_does_not_matter():
+    assert local_score("KeyError: 'c1'", 'KeyError: "c1"') == 1.0
+
+
+def test_module_path_is_ignored():
+    ground_truth = "pandas.errors.ParserError: Error tokenizing data. C error: Expected 3 fields in line 5, saw 4"
+    assert local_score(ground_truth, "ParserError: Error tokenizing data. C error: Expected 3 fields in line 5, saw 4") == 1.0
+
+
+def test_match_threshold_is_inclusive():
+    # Every ground truth token and one extra: overlap 4/5 = 0.8
+    assert local_score("ValueError: w1 w2 w3 w4", "ValueError: w1 w2 w3 w4 x1") == 1.0
+    # Two extra tokens: overlap 4/6 goes to the judge
+    assert local_score("ValueError: w1 w2 w3 w4", "ValueError: w1 w2 w3 w4 x1 x2") is None
+
+
+def test_match_needs_every_ground_truth_token():
+    assert local_score("KeyError: 'c1'", "KeyError: 'c2'") is None
+
+
+def test_unrelated_message_of_another_type_mismatches():
+    assert local_score("ZeroDivisionError: division by zero",
+                       "KeyError: mock error raised by the injected bug") == 0.0
+
+
+def test_mismatch_threshold_is_inclusive():
+    # One shared token out of ten: overlap 0.1
+    assert local_score("ValueError: shared", "TypeError: shared x1 x2 x3 x4 x5 x6 x7 x8 x9") == 0.0
+    # One shared token out of nine goes to the judge
+    assert local_score("ValueError: shared", "TypeError: shared x1 x2 x3 x4 x5 x6 x7 x8") is None
+
+
+def test_stopwords_inside_quotes_count():
+    assert local_score("KeyError: 'the'", "KeyError: 'a'") is None
+
+
+def test_related_message_of_another_type_escalates():
+    assert local_score("ValueError: could not convert string to float: 'abc'",
+                       "TypeError: could not convert string to float") is None
+
+
+def test_missing_messages():
+    assert local_score("KeyError: 'c1'", "") == 0.0
+    assert local_score("", "KeyError: 'c1'") is None
+
+
+def test_judge_verdicts_are_memoized():
+    scorer = ErrorMessageScorer()
+    answer = json.dumps({'error_message_score': 0.5, 'error_message_eval_reason': 'partially correct'})
+    verdict, requests = drive(scorer.score("KeyError: 'c1'", "KeyError: 'c2'"), answer)
+    assert verdict['error_message_score'] == 0.5 and len(requests) == 1
+    verdict, requests = drive(scorer.score("KeyError: 'c1'", "KeyError: 'c2'"), answer)
+    assert verdict['error_message_score'] == 0.5 and not requests
+
+
+def test_batch_judges_ambiguous_pairs_together():
+    scorer = ErrorMessageScorer()
+    pairs = [("KeyError: 'c1'", "KeyError: 'c1'"), ("KeyError: 'c1'", "KeyError: 'c2'"),
+             ("KeyError: 'c1'", "KeyError: 'c3'")]
+    answer = json.dumps([{'pair_id': 1, 'error_message_score': 0.25, 'error_message_eval_reason': ''},
+                         {'pair_id': 2, 'error_message_score': 0.75, 'error_message_eval_reason': ''}])
+    verdicts, requests = drive(scorer.score_batch(pairs), answer)
+    assert [verdict['error_message_score'] for verdict in verdicts] == [1.0, 0.25, 0.75]
+    assert len(requests) == 1
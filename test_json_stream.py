@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Tests for the streamed JSON detector
+Pins when JsonStreamDetector stops a streamed completion: the first complete JSON value of the
+requested kind with the required keys, past code fences, prose and {"items": [...]} wrappers.
+"""
+import sys
+import os
+import json
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.json_stream import JsonStreamDetector, make_detector
+from agents.error_verifier_agent.schema import parse_guided_json
+
+BUG = {'cause_line': 'x = df["a"]', 'effect_line': 'print(x)', 'error_message': "KeyError: 'a'"}
+KEYS = ('cause_line', 'effect_line', 'error_message')
+
+
+def stream(detector, text, chunk_size=3):
+    """Feed `text` in small chunks; returns the text received when the detector stopped, or None."""
+    for start in range(0, len(text), chunk_size):
+        if detector.feed(text[start:start + chunk_size]):
+            return detector.text
+    return None
+
+
+def test_stops_at_the_end_of_the_first_object():
+    answer = json.dumps(BUG)
+    text = stream(JsonStreamDetector('object', KEYS), f"Let me think. {answer}\nMore reasoning that is never sent", 1)
+    assert text == f"Let me think. {answer}"
+
+
+def test_waits_for_the_value_to_close():
+    detector = JsonStreamDetector('object')
+    assert not detector.feed('{"a": {"b": 1}')
+    assert not detector.complete
+    assert detector.feed('}')
+    assert detector.value == {'a': {'b': 1}}
+
+
+def test_brackets_in_strings_do_not_count():
+    value = {'cause_line': 'print("}]{[")', 'effect_line': 'x = "\\"}"', 'error_message': '{'}
+    detector = JsonStreamDetector('object', KEYS)
+    assert stream(detector, json.dumps(value) + ' trailing') == json.dumps(value)
+    assert detector.value == value
+
+
+def test_required_keys_gate_the_value():
+    detector = JsonStreamDetector('object', KEYS)
+    text = '{"cause_line": "partial"} and then ' + json.dumps(BUG)
+    assert stream(detector, text) == text
+    assert detector.value == BUG
+
+
+def test_every_list_item_needs_the_required_keys():
+    detector = JsonStreamDetector('list', KEYS)
+    assert stream(detector, json.dumps([BUG, {'cause_line': 'x'}]) + ' ' + json.dumps([BUG, BUG])) is not None
+    assert detector.value == [BUG, BUG]
+    # An empty list is not an answer
+    assert stream(JsonStreamDetector('list'), '[] still thinking') is None
+
+
+def test_code_fence_resets_the_scan():
+    code = "```python\ndef f(:\n    d = {'a': [1,\n```\n"
+    detector = JsonStreamDetector('object', KEYS)
+    assert stream(detector, code + json.dumps(BUG)) == code + json.dumps(BUG)
+    assert detector.value == BUG
+
+
+def test_fence_split_across_chunks():
+    detector = JsonStreamDetector('object', KEYS)
+    for chunk in ['{"x": 1, ', '`', '`', '`\n', json.dumps(BUG)]:
+        detector.feed(chunk)
+    assert detector.value == BUG
+
+
+def test_items_wrapper_is_accepted_whole():
+    answer = json.dumps({'items': [BUG, BUG]})
+    detector = JsonStreamDetector('list', KEYS)
+    text = stream(detector, answer + ' trailing', 1)
+    # The stream stops at the wrapper's closing brace, not at the inner list's bracket
+    assert text == answer
+    assert detector.value == [BUG, BUG]
+    assert parse_guided_json(text) == [BUG, BUG]
+
+
+def test_items_wrapper_needs_the_required_keys():
+    detector = JsonStreamDetector('list', KEYS)
+    assert stream(detector, json.dumps({'items': [{'cause_line': 'x'}]})) is None
+
+
+def test_list_inside_another_object_is_found():
+    detector = JsonStreamDetector('list', KEYS)
+    stream(detector, json.dumps({'bugs': [BUG]}))
+    assert detector.value == [BUG]
+
+
+def test_object_detector_ignores_lists():
+    detector = JsonStreamDetector('object', KEYS)
+    stream(detector, json.dumps([BUG]))
+    # The object inside the list is the first complete object
+    assert detector.value == BUG
+
+
+def test_make_detector():
+    assert make_detector(None) is None
+    assert make_detector('list', KEYS).kind == 'list'
+    with pytest.raises(ValueError):
+        JsonStreamDetector('string')
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Tests for rate limiting and retries
+Sends requests through send_with_retries / asend_with_retries to mock_llm_server.py with injected
+HTTP 429s and checks Retry-After handling, jittered backoff and the token budget.
+"""
+import sys
+import os
+import time
+import random
+import asyncio
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import agents.rate_limit as rate_limit
+from agents.rate_limit import RateLimiter, backoff_delay, retry_after_of, usage_tokens
+from agents.vllm_client import VLLMClient
+from mock_llm_server import start_mock_server
+
+MESSAGES = [{'role': 'user', 'content': 'Find the bug.'}]
+
+
+@pytest.fixture
+def mock_server():
+    server = start_mock_server(models=['mock'], seed=1)
+    server.client = VLLMClient(endpoints=[f"http://127.0.0.1:{server.server_port}/v1"])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Limiter used for every request; its token bucket barely refills while a test runs."""
+    limiter = RateLimiter('vLLM/mock', tpm=60, burst_seconds=10 ** 6)
+    monkeypatch.setattr(rate_limit, 'get_rate_limiter', lambda backend, model_type: limiter)
+    monkeypatch.setattr(rate_limit, 'BACKOFF_BASE', 0.01)
+    return limiter
+
+
+def send(server, messages=MESSAGES):
+    return rate_limit.send_with_retries('vLLM', 'vllm/mock', messages, lambda: server.client.chat_completions_create(
+        model='vllm/mock', messages=messages))
+
+
+async def asend(server, messages=MESSAGES):
+    return await rate_limit.asend_with_retries('vLLM', 'vllm/mock', messages, lambda: server.client.achat_completions_create(
+        model='vllm/mock', messages=messages))
+
+
+def test_backoff_is_jittered():
+    random.seed(0)
+    cap = min(rate_limit.BACKOFF_MAX, rate_limit.BACKOFF_BASE * 2 ** 3)
+    delays = [backoff_delay(3) for _ in range(50)]
+    assert all(0 <= delay <= cap for delay in delays)
+    assert len(set(delays)) == len(delays)
+
+    # A server Retry-After is a lower bound, with up to BACKOFF_BASE of jitter on top
+    delays = [backoff_delay(3, retry_after=2.0) for _ in range(50)]
+    assert all(2.0 <= delay <= 2.0 + rate_limit.BACKOFF_BASE for delay in delays)
+    assert len(set(delays)) == len(delays)
+
+
+def test_pause_delays_every_caller():
+    limiter = RateLimiter('test')
+    limiter.pause(0.2)
+    assert limiter.throttling()
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.2
+    assert limiter.stats()['throttled'] == 1
+
+
+def test_retry_after_is_honored(mock_server, limiter):
+    mock_server.rate_429 = 1.0
+    mock_server.retry_after = 0.3
+    chat_completions_create = mock_server.client.chat_completions_create
+
+    def reject_once(**kwargs):
+        try:
+            return chat_completions_create(**kwargs)
+        finally:
+            mock_server.rate_429 = 0.0
+
+    mock_server.client.chat_completions_create = reject_once
+    started = time.monotonic()
+    send(mock_server)
+
+    assert time.monotonic() - started >= 0.3
+    assert (mock_server.counters['requests'], mock_server.counters['429']) == (2, 1)
+    # The limiter was paused as well, so other callers wait out the Retry-After too
+    assert limiter.paused_until >= started + 0.3
+
+
+def test_final_error_carries_retry_after(mock_server, limiter, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'MAX_ATTEMPTS', 3)
+    mock_server.rate_429 = 1.0
+    mock_server.retry_after = 0.05
+
+    with pytest.raises(Exception) as error:
+        send(mock_server)
+    assert retry_after_of(error.value) == pytest.approx(0.05)
+    assert mock_server.counters['429'] == 3
+    # No attempt got through, so no tokens stay reserved
+    assert limiter.tokens.level == pytest.approx(limiter.tokens.capacity)
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_retries_do_not_drain_the_token_budget(mock_server, limiter, use_async):
+    mock_server.rate_429 = 0.5
+    mock_server.retry_after = 0.01
+
+    if use_async:
+        async def send_all():
+            return [await asend(mock_server) for _ in range(8)]
+        responses = asyncio.run(send_all())
+    else:
+        responses = [send(mock_server) for _ in range(8)]
+
+    assert mock_server.counters['429'] > 0
+    used = sum(usage_tokens(response) for response in responses)
+    spent = limiter.tokens.capacity - limiter.tokens.level
+    # Only the tokens the successful attempts reported are charged (the bucket refills by 1 token/s)
+    assert used - 10 <= spent <= used
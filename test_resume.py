@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Tests for resuming an interrupted run from the completion journal
+Runs a small rubber-duck workflow against mock_llm_server.py, interrupts it, resumes it and
+checks that every id ends up in the result file exactly once and only unfinished work is re-sent.
+"""
+import sys
+import os
+import re
+import json
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import agents.llm_clients as llm_clients
+import agents.vllm_client as vllm_client
+from agents.agent_environment import AgentEnvironment, discard_results
+from agents.agent_environment.journal import CompletionJournal
+from agents.error_verifier_agent.agent import ErrorVerifierAgent
+from agents.error_verifier_agent.prompt import RUBBER_DUCK_EVAL_SYSTEM_PROMPT, RUBBER_DUCK_EVAL_USER_PROMPT
+from mock_llm_server import start_mock_server
+
+IDS = range(4)
+VERSIONS = range(3)
+
+
+def column(item_id, version):
+    return f"c{item_id}{version}"
+
+
+def write_instructions(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for item_id in IDS:
+            f.write(json.dumps({'id': item_id, 'question': f"Q{item_id}", 'error_versions': [{
+                'modified_code': f"import pandas as pd\ndf = pd.read_csv('data.csv')\n"
+                                 f"x = df['{column(item_id, version)}'].mean()\nprint(x)\n",
+                'execution_output': f"Traceback (most recent call last):\n  File \"x.py\", line 3\n"
+                                    f"KeyError: '{column(item_id, version)}'\n",
+                'cause_error_line': f"x = df['{column(item_id, version)}'].mean()",
+                'effect_error_line': f"x = df['{column(item_id, version)}'].mean()",
+            } for version in VERSIONS]}) + '\n')
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    server = start_mock_server(models=['mock'], seed=0)
+    url = f"http://127.0.0.1:{server.server_port}/v1"
+    monkeypatch.setattr(vllm_client, 'VLLM_BASE_URLS', [url])
+    monkeypatch.setattr(llm_clients, 'backend_credentials', lambda backend: ('mock-key', url))
+
+    # Columns of the code each rubber-duck request asked about (judge prompts hold no code)
+    server.detected = []
+    content_for = server.content_for
+
+    def logged_content_for(messages):
+        server.detected.extend(re.findall(r"df\['(c\d+)'\]", json.dumps(messages)))
+        return content_for(messages)
+
+    server.content_for = logged_content_for
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(tmp_path, journal_file, batch_judge=False):
+    workspace = str(tmp_path / 'workspace')
+    config = {'workspace': workspace, 'journal_file': journal_file}
+    workflow = [{
+        'agent': 'rubber_duck_eval_agent',
+        'method': 'rubber_duck_eval',
+        'args': {'model_type': 'vllm/mock', 'eval_folder': workspace, 'result_file': 'results.jsonl',
+                 'batch_judge': batch_judge},
+        'input': {'data': str(tmp_path / 'instructions.jsonl')},
+        'output': 'rubber_duck_eval_result',
+        'output_type': 'analysis',
+    }]
+    agent_env = AgentEnvironment(workspace, config)
+    agent_env.add_agent('rubber_duck_eval_agent', ErrorVerifierAgent,
+                        prompts={'system': RUBBER_DUCK_EVAL_SYSTEM_PROMPT, 'user': RUBBER_DUCK_EVAL_USER_PROMPT})
+    return agent_env.run_workflow(workflow, sink=discard_results)
+
+
+def result_ids(tmp_path):
+    with open(tmp_path / 'workspace' / 'results.jsonl', 'r', encoding='utf-8') as f:
+        return [json.loads(line)['id'] for line in f]
+
+
+def test_resume_after_interruption(tmp_path, monkeypatch, mock_server):
+    write_instructions(tmp_path / 'instructions.jsonl')
+    journal_file = str(tmp_path / 'run.journal.jsonl')
+
+    # First run: version 1 of id 1 never gets a parsable answer, and the run is killed
+    # after id 2 wrote its result line but before its instruction was journaled
+    mock_server.responses = [{'match': f"df['{column(1, 1)}']", 'content': 'not json'}]
+    record = CompletionJournal.record
+
+    def interrupted_record(self, model_type, item_id, error_version=None, result=None, elapsed=None):
+        if item_id == 2 and error_version is None:
+            raise KeyboardInterrupt
+        return record(self, model_type, item_id, error_version, result, elapsed)
+
+    monkeypatch.setattr(CompletionJournal, 'record', interrupted_record)
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path, journal_file)
+    assert result_ids(tmp_path) == [0, 2]
+
+    # Resume with a healthy backend
+    monkeypatch.setattr(CompletionJournal, 'record', record)
+    mock_server.responses = []
+    mock_server.detected.clear()
+    run(tmp_path, journal_file)
+
+    assert sorted(result_ids(tmp_path)) == list(IDS)
+    # Only the failed version and the never-started instruction are sent again
+    assert sorted(mock_server.detected) == sorted([column(1, 1)] + [column(3, version) for version in VERSIONS])
+
+    journal = CompletionJournal(journal_file)
+    for item_id in IDS:
+        assert journal.is_done('vllm/mock', item_id)
+        assert all(journal.get('vllm/mock', item_id, version) for version in VERSIONS)
+
+
+def test_resume_only_rejudges_detected_versions(tmp_path, monkeypatch, mock_server):
+    write_instructions(tmp_path / 'instructions.jsonl')
+    journal_file = str(tmp_path / 'run.journal.jsonl')
+
+    # First run: every version is detected, but the batched judge never answers usably
+    mock_server.responses = [{'match': 'error_message_score', 'content': 'not json'}]
+    run(tmp_path, journal_file, batch_judge=True)
+    assert not os.path.exists(tmp_path / 'workspace' / 'results.jsonl')
+    assert len(mock_server.detected) == len(IDS) * len(VERSIONS)
+
+    mock_server.responses = []
+    mock_server.detected.clear()
+    requests = mock_server.counters['requests']
+    run(tmp_path, journal_file, batch_judge=True)
+
+    assert sorted(result_ids(tmp_path)) == list(IDS)
+    assert not mock_server.detected
+    assert mock_server.counters['requests'] - requests == len(IDS)  # one batched judge request per id
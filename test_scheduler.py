@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Tests for the DAG step scheduler
+Pins the dependency edges StepGraph infers from a WORKFLOW (shipped configs included) and checks that
+DagScheduler yields the same results, in the same order, as the sequential runner.
+"""
+import sys
+import os
+import ast
+import glob
+import json
+import random
+import time
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.agent_environment import AgentEnvironment
+from agents.agent_environment.scheduler import DagScheduler, StepGraph
+from agents.llm_batch import BatchPending
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+
+
+def shipped_workflow(config_name):
+    """WORKFLOW of a config module, read without importing it (some configs import agents not in this tree)."""
+    with open(os.path.join(CONFIG_DIR, f"{config_name}.py"), 'r', encoding='utf-8') as f:
+        module = ast.parse(f.read())
+    for node in module.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, 'id', None) == 'WORKFLOW' for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise AssertionError(f"{config_name} has no WORKFLOW")
+
+
+def step(agent, method, output=None, output_type='analysis', **args):
+    step = {'agent': agent, 'method': method, 'args': args, 'output_type': output_type}
+    if output is not None:
+        step['output'] = output
+    return step
+
+
+def edges(workflow):
+    return {index: sorted(deps) for index, deps in StepGraph(workflow).dependencies.items()}
+
+
+SHIPPED_EDGES = {
+    'dabench_quantitative_experiment_config': {0: []},
+    'data_annotate_agent_config': {0: []},
+    'error_snoop_agent_config': {0: []},
+    'library_error_inject_agent_config': {0: []},
+    'multi_bug_eval_agent_config': {0: []},
+    'single_bug_eval_agent_config': {0: []},
+    'vllm_multi_bug_eval_agent_config': {0: []},
+    'vllm_single_bug_eval_agent_config': {0: []},
+    # Different agents and no data flow: the two steps run in parallel
+    'weak_llm_direct_analysis_config': {0: [], 1: []},
+}
+
+
+def test_every_shipped_config_is_covered():
+    shipped = {os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(CONFIG_DIR, '*.py'))}
+    assert shipped == set(SHIPPED_EDGES)
+
+
+@pytest.mark.parametrize('config_name', sorted(SHIPPED_EDGES))
+def test_shipped_config_edges(config_name):
+    assert edges(shipped_workflow(config_name)) == SHIPPED_EDGES[config_name]
+
+
+def test_from_args_depend_on_their_producer():
+    workflow = [
+        step('a', 'run', output='x'),
+        step('b', 'run', output='y'),
+        step('c', 'run', first={'from': 'x'}, second={'from': 'y'}),
+    ]
+    assert edges(workflow) == {0: [], 1: [], 2: [0, 1]}
+
+
+def test_from_arg_reads_the_latest_producer():
+    workflow = [
+        step('a', 'run', output='x'),
+        step('b', 'run', output='x'),
+        step('c', 'run', prev={'from': 'x'}),
+    ]
+    # The second writer of 'x' also keeps its order after the first
+    assert edges(workflow) == {0: [], 1: [0], 2: [1]}
+
+
+def test_from_arg_without_producer_is_rejected():
+    with pytest.raises(ValueError):
+        StepGraph([step('a', 'run', prev={'from': 'missing'})])
+
+
+def test_code_input_depends_on_the_step_writing_it():
+    workflow = [
+        step('coder', 'generate', output_type='code'),
+        step('reviewer', 'review', output_type='analysis'),
+        dict(step('runner', 'check'), input={'code': 'code_coder_generate.py'}),
+        # A file no step writes is an ordinary input
+        dict(step('other', 'check'), input={'code': 'code_unknown.py'}),
+    ]
+    assert edges(workflow) == {0: [], 1: [], 2: [0], 3: []}
+
+
+def test_steps_of_the_same_agent_keep_their_order():
+    workflow = [
+        step('a', 'first'),
+        step('b', 'run'),
+        step('a', 'second'),
+        step('a', 'third'),
+    ]
+    assert edges(workflow) == {0: [], 1: [], 2: [0], 3: [2]}
+
+
+def test_loop_steps_are_barriers():
+    workflow = [
+        step('a', 'run', output='x'),
+        step('b', 'run'),
+        {'type': 'loop', 'condition': 'no_errors', 'steps': [
+            step('c', 'run', output='looped', output_type='code'),
+            step('d', 'verify', prev={'from': 'x'}),
+        ]},
+        step('e', 'run'),
+        step('f', 'run', prev={'from': 'looped'}),
+    ]
+    assert edges(workflow) == {0: [], 1: [], 2: [0, 1], 3: [2], 4: [2]}
+
+
+class SleepyAgent:
+    """Agent whose methods sleep a random while and report what they received."""
+
+    def __init__(self, workspace, journal=None):
+        self.workspace = workspace
+
+    def _answer(self, name, queries, prev=None):
+        time.sleep(random.uniform(0, 0.02))
+        if queries['id'] == 3 and name == 'combine':
+            raise BatchPending  # aborts this instruction under both schedulers
+        if prev is not None:
+            prev = prev['result']  # step outputs are {'log', 'result'}; the log carries a timestamp
+        return '', f"{name}:{queries['id']}:{prev}"
+
+    def load(self, queries, individual_workspace, **kwargs):
+        return self._answer('load', queries)
+
+    def summarize(self, queries, individual_workspace, prev=None, **kwargs):
+        return self._answer('summarize', queries, prev)
+
+    def inspect(self, queries, individual_workspace, **kwargs):
+        return self._answer('inspect', queries)
+
+    def combine(self, queries, individual_workspace, prev=None, **kwargs):
+        return self._answer('combine', queries, prev)
+
+
+def dag_workflow(data_file):
+    return [
+        dict(step('loader', 'load', output='loaded', model_type='mock'), input={'data': data_file}),
+        step('inspector', 'inspect', output='inspected', model_type='mock'),
+        step('loader', 'summarize', output='summary', model_type='mock', prev={'from': 'loaded'}),
+        step('combiner', 'combine', model_type='mock', prev={'from': 'inspected'}),
+    ]
+
+
+def make_env(tmp_path, **config):
+    data_file = str(tmp_path / 'instructions.jsonl')
+    with open(data_file, 'w', encoding='utf-8') as f:
+        for item_id in range(12):
+            f.write(json.dumps({'id': item_id}) + '\n')
+    env = AgentEnvironment(str(tmp_path / 'workspace'), config)
+    for name in ('loader', 'inspector', 'combiner'):
+        env.add_agent(name, SleepyAgent)
+    return env, dag_workflow(data_file)
+
+
+def step_outputs(env, workflow):
+    """(id, [(step, result)]) per yielded instruction; logs are left out as they carry timestamps."""
+    return [(instruction['id'], [(name, output['result']) for name, output in results.items()])
+            for instruction, results in env.iter_workflow(workflow)]
+
+
+def test_dag_results_match_sequential_execution(tmp_path):
+    random.seed(0)
+    sequential = step_outputs(*make_env(tmp_path))
+    dag = step_outputs(*make_env(tmp_path, step_scheduler='dag', concurrency=4))
+
+    assert [item_id for item_id, _ in sequential] == [item_id for item_id in range(12) if item_id != 3]
+    assert dag == sequential
+    # Each step saw the output of the step it depends on
+    _, results = dag[0]
+    assert dict(results)['loader_summarize'] == 'summarize:0:load:0:None'
+    assert dict(results)['combiner_combine'] == 'combine:0:inspect:0:None'
+
+
+def test_dag_admission_window_bounds_unyielded_instructions(tmp_path):
+    env, workflow = make_env(tmp_path)
+    workflow_aux = env._load_workflow_instructions(workflow)
+    scheduler = DagScheduler(env, workflow_aux, max_workers=2, window=3)
+
+    admitted = []
+    yielded = []
+    create_context = env.create_context
+
+    def counting_create_context(instruction):
+        admitted.append(instruction['id'])
+        # Admitted but not yet handed to the caller, the new instruction included
+        assert len(admitted) - len(yielded) <= scheduler.window
+        return create_context(instruction)
+
+    env.create_context = counting_create_context
+    for instruction, results in scheduler.iter_results(env.instructions):
+        yielded.append(instruction['id'])
+        assert (results is None) == (instruction['id'] == 3)
+
+    assert yielded == admitted == list(range(12))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Tests for sharded runs
+Checks that --shard i/n splits the instruction ids exactly across the shards and that
+merge_shard_results.py rejects duplicate ids and reports missing ones.
+"""
+import sys
+import os
+import json
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.agent_environment import load_instructions
+from agents.utils import parse_shard, shard_index
+from merge_shard_results import merge_shard_results
+
+IDS = list(range(500))
+
+
+def write_jsonl(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('shard_count', [1, 2, 3, 4, 7])
+def test_shards_partition_the_ids(shard_count):
+    shards = [[item_id for item_id in IDS if shard_index(item_id, shard_count) == index]
+              for index in range(shard_count)]
+    assert sorted(item_id for shard in shards for item_id in shard) == IDS
+    assert all(shards)
+
+
+def test_shard_index_is_stable():
+    # sha1 based, so it must not change between runs, machines or PYTHONHASHSEED values
+    assert [shard_index(item_id, 4) for item_id in range(8)] == [shard_index(str(item_id), 4) for item_id in range(8)]
+    assert [shard_index(item_id, 4) for item_id in range(8)] == [0, 3, 0, 3, 2, 0, 0, 2]
+
+
+def test_load_instructions_partitions_a_file(tmp_path):
+    data_file = write_jsonl(tmp_path / 'instructions.jsonl', [{'id': item_id} for item_id in IDS])
+    loaded = [[inst['id'] for inst in load_instructions(data_file, data_range=[10, 400], shard=parse_shard(f"{index}/3"))]
+              for index in range(3)]
+    assert sorted(item_id for shard in loaded for item_id in shard) == list(range(10, 401))
+    # Each shard keeps the file order
+    assert all(shard == sorted(shard) for shard in loaded)
+
+
+def test_parse_shard():
+    assert parse_shard('0/4') == (0, 4)
+    assert parse_shard('3/4') == (3, 4)
+    for shard in ['4/4', '-1/4', '0/0', '1', '1/2/3', 'a/b']:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+def shard_files(tmp_path, shard_count, ids=IDS):
+    return [write_jsonl(tmp_path / f"shard_{index}.jsonl",
+                        [{'id': item_id, 'shard': index} for item_id in ids if shard_index(item_id, shard_count) == index])
+            for index in range(shard_count)]
+
+
+def test_merge_restores_the_full_run(tmp_path):
+    output_file = str(tmp_path / 'merged' / 'results.jsonl')
+    assert merge_shard_results(shard_files(tmp_path, 3), output_file, expected_ids=set(IDS)) == len(IDS)
+    with open(output_file, 'r', encoding='utf-8') as f:
+        assert [json.loads(line)['id'] for line in f] == IDS
+
+
+def test_merge_rejects_duplicate_ids(tmp_path):
+    files = shard_files(tmp_path, 2)
+    write_jsonl(tmp_path / 'rerun.jsonl', [{'id': 7}])
+    with pytest.raises(ValueError, match='id 7'):
+        merge_shard_results(files + [str(tmp_path / 'rerun.jsonl')], str(tmp_path / 'results.jsonl'))
+    assert not os.path.exists(tmp_path / 'results.jsonl')
+
+
+def test_merge_reports_missing_ids(tmp_path):
+    files = shard_files(tmp_path, 3)
+    output_file = str(tmp_path / 'results.jsonl')
+    missing = {item_id for item_id in IDS if shard_index(item_id, 3) == 1}
+
+    with pytest.raises(ValueError, match=f"{len(missing)} expected ids are missing"):
+        merge_shard_results([files[0], files[2]], output_file, expected_ids=set(IDS))
+    assert not os.path.exists(output_file)
+
+    count = merge_shard_results([files[0], files[2]], output_file, expected_ids=set(IDS), allow_missing=True)
+    assert count == len(IDS) - len(missing)
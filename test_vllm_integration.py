@@ -5,6 +5,7 @@ This script tests the vLLM client functionality without running full evaluations
 """
 import sys
 import os
+import argparse
 
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -126,7 +127,19 @@ def test_config_files():
 
 def main():
     """Run all tests."""
+    parser = argparse.ArgumentParser(description='DSDBench-Open: vLLM integration test')
+    parser.add_argument('--mock', action='store_true',
+                      help='Test against a local mock server (mock_llm_server.py) instead of a real vLLM server')
+    args = parser.parse_args()
+
     print("=== vLLM Integration Test ===\n")
+
+    if args.mock:
+        # Must run before agents.config.vllm is imported by the tests below
+        from mock_llm_server import start_mock_server
+        server = start_mock_server(models=['codellama/CodeLlama-7b-Instruct-hf'])
+        os.environ['VLLM_BASE_URL'] = f"http://127.0.0.1:{server.server_port}/v1"
+        print(f"Using mock vLLM server at {os.environ['VLLM_BASE_URL']}\n")
     
     # Test imports
     if not test_vllm_imports():
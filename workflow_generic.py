@@ -1,13 +1,20 @@
 import io
 import sys
+import asyncio
 import os
 import argparse
 import importlib
-from agents.agent_environment import AgentEnvironment
+from agents.agent_environment import AgentEnvironment, JsonlResultSink, discard_results
+from agents.llm_batch import configure_batch, log_batch_stats
+from agents.llm_cache import configure_cache, log_cache_stats
+from agents.llm_cassette import configure_cassette, log_cassette_stats
+from agents.hedging import log_hedge_stats
+from agents.llm_usage import configure_ledger, log_prompt_cache_stats
+from agents.utils import parse_shard, resolve_result_file_path
 from config.dabench_quantitative_experiment_config import AGENT_CONFIG, WORKFLOW
 
 
-def mainworkflow(config, workflow, update_callback=None):
+def mainworkflow(config, workflow, update_callback=None, concurrency=None, use_async=False, sink=None):
     print('=========Initializing Agent Environment=========')
     agent_env = AgentEnvironment(config['workspace'], config)
 
@@ -20,7 +27,10 @@ def mainworkflow(config, workflow, update_callback=None):
             **agent_config.get('kwargs', {})
         )
 
-    results = agent_env.run_workflow(workflow)
+    if use_async:
+        results = asyncio.run(agent_env.run_workflow_async(workflow, concurrency=concurrency, sink=sink))
+    else:
+        results = agent_env.run_workflow(workflow, concurrency=concurrency, sink=sink)
 
     return results
 
@@ -142,7 +152,57 @@ if __name__ == "__main__":
                       help='Path to the configuration file (default: config/dabench_quantitative_experiment_config.py)')
     parser.add_argument('--result-file', type=str, default=None,
                       help='Path to save the evaluation results (default: auto-generated from config)')
+    parser.add_argument('--concurrency', type=int, default=None,
+                      help='Number of instructions processed in parallel (default: config value or 1)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                      help='Run instructions on an asyncio event loop instead of worker threads')
+    parser.add_argument('--execution-workers', type=int, default=None,
+                      help='Run generated code on a separate pool of this many workers, overlapping '
+                           'LLM generation (limited by --concurrency) with code execution')
+    parser.add_argument('--processes', type=int, default=None,
+                      help='Process instructions in this many worker processes, each with its own agents '
+                           '(--concurrency then applies per process)')
+    parser.add_argument('--process-batch-size', type=int, default=None,
+                      help='Instructions sent to a worker process at a time (default: 4)')
+    parser.add_argument('--longest-first', action='store_true',
+                      help='Dispatch instructions by decreasing estimated cost to shorten the tail of parallel runs')
+    parser.add_argument('--cost-history', type=str, nargs='+', default=None,
+                      help='Completion journals of earlier runs whose timings calibrate --longest-first')
+    parser.add_argument('--dag', action='store_true',
+                      help='Run independent workflow steps concurrently and pipeline steps across instructions')
+    parser.add_argument('--resume', action='store_true',
+                      help='Skip work recorded in the completion journal next to the result file')
+    parser.add_argument('--journal-file', type=str, default=None,
+                      help='Path of the completion journal (implies --resume)')
+    parser.add_argument('--shard', type=str, default=None,
+                      help='Only process shard i of n (e.g. 0/4), partitioned by a stable hash of the instruction id')
+    parser.add_argument('--llm-cache', type=str, default=None, choices=['off', 'readwrite', 'readonly', 'refresh'],
+                      help='On-disk LLM response cache mode (default: LLM_CACHE_MODE or off)')
+    parser.add_argument('--llm-cache-path', type=str, default=None,
+                      help='SQLite file of the LLM response cache (default: LLM_CACHE_PATH)')
+    parser.add_argument('--llm-mode', type=str, default=None, choices=['live', 'record', 'replay', 'batch'],
+                      help='Call the APIs (live), also record every exchange to a cassette (record), '
+                           'answer from the cassette without network access (replay), '
+                           'or collect the requests into Batch API files (batch)')
+    parser.add_argument('--cassette', type=str, default=None,
+                      help='Cassette file for --llm-mode record/replay (default: LLM_CASSETTE)')
+    parser.add_argument('--replay-latency', type=float, default=None,
+                      help='In replay mode, wait the recorded latency times this factor (default: 0, no wait)')
+    parser.add_argument('--batch-dir', type=str, default=None,
+                      help='Directory of the batch input/output files for --llm-mode batch (default: LLM_BATCH_DIR)')
+    parser.add_argument('--batch-wait', action='store_true',
+                      help='In batch mode, wait for the output files of each round and continue until done '
+                           'instead of exiting after writing the input files')
+    parser.add_argument('--batch-timeout', type=float, default=None,
+                      help='With --batch-wait, give up after waiting this many seconds for the output files '
+                           'of a round, 0 to wait forever (default: LLM_BATCH_TIMEOUT, 24 hours)')
+    parser.add_argument('--tiered-judge', action='store_true',
+                      help='Score clear-cut error messages locally (1.0 or 0.0) and only send ambiguous ones to the '
+                           'LLM judge; fewer judge calls, but scores differ from the judge\'s graded rubric')
+    parser.add_argument('--workflow-output', type=str, default=None,
+                      help='Also append each instruction\'s raw workflow results (without step logs) to this JSONL file')
     args = parser.parse_args()
+    shard = parse_shard(args.shard) if args.shard else None
     
     # Load the specified configuration
     print(f"Loading configuration from: {args.config}")
@@ -151,13 +211,98 @@ if __name__ == "__main__":
     # Generate result file path if not provided
     if args.result_file is None:
         args.result_file = generate_result_filename_from_config(args.config)
+        if shard:
+            root, ext = os.path.splitext(args.result_file)
+            args.result_file = f"{root}_shard{shard[0]}of{shard[1]}{ext}"
         print(f"Auto-generated result file: {args.result_file}")
     
+    if args.dag:
+        config['step_scheduler'] = 'dag'
+    if args.execution_workers:
+        config['execution_workers'] = args.execution_workers
+    if args.longest_first:
+        config['dispatch_order'] = 'cost'
+    if args.cost_history:
+        config['cost_history'] = args.cost_history
+    if args.processes:
+        if args.use_async:
+            parser.error('--processes cannot be combined with --async')
+        config['process_workers'] = args.processes
+    if args.process_batch_size:
+        config['process_batch_size'] = args.process_batch_size
+    if shard:
+        config['shard'] = shard
+        print(f"Processing shard {shard[0]} of {shard[1]}")
+
     # Update workflow with result file path
     for step in workflow:
         if 'args' in step:
             step['args']['result_file'] = args.result_file
+            if args.tiered_judge and step.get('method') in ('rubber_duck_eval', 'multi_rubber_duck_eval'):
+                step['args']['tiered_judge'] = True
+
+    # The steps write a relative result file under their eval_folder; the journal, ledger and
+    # usage rollup go next to where it actually lands
+    eval_folder = next((step['args']['eval_folder'] for step in workflow
+                        if step.get('args', {}).get('eval_folder')), None)
+    result_root = os.path.splitext(resolve_result_file_path(args.result_file, eval_folder))[0]
+
+    # Completed (model_type, id, error_version) keys are journaled so interrupted runs can resume;
+    # batch rounds rely on it to skip the instructions finished in earlier rounds
+    if args.resume or args.journal_file or args.llm_mode == 'batch':
+        config['journal_file'] = args.journal_file or result_root + '.journal.jsonl'
+        print(f"Using completion journal: {config['journal_file']}")
+
+    # Every LLM call is recorded in a usage ledger next to the result file
+    ledger = configure_ledger(result_root + '.ledger.jsonl')
     
-    # Run the workflow
-    results = mainworkflow(config, workflow)
-    # print(results)
+    if args.llm_cache or args.llm_cache_path:
+        configure_cache(mode=args.llm_cache, path=args.llm_cache_path)
+    if args.llm_mode or args.cassette or args.replay_latency is not None:
+        cassette = configure_cassette(mode=args.llm_mode, path=args.cassette, latency_scale=args.replay_latency)
+        if cassette is not None:
+            print(f"LLM mode {cassette.mode} with cassette: {cassette.path}")
+
+    # Results are streamed to the sink as each instruction finishes instead of being kept in memory
+    sink = JsonlResultSink(args.workflow_output) if args.workflow_output else discard_results
+
+    batch = configure_batch(mode=args.llm_mode, directory=args.batch_dir)
+    if batch is not None:
+        print(f"LLM mode batch with batch directory: {batch.directory}")
+
+    # Run the workflow; in batch mode, once per round of batch responses
+    missing_outputs = []
+    while True:
+        processed = mainworkflow(config, workflow, concurrency=args.concurrency, use_async=args.use_async, sink=sink)
+        print(f"Processed {processed} instructions")
+        if batch is None:
+            break
+
+        batch_files = batch.close_round()
+        if not batch_files:
+            print("No batch requests left, the workflow is complete")
+            break
+        for path, count in batch_files:
+            print(f"Batch input file: {path} ({count} requests)")
+        if not args.batch_wait:
+            print("Submit the input files, save each result as the matching *_output.jsonl and rerun to continue")
+            break
+        print("Waiting for the batch output files...")
+        wait_args = {} if args.batch_timeout is None else {'timeout': args.batch_timeout}
+        missing_outputs = batch.wait_for_outputs([path for path, _ in batch_files], **wait_args)
+        if missing_outputs:
+            break
+
+    log_cache_stats()
+    log_cassette_stats()
+    log_batch_stats()
+    log_hedge_stats()
+    log_prompt_cache_stats()
+    if ledger is not None:
+        usage_file = result_root + '.usage.json'
+        summary = ledger.write_rollup(usage_file)
+        print(f"LLM usage of this run: {summary['run']['total']}")
+        print(f"Usage rollup written to: {usage_file}")
+    if missing_outputs:
+        sys.exit("Timed out waiting for the batch output files:\n" + "\n".join(missing_outputs) +
+                 "\nSave them next to their input files and rerun the same command to continue")